@@ -1,21 +1,19 @@
 # main.py (MODIFIED)
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 import asyncio
+import importlib
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 from dotenv import load_dotenv
 import os
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: records are queued and formatted/written by a background thread
+from utils.structured_logging import CorrelationIdMiddleware, configure_logging, stop_logging
+configure_logging()
 
 # Import routers
 from routes.periodic_check_routes import periodic_router
@@ -29,12 +27,26 @@ from routes.emergency import router as emergency_router
 
 # FIX: Import the new device token router from its new location
 from routes.device_token_routes import device_token_router # <--- NEW IMPORT PATH!
+from routes.system_routes import system_router
+from routes.sms_callback_routes import sms_callback_router, warn_if_callbacks_unauthenticated
 
 # Import functions from controllers (only logic functions, not routers now)
-from controllers.periodic_check_controller import periodic_check_task, initiate_hourly_security_check
 from app.config import Config
+from database import warm_up_mongo_pool, close_mongo_client, setup_indexes, user_routes_collection
+from utils.journey_registry import journey_registry
+from utils.admission import AdmissionMiddleware
+from utils.cpu_executor import cpu_executor
+from utils.loop_watchdog import LOOP_WATCHDOG_ENABLED, loop_watchdog
+from utils.metrics import MetricsMiddleware, register_process_gauges, run_loop_lag_probe
+from utils.profiler import ProfilerMiddleware
+from utils.notifier import init_firebase, warm_up_sms_providers
+from utils.tracing import TracingMiddleware
+from utils.startup import warm_up
+from utils.periodic_check_scheduler import start_scheduler, stop_scheduler
+from utils.sms_delivery import delivery_reports
 
 app = FastAPI(title="ShieldX Safety API", version="1.0")
+register_process_gauges()
 
 # Configure CORS
 app.add_middleware(
@@ -44,6 +56,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(CorrelationIdMiddleware)
 
 # Register Routes
 
@@ -51,6 +68,7 @@ app.include_router(location_mon_router, prefix="/api")
 app.include_router(share_router, prefix="/api")
 app.include_router(periodic_router, prefix="/api")
 app.include_router(sos_router, prefix="/api")
+app.include_router(sms_callback_router, prefix="/api")
 
 from fastapi import BackgroundTasks
 from controllers.location import LocationRequest, share_location
@@ -76,6 +94,7 @@ app.include_router(emergency_router, prefix="/api/emergency", tags=["emergency"]
 
 # FIX: Include the new device_token_router with the /api prefix
 app.include_router(device_token_router, prefix="/api") # <--- UPDATED ROUTER TO INCLUDE!
+app.include_router(system_router, prefix="/api")
 
 @app.post("/share_route")
 async def share_route_alias(request: Request):
@@ -83,7 +102,6 @@ async def share_route_alias(request: Request):
     Alias route for /share_route to call the existing /api/share_route endpoint handler.
     """
     body = await request.json()
-    print("🔍 Incoming body:", body)
     route_request = RouteShareRequest(**body)
     return await start_route_tracking(route_request, background_tasks=None)
 
@@ -91,31 +109,64 @@ async def share_route_alias(request: Request):
 async def root():
     return {"message": "Welcome to ShieldX Safety API"}
 
-# Initialize APScheduler
-scheduler = AsyncIOScheduler()
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the startup warm-up has finished and its required steps succeeded, 503 before."""
+    return JSONResponse(warm_up.report(), status_code=200 if warm_up.ready else 503, headers={"Cache-Control": "no-store"})
+
+# Leader-election task for the Mongo-backed scheduler (see utils.periodic_check_scheduler)
+scheduler_campaign = None
+startup_task = None
+
+# Independent warm-up steps, run concurrently; heavy SDKs are imported here rather than on the first request.
+warm_up.step("mongo_pool", warm_up_mongo_pool, required=True)
+# Required: unique indexes enforce one pending security check and one open SOS incident per user.
+warm_up.step("indexes", setup_indexes, required=True)
+warm_up.step("cpu_executor", cpu_executor.start)
+warm_up.step("firebase", lambda: asyncio.to_thread(init_firebase))
+warm_up.step("sms_providers", lambda: asyncio.to_thread(warm_up_sms_providers))
+warm_up.step("geodesic", lambda: asyncio.to_thread(importlib.import_module, "geopy.distance"))
 
 @app.on_event("startup")
 async def startup_event():
     logging.info("Application startup event triggered.")
-    
-    scheduler.add_job(
-        initiate_hourly_security_check,
-        IntervalTrigger(hours=1),
-        id='hourly_security_check_job',
-        replace_existing=True,
-        max_instances=1
-    )
-    scheduler.start()
-    logging.info("APScheduler started for hourly security checks.")
-
-    asyncio.create_task(periodic_check_task())
-    logging.info("Background periodic check task started for 1-minute timeout monitoring.")
+    warn_if_callbacks_unauthenticated()
+    # Warm-up runs in the background so the server answers /ready (503) meanwhile.
+    global startup_task
+    startup_task = asyncio.create_task(start_background_work())
+    asyncio.create_task(run_loop_lag_probe())
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+
+async def start_background_work():
+    await warm_up.run()
+
+    # Every worker checkpoints the journeys it received fixes for; the monitor runs in the scheduler leader.
+    asyncio.create_task(journey_registry.run_checkpoint_loop(user_routes_collection))
+    logging.info("Journey checkpointing started.")
+
+    asyncio.create_task(delivery_reports.run_flush_loop())
+
+    # Jobs, the security-check timeout loop and the route monitor run only in the worker holding the scheduler lease.
+    global scheduler_campaign
+    try:
+        scheduler_campaign = await start_scheduler()
+        logging.info("Scheduler started; campaigning for the scheduler lease.")
+    except Exception as e:
+        logging.error(f"Scheduler start failed: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logging.info("Application shutdown event triggered.")
-    scheduler.shutdown()
-    logging.info("APScheduler shut down.")
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    await stop_scheduler(scheduler_campaign)
+    logging.info("Scheduler shut down and lease released.")
+    await journey_registry.checkpoint(user_routes_collection)
+    cpu_executor.shutdown()
+    loop_watchdog.stop()
+    close_mongo_client()
+    stop_logging()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,75 @@
+"""
+Event-loop latency while security codes are being verified.
+
+    python -m benchmarks.bcrypt_event_loop [verifications] [rounds]
+
+Runs N concurrent bcrypt verifications (default 32, cost 12) twice: inline
+on the event loop, as check_security used to, and through the CPU process
+pool. A probe task sleeps 10 ms in a loop meanwhile; its oversleep is the
+latency any other request (an SOS, a location fix) would have seen.
+"""
+import asyncio
+import json
+import sys
+import time
+
+import bcrypt
+
+from benchmarks.stats import summarize
+from utils.cpu_executor import CpuExecutor, CpuExecutorOverloaded, verify_bcrypt
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe_loop_lag(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def measure(verify, count: int, hashed: str) -> dict:
+    lag, stop = [], asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(lag, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(verify("wrong-code", hashed) for _ in range(count)),
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    return {
+        "verified": sum(1 for r in results if r is False),
+        "rejected": sum(1 for r in results if isinstance(r, CpuExecutorOverloaded)),
+        "elapsed_s": round(elapsed, 3),
+        "loop_lag_ms": summarize(lag, scale=1000, digits=2),
+    }
+
+
+async def main(count: int = 32, rounds: int = 12):
+    hashed = bcrypt.hashpw(b"123456", bcrypt.gensalt(rounds)).decode()
+
+    async def inline(code, hashed_code):
+        await asyncio.sleep(0)  # the old request path: awaits, then blocks the loop
+        return verify_bcrypt(code, hashed_code)
+
+    executor = CpuExecutor(queue_limit=count)
+    await executor.start()
+    try:
+        report = {
+            "verifications": count,
+            "bcrypt_rounds": rounds,
+            "pool_workers": executor.workers,
+            "inline": await measure(inline, count, hashed),
+            "process_pool": await measure(lambda c, h: executor.run(verify_bcrypt, c, h), count, hashed),
+        }
+    finally:
+        executor.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    asyncio.run(main(*args))
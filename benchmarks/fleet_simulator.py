@@ -0,0 +1,322 @@
+"""
+Synthetic fleet simulator for the journey pipeline.
+
+    python -m benchmarks.fleet_simulator --devices 1000
+    python -m benchmarks.fleet_simulator --devices 10000 --mongo mongodb://localhost:27017
+
+Spawns N virtual devices that walk generated routes and drives the real
+endpoints in-process (POST /api/share_route, then POST /api/update_location per
+fix) while calling the route monitor's run_monitor_pass on a simulated clock.
+Notifiers and SOS are stubbed, so nothing leaves the process. Devices can
+stall, drop out for good, lose individual fixes and report GPS jitter.
+
+The report covers ingest throughput and latency, monitor tick duration,
+inactivity/arrival detection latency in simulated seconds, and SOS alerts
+raised for devices that had nothing wrong (false positives).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from typing import Dict, List, Optional
+from unittest import mock
+
+import httpx
+
+from benchmarks.memory_mongo import InMemoryDatabase
+from benchmarks.stats import summarize
+
+METERS_PER_DEGREE_LAT = 111_320.0
+
+
+class SimClock:
+    """Stands in for the `time` module inside utils.route_tracker."""
+
+    def __init__(self, start: float):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class VirtualDevice:
+    __slots__ = (
+        "user_id", "journey_id", "start", "end", "length_m", "speed_mps", "travelled_m",
+        "profile", "incident_at", "stall_seconds", "arrived_at", "ended_at",
+    )
+
+    def __init__(self, index: int, rng: random.Random, profile: str, incident_at: Optional[float],
+                 stall_seconds: float):
+        lat = 18.45 + rng.random() * 0.15
+        lng = 73.75 + rng.random() * 0.15
+        self.length_m = rng.uniform(800, 3000)
+        bearing = rng.uniform(0, 2 * math.pi)
+        self.start = (lat, lng)
+        self.end = _offset(lat, lng, self.length_m * math.cos(bearing), self.length_m * math.sin(bearing))
+        self.user_id = f"sim{index}@shieldx.test"
+        self.journey_id = None
+        self.speed_mps = rng.uniform(1.1, 1.7)
+        self.travelled_m = 0.0
+        self.profile = profile
+        self.incident_at = incident_at
+        self.stall_seconds = stall_seconds
+        self.arrived_at = None
+        self.ended_at = None
+
+    def stalled(self, elapsed: float) -> bool:
+        return self.profile == "stall" and self.incident_at <= elapsed < self.incident_at + self.stall_seconds
+
+    def silent(self, elapsed: float) -> bool:
+        return self.profile == "dropout" and elapsed >= self.incident_at
+
+    def advance(self, elapsed: float, dt: float, arrival_radius_m: float):
+        if self.stalled(elapsed):
+            return
+        self.travelled_m = min(self.length_m, self.travelled_m + self.speed_mps * dt)
+        if self.arrived_at is None and self.length_m - self.travelled_m <= arrival_radius_m:
+            self.arrived_at = elapsed
+
+    def position(self):
+        fraction = self.travelled_m / self.length_m
+        return (self.start[0] + (self.end[0] - self.start[0]) * fraction,
+                self.start[1] + (self.end[1] - self.start[1]) * fraction)
+
+
+def _offset(lat: float, lng: float, north_m: float, east_m: float):
+    return (lat + north_m / METERS_PER_DEGREE_LAT,
+            lng + east_m / (METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))))
+
+
+def build_fleet(args, rng: random.Random) -> List[VirtualDevice]:
+    devices = []
+    for i in range(args.devices):
+        roll = rng.random()
+        if roll < args.dropout_fraction:
+            profile = "dropout"
+        elif roll < args.dropout_fraction + args.stall_fraction:
+            profile = "stall"
+        else:
+            profile = "normal"
+        incident_at = rng.uniform(60, args.duration * 0.6) if profile != "normal" else None
+        devices.append(VirtualDevice(i, rng, profile, incident_at, args.stall_seconds))
+    return devices
+
+
+async def _timed_post(client: httpx.AsyncClient, url: str, payload: dict, latencies: List[float]) -> bool:
+    started = time.perf_counter()
+    response = await client.post(url, json=payload)
+    latencies.append(time.perf_counter() - started)
+    return response.status_code == 200
+
+
+async def _run_chunked(coroutines, concurrency: int) -> List[bool]:
+    results = []
+    for i in range(0, len(coroutines), concurrency):
+        results.extend(await asyncio.gather(*coroutines[i:i + concurrency]))
+    return results
+
+
+async def simulate(args) -> Dict:
+    from app.main import app
+    import utils.route_tracker as route_tracker
+    from utils.journey_registry import journey_registry
+
+    rng = random.Random(args.seed)
+    devices = build_fleet(args, rng)
+    by_user = {device.user_id: device for device in devices}
+
+    if args.mongo == "memory":
+        routes_collection = InMemoryDatabase()["user_routes"]
+    else:
+        from database import get_mongo_client
+        routes_collection = get_mongo_client(args.mongo)[args.db_name]["user_routes"]
+        await routes_collection.delete_many({"user_id": {"$in": list(by_user)}})
+
+    clock = SimClock(time.time())
+    started_at = clock.now
+    sos_events = []
+
+    async def stub_trigger_sos(user_id, lat, lon, contacts, reason=None, status=None, **kwargs):
+        sos_events.append((user_id, clock.now - started_at, reason))
+
+    async def stub_send_notification(contact, message, network_status=None):
+        return "✅ simulated"
+
+    async def stub_is_online():
+        return True
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    journey_registry.clear()
+    patches = [
+        mock.patch.object(route_tracker, "user_routes_collection", routes_collection),
+        mock.patch.object(route_tracker, "time", clock),
+        mock.patch.object(route_tracker, "trigger_sos", stub_trigger_sos),
+        mock.patch.object(route_tracker, "send_notification", stub_send_notification),
+        mock.patch.object(route_tracker, "is_online", stub_is_online),
+    ]
+    if args.quiet:
+        logging.getLogger("utils.route_tracker").setLevel(logging.ERROR)
+    for patch in patches:
+        patch.start()
+
+    share_latencies, fix_latencies, tick_durations, evaluated = [], [], [], []
+    fixes_sent = fixes_lost = ingest_errors = 0
+    ingest_wall = 0.0
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://fleet-sim") as client:
+            share_started = time.perf_counter()
+            await _run_chunked([
+                _timed_post(client, "/api/share_route", {
+                    "user_id": device.user_id,
+                    "start_lat": device.start[0], "start_lng": device.start[1],
+                    "end_lat": device.end[0], "end_lng": device.end[1],
+                    "emergency_contacts": [f"+9198{i:08d}"],
+                }, share_latencies)
+                for i, device in enumerate(devices)
+            ], args.concurrency)
+            share_wall = time.perf_counter() - share_started
+            for device in devices:
+                record = journey_registry.for_user(device.user_id)
+                device.journey_id = record.journey_id if record else None
+
+            next_monitor = route_tracker.MONITOR_INTERVAL_SECONDS
+            steps = int(args.duration / args.fix_interval)
+            for step in range(1, steps + 1):
+                clock.advance(args.fix_interval)
+                elapsed = clock.now - started_at
+
+                requests = []
+                for device in devices:
+                    if device.ended_at is not None:
+                        continue
+                    device.advance(elapsed, args.fix_interval, route_tracker.DESTINATION_REACHED_THRESHOLD_METERS)
+                    if device.silent(elapsed):
+                        continue
+                    if rng.random() < args.fix_loss:
+                        fixes_lost += 1
+                        continue
+                    lat, lng = device.position()
+                    jitter = rng.gauss(0, args.jitter_m)
+                    angle = rng.uniform(0, 2 * math.pi)
+                    lat, lng = _offset(lat, lng, jitter * math.cos(angle), jitter * math.sin(angle))
+                    requests.append(_timed_post(client, "/api/update_location", {
+                        "user_id": device.user_id, "lat": lat, "lng": lng, "journey_id": device.journey_id,
+                    }, fix_latencies))
+
+                ingest_started = time.perf_counter()
+                results = await _run_chunked(requests, args.concurrency)
+                ingest_wall += time.perf_counter() - ingest_started
+                fixes_sent += len(results)
+                ingest_errors += results.count(False)
+
+                if elapsed >= next_monitor:
+                    next_monitor += route_tracker.MONITOR_INTERVAL_SECONDS
+                    tick_started = time.perf_counter()
+                    evaluated.append(await route_tracker.run_monitor_pass(clock.now))
+                    tick_durations.append(time.perf_counter() - tick_started)
+                    await asyncio.sleep(0)
+                    for device in devices:
+                        if device.ended_at is None and device.journey_id and journey_registry.get(device.journey_id) is None:
+                            device.ended_at = elapsed
+                    await journey_registry.checkpoint(routes_collection)
+
+            await asyncio.sleep(0)
+    finally:
+        for patch in reversed(patches):
+            patch.stop()
+
+    # --- Ground truth vs. what the monitor did ---
+    inactivity_threshold = route_tracker.INACTIVITY_TIME_THRESHOLD_MINUTES * 60
+    first_sos: Dict[str, float] = {}
+    for user_id, at, _reason in sos_events:
+        first_sos.setdefault(user_id, at)
+
+    expected, detection_latency, false_positives = set(), [], 0
+    for device in devices:
+        incident = device.incident_at
+        long_enough = device.profile == "dropout" or device.stall_seconds > inactivity_threshold
+        if incident is not None and long_enough and (device.arrived_at is None or device.arrived_at > incident):
+            expected.add(device.user_id)
+        sos_at = first_sos.get(device.user_id)
+        if sos_at is None:
+            continue
+        if device.user_id in expected and sos_at >= incident:
+            detection_latency.append(sos_at - incident)
+        else:
+            false_positives += 1
+
+    arrival_latency = [
+        device.ended_at - device.arrived_at
+        for device in devices
+        if device.arrived_at is not None and device.ended_at is not None
+        and device.user_id not in first_sos and device.ended_at >= device.arrived_at
+    ]
+
+    return {
+        "devices": args.devices,
+        "mongo": args.mongo,
+        "simulated_seconds": args.duration,
+        "profiles": {p: sum(1 for d in devices if d.profile == p) for p in ("normal", "stall", "dropout")},
+        "share_route": {
+            "journeys_created": sum(1 for d in devices if d.journey_id),
+            "requests_per_s": round(len(devices) / share_wall, 1) if share_wall else None,
+            "latency_ms": summarize(share_latencies, 1000),
+        },
+        "ingest": {
+            "fixes_sent": fixes_sent,
+            "fixes_lost": fixes_lost,
+            "errors": ingest_errors,
+            "fixes_per_s": round(fixes_sent / ingest_wall, 1) if ingest_wall else None,
+            "latency_ms": summarize(fix_latencies, 1000),
+        },
+        "monitor": {
+            "ticks": len(tick_durations),
+            "tick_ms": summarize(tick_durations, 1000),
+            "journeys_evaluated_max": max(evaluated, default=0),
+        },
+        "inactivity": {
+            "expected": len(expected),
+            "detected": len(detection_latency),
+            "missed": len(expected) - len(detection_latency),
+            "detection_latency_s": summarize(detection_latency, digits=1),
+        },
+        "arrival": {
+            "arrived": sum(1 for d in devices if d.arrived_at is not None),
+            "completed": len(arrival_latency),
+            "detection_latency_s": summarize(arrival_latency, digits=1),
+        },
+        "sos": {
+            "total": len(sos_events),
+            "false_positives": false_positives,
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=900, help="simulated seconds")
+    parser.add_argument("--fix-interval", type=float, default=10, help="seconds between fixes per device")
+    parser.add_argument("--stall-fraction", type=float, default=0.05)
+    parser.add_argument("--stall-seconds", type=float, default=120)
+    parser.add_argument("--dropout-fraction", type=float, default=0.02)
+    parser.add_argument("--fix-loss", type=float, default=0.01, help="probability a single fix is lost")
+    parser.add_argument("--jitter-m", type=float, default=5.0, help="GPS jitter standard deviation in metres")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--mongo", default="memory", help='"memory" or a mongodb:// URL')
+    parser.add_argument("--db-name", default="shieldx_fleet_sim")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quiet", action="store_true", help="silence per-event logging from the monitor")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(simulate(parse_args())), indent=2))
@@ -0,0 +1,55 @@
+"""
+Measures the memory cost of the in-process journey registry.
+
+    python -m benchmarks.journey_registry_memory [journeys]
+
+Builds a registry of N synthetic running journeys (default 100k) and reports
+the traced allocation per journey, including the record, its strings and
+floats and both registry index entries.
+"""
+import sys
+import time
+import tracemalloc
+import uuid
+
+from utils.journey_registry import JourneyRecord, JourneyRegistry
+
+
+def build_registry(count: int) -> JourneyRegistry:
+    registry = JourneyRegistry()
+    now = time.time()
+    for i in range(count):
+        lat = 18.5 + (i % 1000) * 1e-4
+        lng = 73.8 + (i // 1000) * 1e-4
+        registry.add(JourneyRecord(
+            journey_id=str(uuid.uuid4()),
+            user_id=f"user{i}@example.com",
+            cur_lat=lat,
+            cur_lng=lng,
+            prev_lat=lat - 1e-5,
+            prev_lng=lng - 1e-5,
+            end_lat=lat + 0.05,
+            end_lng=lng + 0.05,
+            last_updated_at=now - i % 60,
+            contact=f"+9198{i:08d}",
+        ))
+    return registry
+
+
+def main(count: int = 100_000):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    registry = build_registry(count)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_journey = (after - before) / count
+    print(f"journeys:            {len(registry)}")
+    print(f"total traced:        {(after - before) / 1024 / 1024:.1f} MiB")
+    print(f"peak traced:         {peak / 1024 / 1024:.1f} MiB")
+    print(f"bytes per journey:   {per_journey:.0f}")
+    return per_journey
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
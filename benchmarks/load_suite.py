@@ -0,0 +1,350 @@
+"""
+Endpoint load suite: the real FastAPI app in-process, providers stubbed over HTTP.
+
+    python -m benchmarks.load_suite --duration 30 --out load-$(git rev-parse --short HEAD).json
+    python -m benchmarks.load_suite --rps sos=40 --only sos --latency twilio=400 --failure-rate twilio=0.1
+    python -m benchmarks.load_suite --mongo mongodb://localhost:27017 --baseline load-abc1234.json
+
+Starts the local provider stand-ins (benchmarks.provider_stubs) and points
+the service's Expo, FCM, Twilio, Fast2SMS and connectivity calls at them,
+then drives POST /api/sos, /api/share-location, /api/update_location,
+/api/security-check and /share_route one after another, each at its target
+rate for --duration seconds. Load is open-loop: requests are started on a
+fixed schedule whether or not earlier ones finished, and latency is measured
+from the scheduled start, so a stalled server shows up as latency instead of
+as fewer requests. Mongo is the in-memory stand-in by default; with a URL,
+every collection is redirected to --db-name on that server (dropped first).
+
+Per scenario the report gives throughput, error rate, status codes,
+p50/p95/p99 latency and the provider calls it caused. --out saves the report
+as a JSON baseline; --baseline compares against one and exits 1 when a
+scenario's p95/p99 latency grew by more than --tolerance or its error rate
+rose by more than one percentage point.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+import httpx
+
+from benchmarks.memory_mongo import InMemoryDatabase
+from benchmarks.provider_stubs import (ProviderStubServer, add_provider_arguments, parse_behaviours,
+                                       parse_provider_map, wire_providers)
+from benchmarks.stats import summarize
+from benchmarks.synthetic_data import SyntheticDataset, load_into
+
+SCENARIOS = ("sos", "share_location", "update_location", "security_check", "share_route")
+DEFAULT_RPS = {"sos": 10, "share_location": 50, "update_location": 200, "security_check": 10, "share_route": 20}
+SECURITY_CODE = "123456"
+_APP_PACKAGES = ("app.", "controllers.", "routes.", "utils.", "services.")
+
+
+def patch_collections(db) -> ExitStack:
+    """
+    Redirects every Motor collection the app holds (module globals and the
+    `.collection` of module-level helpers) to the collection of the same name
+    in `db`, and Motor database globals to `db` itself.
+    """
+    from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+
+    stack = ExitStack()
+    for name, module in list(sys.modules.items()):
+        if module is None or not (name == "database" or name.startswith(_APP_PACKAGES)):
+            continue
+        for attribute, value in list(vars(module).items()):
+            if isinstance(value, AsyncIOMotorCollection):
+                stack.enter_context(mock.patch.object(module, attribute, db[value.name]))
+            elif isinstance(value, AsyncIOMotorDatabase):
+                stack.enter_context(mock.patch.object(module, attribute, db))
+            elif isinstance(getattr(value, "collection", None), AsyncIOMotorCollection) and not isinstance(value, type):
+                stack.enter_context(mock.patch.object(value, "collection", db[value.collection.name]))
+    return stack
+
+
+class Scenario:
+    """One endpoint: untimed setup for `count` requests, then the request for index i."""
+
+    def __init__(self, name: str, path: str, build: Callable[[int], dict],
+                 prepare: Optional[Callable[[int], object]] = None):
+        self.name = name
+        self.path = path
+        self.build = build
+        self.prepare = prepare
+
+
+def build_scenarios(args, rng: random.Random) -> Dict[str, Scenario]:
+    from database import user_collection
+    from utils.route_tracker import initialize_user_tracking
+    from utils.security_check_sessions import security_check_sessions
+
+    def user(i: int) -> str:
+        return f"load{i % args.users}@example.com"
+
+    def phone(i: int) -> str:
+        return f"+9198{i % args.users:08d}"
+
+    def point():
+        return 18.45 + rng.random() * 0.15, 73.75 + rng.random() * 0.15
+
+    def sos(i):
+        lat, lon = point()
+        return {"user_id": user(i), "lat": lat, "lon": lon, "contacts": [phone(i)]}
+
+    def share_location(i):
+        lat, lng = point()
+        return {"user_id": user(i), "lat": lat, "lng": lng, "emergency_contacts": [phone(i)],
+                "is_emergency": rng.random() < args.emergency_fraction}
+
+    journeys: Dict[str, str] = {}
+
+    async def prepare_update_location(count: int):
+        for i in range(min(count, args.users)):
+            (lat, lng), (end_lat, end_lng) = point(), point()
+            journeys[user(i)] = await initialize_user_tracking(user(i), lat, lng, end_lat, end_lng, [phone(i)])
+
+    def update_location(i):
+        lat, lng = point()
+        return {"user_id": user(i), "journey_id": journeys[user(i)], "lat": lat, "lng": lng}
+
+    async def prepare_security_check(count: int):
+        import bcrypt
+        from utils.cpu_executor import cpu_executor
+
+        hashed = bcrypt.hashpw(SECURITY_CODE.encode(), bcrypt.gensalt(args.bcrypt_rounds)).decode()
+        await user_collection.insert_many([
+            {"email": f"check{i}@example.com", "hashed_security_code": hashed, "emergencyContacts": [phone(i)],
+             "lastLocation": {"latitude": 18.5, "longitude": 73.8}} for i in range(count)])
+        for i in range(count):
+            await security_check_sessions.open(f"check{i}@example.com")
+        await cpu_executor.start()
+
+    def security_check(i):
+        code = "000000" if rng.random() < args.wrong_code_fraction else SECURITY_CODE
+        return {"code": code, "user_email": f"check{i}@example.com"}
+
+    def share_route(i):
+        (start_lat, start_lng), (end_lat, end_lng) = point(), point()
+        return {"user_id": user(i), "start_lat": start_lat, "start_lng": start_lng, "end_lat": end_lat,
+                "end_lng": end_lng, "emergency_contacts": [phone(i)]}
+
+    return {
+        "sos": Scenario("sos", "/api/sos", sos),
+        "share_location": Scenario("share_location", "/api/share-location", share_location),
+        "update_location": Scenario("update_location", "/api/update_location", update_location,
+                                    prepare_update_location),
+        "security_check": Scenario("security_check", "/api/security-check", security_check, prepare_security_check),
+        "share_route": Scenario("share_route", "/share_route", share_route),
+    }
+
+
+def _is_error(response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    # some handlers report failures in a 200 body
+    return isinstance(body, dict) and body.get("status") == "error" and "Wrong Code" not in body.get("message", "")
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario, rps: float, duration: float,
+                stubs: ProviderStubServer) -> Dict:
+    count = max(1, int(rps * duration))
+    if scenario.prepare is not None:
+        await scenario.prepare(count)
+    payloads = [scenario.build(i) for i in range(count)]
+
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    finished_at = 0.0
+
+    async def one(payload: dict, scheduled: float):
+        nonlocal errors, finished_at
+        try:
+            response = await client.post(scenario.path, json=payload)
+            status, failed = str(response.status_code), _is_error(response)
+        except Exception as e:
+            status, failed = type(e).__name__, True
+        finished_at = loop.time()
+        latencies.append(finished_at - scheduled)
+        statuses[status] = statuses.get(status, 0) + 1
+        errors += failed
+
+    providers_before = stubs.counts()
+    interval = 1 / rps
+    started = loop.time() + 0.01
+    behind = 0.0
+    tasks = []
+    for i, payload in enumerate(payloads):
+        scheduled = started + i * interval
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            behind = max(behind, -delay)
+        tasks.append(asyncio.create_task(one(payload, scheduled)))
+    await asyncio.gather(*tasks)
+    providers_after = stubs.counts()
+
+    elapsed = finished_at - started
+    return {
+        "path": scenario.path,
+        "target_rps": rps,
+        "requests": count,
+        "throughput_rps": round((count - errors) / elapsed, 1) if elapsed > 0 else None,
+        "error_rate": round(errors / count, 4),
+        "statuses": statuses,
+        "latency_ms": summarize(latencies, 1000),
+        "generator_max_lag_ms": round(behind * 1000, 1),
+        "providers": {name: {key: providers_after[name][key] - providers_before[name][key] for key in counts}
+                      for name, counts in providers_after.items()
+                      if providers_after[name]["requests"] != providers_before[name]["requests"]},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_suite(args) -> Dict:
+    from app.main import app
+    from utils.cpu_executor import cpu_executor
+    from utils.journey_registry import journey_registry
+
+    root_level = logging.getLogger().level
+    logging.getLogger().setLevel(args.log_level)
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    rps = {**DEFAULT_RPS, **parse_scenario_map(args.rps)}
+    scenarios = args.only or list(SCENARIOS)
+
+    if args.mongo == "memory":
+        db = InMemoryDatabase(indexed_fields=("journey_id", "user_id", "email", "user_email"))
+    else:
+        from database import get_mongo_client
+        client = get_mongo_client(args.mongo)
+        await client.drop_database(args.db_name)
+        db = client[args.db_name]
+
+    stubs = ProviderStubServer(parse_behaviours(parse_provider_map(args.latency), parse_provider_map(args.failure_rate)))
+    base_url = stubs.start()
+    results = {}
+    journey_registry.clear()
+    try:
+        with patch_collections(db):
+            if args.mongo != "memory":
+                from database import setup_indexes
+                await setup_indexes()
+            if args.background_users:
+                # realistic collection sizes under the scenarios' queries
+                background = SyntheticDataset(users=args.background_users, days=args.background_days, seed=args.seed)
+                await load_into(db, background)
+            async with wire_providers(base_url), httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=args.timeout) as client:
+                by_name = build_scenarios(args, rng)
+                for name in scenarios:
+                    results[name] = await drive(client, by_name[name], rps[name], args.duration, stubs)
+    finally:
+        stubs.stop()
+        cpu_executor.shutdown()
+        journey_registry.clear()
+        logging.getLogger().setLevel(root_level)
+
+    return {
+        "meta": {
+            "commit": _git_commit(), "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "mongo": "memory" if args.mongo == "memory" else "server",
+            "duration_s": args.duration, "seed": args.seed, "background_users": args.background_users,
+            "provider_latency_ms": {name: b.latency_ms for name, b in stubs.behaviours.items()},
+            "provider_failure_rate": {name: b.failure_rate for name, b in stubs.behaviours.items()},
+        },
+        "scenarios": results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.2) -> List[str]:
+    """Regressions of `current` against `baseline`, one line each; empty when there are none."""
+    regressions = []
+    for name, now in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        for quantile in ("p95", "p99"):
+            old, new = before["latency_ms"].get(quantile), now["latency_ms"].get(quantile)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {quantile} {old} ms -> {new} ms (+{(new / old - 1) * 100:.0f}%)")
+        if now["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {before['error_rate']:.2%} -> {now['error_rate']:.2%}")
+    return regressions
+
+
+def parse_scenario_map(values) -> Dict[str, float]:
+    """["sos=40"] -> {"sos": 40.0}"""
+    parsed = {}
+    for value in values or []:
+        name, _, number = value.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; expected one of {', '.join(SCENARIOS)}")
+        parsed[name] = float(number)
+    return parsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per scenario")
+    parser.add_argument("--rps", action="append", metavar="SCENARIO=RPS",
+                        help=f"target rate per scenario (defaults {DEFAULT_RPS}); repeatable")
+    parser.add_argument("--only", action="append", choices=SCENARIOS, help="run only these scenarios; repeatable")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--background-users", type=int, default=0,
+                        help="preload benchmarks.synthetic_data for this many other users first")
+    parser.add_argument("--background-days", type=int, default=7)
+    parser.add_argument("--emergency-fraction", type=float, default=0.1, help="share-location requests marked emergency")
+    parser.add_argument("--wrong-code-fraction", type=float, default=0.05, help="security checks that trigger SOS")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--timeout", type=float, default=30)
+    add_provider_arguments(parser)
+    parser.add_argument("--mongo", default="memory", help='"memory" or a mongodb:// URL')
+    parser.add_argument("--db-name", default="shieldx_load_suite")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--out", help="save the report here as a JSON baseline")
+    parser.add_argument("--baseline", help="compare against this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/p99 growth")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run_suite(args))
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+Minimal in-memory stand-in for the Motor collection API used by the benchmarks.
+
+Only the operations and operators the service actually issues are supported:
+equality, $exists/$ne/$in/$lt/$lte/$gt/$gte and top-level $or filters,
+$set/$setOnInsert/$inc/$min/$max/$push ($each, $slice)/$addToSet updates, single-stage
+`$set` pipeline updates with `$ifNull`, inclusion (or flat exclusion)
+projections, single-key sorts and UpdateOne/ReplaceOne bulk writes. Unique
+indexes created through create_index (including partial ones) are enforced
+on inserts and upserts, and _id on upserts; updates are not checked. It is not a general MongoDB
+emulator; point the benchmarks at a real mongod for index/plan work.
+"""
+import copy
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set(doc: dict, path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, operand in condition.items():
+            present = value is not _MISSING
+            if op == "$exists" and present != bool(operand):
+                return False
+            if op == "$ne" and present and value == operand:
+                return False
+            if op == "$in" and (not present or value not in operand):
+                return False
+            if op in ("$lt", "$lte", "$gt", "$gte"):
+                if not present or value is None:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+        return True
+    return value is not _MISSING and value == condition
+
+
+def matches(doc: dict, filter_query: Optional[dict]) -> bool:
+    for key, cond in (filter_query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, branch) for branch in cond):
+                return False
+        elif not _match_condition(_get(doc, key), cond):
+            return False
+    return True
+
+
+def _evaluate(doc: dict, expression: Any) -> Any:
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict) and "$ifNull" in expression:
+        for candidate in expression["$ifNull"]:
+            value = _evaluate(doc, candidate)
+            if value is not None:
+                return value
+        return None
+    return copy.deepcopy(expression)
+
+
+def _apply_update(doc: dict, update: Any, inserting: bool = False):
+    if isinstance(update, list):
+        for stage in update:
+            values = {key: _evaluate(doc, expr) for key, expr in stage["$set"].items()}
+            for key, value in values.items():
+                _set(doc, key, value)
+        return
+    for key, value in update.get("$set", {}).items():
+        _set(doc, key, copy.deepcopy(value))
+    for key in update.get("$unset", {}):
+        _unset(doc, key)
+    for key, value in update.get("$inc", {}).items():
+        current = _get(doc, key)
+        _set(doc, key, (0 if current is _MISSING else current) + value)
+    for op, keep in (("$max", max), ("$min", min)):
+        for key, value in update.get(op, {}).items():
+            current = _get(doc, key)
+            _set(doc, key, value if current is _MISSING else keep(current, value))
+    for key, value in update.get("$push", {}).items():
+        current = _get(doc, key)
+        items = list(current) if current is not _MISSING else []
+        if isinstance(value, dict) and "$each" in value:
+            items.extend(copy.deepcopy(value["$each"]))
+            if "$slice" in value:
+                items = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+        else:
+            items.append(copy.deepcopy(value))
+        _set(doc, key, items)
+    for key, value in update.get("$addToSet", {}).items():
+        current = _get(doc, key)
+        items = list(current) if current is not _MISSING else []
+        for item in (value["$each"] if isinstance(value, dict) and "$each" in value else [value]):
+            if item not in items:
+                items.append(copy.deepcopy(item))
+        _set(doc, key, items)
+    if inserting:
+        for key, value in update.get("$setOnInsert", {}).items():
+            _set(doc, key, copy.deepcopy(value))
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include_id = projection.get("_id", 1)
+    fields = [key for key, flag in projection.items() if flag and key != "_id"]
+    if not fields:  # exclusion projection
+        return {key: copy.deepcopy(value) for key, value in doc.items() if projection.get(key, 1)}
+    result = {}
+    for key in fields:
+        value = _get(doc, key)
+        if value is not _MISSING:
+            _set(result, key, copy.deepcopy(value))
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    return result
+
+
+class InMemoryCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict]):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        keys = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction or 1)]
+        for key, order in reversed(keys):
+            self._docs.sort(key=lambda d: (_get(d, key) is _MISSING, _get(d, key)), reverse=order < 0)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self):
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return [_project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int] = None):
+        results = self._results()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class InMemoryCollection:
+    """
+    `indexed_fields` get a hash index used for equality lookups, so the
+    per-journey updates of a large simulated fleet stay O(1). Indexed fields
+    are assumed never to change after insert (journey_id, user_id).
+    """
+
+    def __init__(self, name: str = "collection", indexed_fields=()):
+        self.name = name
+        self.docs: List[dict] = []
+        self.op_counts: Dict[str, int] = {}
+        self._indexes: Dict[str, Dict[Any, List[dict]]] = {field: {} for field in indexed_fields}
+        self._unique: List[tuple] = []
+
+    def _count(self, op: str):
+        self.op_counts[op] = self.op_counts.get(op, 0) + 1
+
+    def _store(self, doc: dict):
+        self.docs.append(doc)
+        for field, index in self._indexes.items():
+            value = _get(doc, field)
+            if value is not _MISSING:
+                index.setdefault(value, []).append(doc)
+
+    def _candidates(self, filter_query) -> List[dict]:
+        for field, index in self._indexes.items():
+            value = (filter_query or {}).get(field, _MISSING)
+            if value is not _MISSING and not isinstance(value, dict):
+                return index.get(value, [])
+        return self.docs
+
+    def _first(self, filter_query, sort=None) -> Optional[dict]:
+        candidates = [doc for doc in self._candidates(filter_query) if matches(doc, filter_query)]
+        if sort:
+            cursor = InMemoryCursor(candidates, None).sort(sort)
+            candidates = cursor._docs
+        return candidates[0] if candidates else None
+
+    async def create_index(self, keys, **kwargs):
+        if kwargs.get("unique"):
+            self._unique.append(([key for key, _ in keys], kwargs.get("partialFilterExpression")))
+        return "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    def _check_unique(self, doc: dict):
+        for fields, partial in [(["_id"], None)] + self._unique:
+            if partial and not matches(doc, partial):
+                continue
+            values = [_get(doc, field) for field in fields]
+            for existing in self.docs:
+                if (not partial or matches(existing, partial)) and [_get(existing, f) for f in fields] == values:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} {fields}")
+
+    async def insert_one(self, doc: dict):
+        self._count("insert_one")
+        doc.setdefault("_id", ObjectId())
+        if self._unique:
+            self._check_unique(doc)
+        self._store(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True):
+        self._count("insert_many")
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            if self._unique:
+                self._check_unique(doc)
+            self._store(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    async def find_one(self, filter_query=None, projection=None, sort=None):
+        self._count("find_one")
+        doc = self._first(filter_query, sort)
+        return _project(doc, projection) if doc else None
+
+    def find(self, filter_query=None, projection=None):
+        self._count("find")
+        return InMemoryCursor([doc for doc in self._candidates(filter_query) if matches(doc, filter_query)], projection)
+
+    async def count_documents(self, filter_query):
+        return sum(1 for doc in self.docs if matches(doc, filter_query))
+
+    async def update_one(self, filter_query, update, upsert: bool = False):
+        self._count("update_one")
+        doc = self._first(filter_query)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {k: v for k, v in filter_query.items() if not isinstance(v, dict) and not k.startswith("$")}
+            doc.setdefault("_id", ObjectId())
+            _apply_update(doc, update, inserting=True)
+            self._check_unique(doc)
+            self._store(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        _apply_update(doc, update)
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+    async def replace_one(self, filter_query, replacement, upsert: bool = False):
+        self._count("replace_one")
+        await self.bulk_write([ReplaceOne(filter_query, replacement, upsert=upsert)])
+        return SimpleNamespace(matched_count=1, modified_count=1)
+
+    async def update_many(self, filter_query, update):
+        self._count("update_many")
+        matched = [doc for doc in self.docs if matches(doc, filter_query)]
+        for doc in matched:
+            _apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    async def find_one_and_update(self, filter_query, update, projection=None, sort=None,
+                                  return_document=False, upsert: bool = False):
+        self._count("find_one_and_update")
+        doc = self._first(filter_query, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = {k: v for k, v in filter_query.items() if not isinstance(v, dict) and not k.startswith("$")}
+            doc.setdefault("_id", ObjectId())
+            _apply_update(doc, update, inserting=True)
+            self._check_unique(doc)
+            self._store(doc)
+            return _project(doc, projection) if return_document else None
+        before = _project(doc, projection)
+        _apply_update(doc, update)
+        return _project(doc, projection) if return_document else before
+
+    async def delete_many(self, filter_query):
+        self._count("delete_many")
+        kept = [doc for doc in self.docs if not matches(doc, filter_query)]
+        deleted = len(self.docs) - len(kept)
+        self.docs = []
+        for index in self._indexes.values():
+            index.clear()
+        for doc in kept:
+            self._store(doc)
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def bulk_write(self, operations, ordered: bool = True):
+        self._count("bulk_write")
+        for operation in operations:
+            if isinstance(operation, ReplaceOne):
+                existing = self._first(operation._filter)
+                if existing is not None:
+                    existing.clear()
+                    existing.update(copy.deepcopy(operation._doc))
+                elif operation._upsert:
+                    await self.insert_one(copy.deepcopy(operation._doc))
+            else:
+                await self.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+        return SimpleNamespace(matched_count=len(operations), modified_count=len(operations))
+
+
+class InMemoryDatabase:
+    def __init__(self, indexed_fields=("journey_id", "user_id", "email")):
+        self._indexed_fields = indexed_fields
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name, self._indexed_fields)
+        return self._collections[name]
+
+    get_collection = __getitem__
+
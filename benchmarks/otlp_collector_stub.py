@@ -0,0 +1,84 @@
+"""
+Minimal OTLP/HTTP (JSON) trace collector for local debugging.
+
+    python -m benchmarks.otlp_collector_stub --port 4318 --out traces.jsonl
+    TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces uvicorn app.main:app
+
+Accepts POST /v1/traces, prints each trace as an indented span tree with
+durations (slowest first within a level) and, with --out, appends the raw
+spans as JSON lines. Nothing is stored beyond that; point a real collector
+at TRACE_OTLP_ENDPOINT for anything longer-lived.
+"""
+import argparse
+import json
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+def _duration_ms(span: dict) -> float:
+    return (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+
+
+def render_trace(spans: List[dict]) -> List[str]:
+    children: Dict[Optional[str], List[dict]] = defaultdict(list)
+    ids = {span["spanId"] for span in spans}
+    for span in spans:
+        parent = span.get("parentSpanId")
+        children[parent if parent in ids else None].append(span)
+
+    lines = []
+
+    def walk(parent: Optional[str], depth: int):
+        for span in sorted(children[parent], key=_duration_ms, reverse=True):
+            status = span.get("status", {})
+            error = f"  ERROR {status.get('message')}" if status.get("code") == 2 else ""
+            attributes = {a["key"]: next(iter(a["value"].values())) for a in span.get("attributes", [])}
+            lines.append(f"{'  ' * depth}{span['name']}  {_duration_ms(span):.1f} ms{error}  {attributes or ''}")
+            walk(span["spanId"], depth + 1)
+
+    walk(None, 0)
+    return lines
+
+
+def make_handler(out_path: Optional[str]):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            traces: Dict[str, List[dict]] = defaultdict(list)
+            for resource in body.get("resourceSpans", []):
+                for scope in resource.get("scopeSpans", []):
+                    for span in scope.get("spans", []):
+                        traces[span["traceId"]].append(span)
+            for trace_id, spans in traces.items():
+                print(f"trace {trace_id} ({len(spans)} spans)")
+                print("\n".join(render_trace(spans)), flush=True)
+                if out_path:
+                    with open(out_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"trace_id": trace_id, "spans": spans}) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", help="append received spans to this JSON-lines file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"OTLP collector stub listening on http://{args.host}:{args.port}/v1/traces")
+    ThreadingHTTPServer((args.host, args.port), make_handler(args.out)).serve_forever()
@@ -0,0 +1,230 @@
+"""
+Local HTTP stand-ins for the notification providers, for load tests.
+
+    python -m benchmarks.provider_stubs --port 9400 --latency twilio=300 --failure-rate fast2sms=0.2
+
+Serves Expo push, FCM v1 send, Twilio Messages, Fast2SMS bulkV2 and a
+connectivity probe from one threaded server. Each provider has its own
+latency (milliseconds, +/- jitter) and failure rate, and the server counts
+requests and injected failures per provider. Responses carry just the
+fields the service reads. `wire_providers()` points the service's senders at
+a running server for an in-process run.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import ExitStack, asynccontextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, Optional
+from unittest import mock
+
+PROVIDERS = ("expo", "fcm", "twilio", "fast2sms")
+
+_TWILIO_MESSAGES = re.compile(r"^/twilio/2010-04-01/Accounts/[^/]+/Messages\.json$")
+
+
+class ProviderBehaviour:
+    __slots__ = ("latency_ms", "jitter_ms", "failure_rate")
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0, failure_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+
+
+class ProviderStubServer:
+    """Threaded HTTP server on 127.0.0.1; `start()` returns the base URL."""
+
+    def __init__(self, behaviours: Optional[Dict[str, ProviderBehaviour]] = None, port: int = 0):
+        self.behaviours = {name: ProviderBehaviour() for name in PROVIDERS}
+        self.behaviours.update(behaviours or {})
+        self._lock = threading.Lock()
+        self.requests = {name: 0 for name in PROVIDERS}
+        self.failures = {name: 0 for name in PROVIDERS}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="provider-stubs", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: {"requests": self.requests[name], "failures": self.failures[name]} for name in PROVIDERS}
+
+    def _call(self, provider: str) -> bool:
+        """Waits out the provider's latency; returns whether this call should fail."""
+        behaviour = self.behaviours[provider]
+        delay = behaviour.latency_ms + random.uniform(-behaviour.jitter_ms, behaviour.jitter_ms)
+        time.sleep(max(0.0, delay) / 1000)
+        failed = random.random() < behaviour.failure_rate
+        with self._lock:
+            self.requests[provider] += 1
+            self.failures[provider] += failed
+        return failed
+
+    def _make_handler(self):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: Optional[dict] = None):
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                if self.path == "/generate_204":
+                    return self._reply(204)
+                self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = self._body()
+                if self.path == "/expo/push/send":
+                    messages = json.loads(body or b"[]")
+                    if stubs._call("expo"):
+                        return self._reply(500, {"errors": [{"code": "INTERNAL_SERVER_ERROR"}]})
+                    return self._reply(200, {"data": [{"status": "ok", "id": uuid.uuid4().hex} for _ in messages]})
+                if self.path == "/fcm/send":
+                    if stubs._call("fcm"):
+                        return self._reply(503, {"error": {"code": 503, "status": "UNAVAILABLE"}})
+                    return self._reply(200, {"name": f"projects/load-test/messages/{uuid.uuid4().hex}"})
+                if _TWILIO_MESSAGES.match(self.path):
+                    if stubs._call("twilio"):
+                        return self._reply(400, {"code": 21614, "message": "Not a valid mobile number", "status": 400})
+                    return self._reply(201, {"sid": f"SM{uuid.uuid4().hex}", "status": "queued"})
+                if self.path == "/fast2sms/dev/bulkV2":
+                    if stubs._call("fast2sms"):
+                        return self._reply(200, {"return": False, "message": "Route temporarily unavailable"})
+                    return self._reply(200, {"return": True, "request_id": uuid.uuid4().hex})
+                self._reply(404, {"error": "not found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@asynccontextmanager
+async def wire_providers(base_url: str):
+    """
+    `async with wire_providers(url):` points Expo, Twilio, Fast2SMS and the
+    connectivity check at the stand-ins. The Firebase Admin SDK has no
+    configurable endpoint, so FCM sends are replaced by an equivalent
+    per-message POST to the stand-in.
+    """
+    import sys
+
+    import httpx
+    from firebase_admin import messaging
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    import utils.network as network
+    import utils.notifier as notifier
+
+    class RedirectingTwilioHttpClient(TwilioHttpClient):
+        def request(self, method, url, *args, **kwargs):
+            return super().request(method, url.replace("https://api.twilio.com", f"{base_url}/twilio"), *args, **kwargs)
+
+    probe = network.is_online
+
+    async def is_online():
+        return await probe(f"{base_url}/generate_204")
+
+    async with httpx.AsyncClient(timeout=10) as fcm_client:
+        async def send_each_async(messages, dry_run=False, app=None):
+            async def send(message):
+                try:
+                    response = await fcm_client.post(f"{base_url}/fcm/send", json={"token": message.token})
+                    response.raise_for_status()
+                    return SimpleNamespace(success=True, exception=None)
+                except Exception as e:
+                    return SimpleNamespace(success=False, exception=e)
+            return SimpleNamespace(responses=list(await asyncio.gather(*(send(m) for m in messages))))
+
+        twilio = Client("ACload", "load-token", http_client=RedirectingTwilioHttpClient())
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.multiple(
+                notifier, EXPO_PUSH_URL=f"{base_url}/expo/push/send", FAST2SMS_URL=f"{base_url}/fast2sms/dev/bulkV2",
+                TWILIO_SID="ACload", TWILIO_AUTH_TOKEN="load-token", TWILIO_PHONE_NUMBER="+15005550006",
+                FAST2SMS_API_KEY="load-key", init_firebase=lambda: True))
+            stack.enter_context(mock.patch.object(notifier.sms_service, "_twilio_client", twilio))
+            stack.enter_context(mock.patch.object(messaging, "send_each_async", send_each_async))
+            # every module that imported utils.network.is_online by name
+            for module in list(sys.modules.values()):
+                if getattr(module, "is_online", None) is probe:
+                    stack.enter_context(mock.patch.object(module, "is_online", is_online))
+            yield
+
+
+def parse_behaviours(latency: Dict[str, float], failure_rate: Dict[str, float]) -> Dict[str, ProviderBehaviour]:
+    behaviours = {}
+    for name in PROVIDERS:
+        behaviour = ProviderBehaviour()
+        if name in latency:
+            behaviour.latency_ms = latency[name]
+            behaviour.jitter_ms = latency[name] * 0.2
+        behaviour.failure_rate = failure_rate.get(name, 0.0)
+        behaviours[name] = behaviour
+    return behaviours
+
+
+def parse_provider_map(values) -> Dict[str, float]:
+    """["twilio=300", "expo=80"] -> {"twilio": 300.0, "expo": 80.0}"""
+    parsed = {}
+    for value in values or []:
+        name, _, number = value.partition("=")
+        if name not in PROVIDERS:
+            raise argparse.ArgumentTypeError(f"unknown provider {name!r}; expected one of {', '.join(PROVIDERS)}")
+        parsed[name] = float(number)
+    return parsed
+
+
+def add_provider_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=MS",
+                        help="provider latency in ms (default 50, jitter 20%%); repeatable")
+    parser.add_argument("--failure-rate", action="append", metavar="PROVIDER=FRACTION",
+                        help="fraction of provider calls that fail (default 0); repeatable")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9400)
+    add_provider_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = ProviderStubServer(parse_behaviours(parse_provider_map(args.latency),
+                                                 parse_provider_map(args.failure_rate)), args.port)
+    print(f"Provider stand-ins on {server.url}", flush=True)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
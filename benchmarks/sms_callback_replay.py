@@ -0,0 +1,176 @@
+"""
+Delivery-report replay for the SMS status callback endpoints.
+
+    python -m benchmarks.sms_callback_replay --messages 20000
+    python -m benchmarks.sms_callback_replay --messages 20000 --mongo mongodb://localhost:27017
+
+Seeds N outbound SMS records (a fraction of them emergency), then replays the
+provider's status callbacks for each one in-process against the real routes:
+queued/sent/delivered reports shuffled so they arrive out of order, a share of
+duplicates, and some messages ending undelivered or failed. Half of the
+reports go through the signed Twilio form endpoint, half through the generic
+JSON endpoint. The flush loop runs alongside; retries and escalations are
+stubbed so nothing leaves the process.
+
+The report covers callback throughput and latency, flush counts, how many
+final statuses were lost or regressed, and the retries/escalations raised.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Dict, List
+from unittest import mock
+
+import httpx
+
+from benchmarks.memory_mongo import InMemoryDatabase
+from benchmarks.stats import summarize
+
+
+def build_reports(args, rng: random.Random):
+    """Returns (seed documents, callbacks in replay order, expected final status per message)."""
+    seeds, reports, expected = [], [], {}
+    now = datetime.utcnow()
+    for i in range(args.messages):
+        message_id = f"SM{i:032x}"
+        seeds.append({
+            "_id": message_id, "provider": "twilio", "to": f"+9198{i:08d}", "body": "🚨 replay",
+            "emergency": rng.random() < args.emergency_fraction, "attempt": 1,
+            "status": "queued", "status_rank": 0, "created_at": now,
+        })
+        roll = rng.random()
+        final = "failed" if roll < args.failed_fraction else (
+            "undelivered" if roll < args.failed_fraction + args.undelivered_fraction else "delivered")
+        expected[message_id] = final
+        chain = ["sent", final]
+        if rng.random() < args.duplicate_fraction:
+            chain.append(rng.choice(chain))
+        reports.extend((message_id, status) for status in chain)
+    rng.shuffle(reports)
+    return seeds, reports, expected
+
+
+async def replay(args) -> Dict:
+    from fastapi import FastAPI
+    from twilio.request_validator import RequestValidator
+
+    import routes.sms_callback_routes as callback_routes
+    import utils.sms_delivery as sms_delivery
+    from routes.sms_callback_routes import sms_callback_router
+
+    rng = random.Random(args.seed)
+    seeds, reports, expected = build_reports(args, rng)
+
+    if args.mongo == "memory":
+        messages = InMemoryDatabase()["sms_messages"]
+    else:
+        from database import get_mongo_client
+        messages = get_mongo_client(args.mongo)[args.db_name]["sms_messages"]
+        await messages.delete_many({})
+    for i in range(0, len(seeds), 1000):
+        await messages.insert_many(seeds[i:i + 1000], ordered=False)
+
+    buffer = sms_delivery.DeliveryReportBuffer(messages)
+    followups = {"retried": 0, "escalated": 0}
+
+    async def stub_retry(message):
+        followups["retried"] += 1
+
+    async def stub_escalate(message):
+        followups["escalated"] += 1
+
+    auth_token, secret = "replay-auth-token", "replay-secret"
+    validator = RequestValidator(auth_token)
+    app = FastAPI()
+    app.include_router(sms_callback_router, prefix="/api")
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    patches = [
+        mock.patch.object(callback_routes, "delivery_reports", buffer),
+        mock.patch.object(callback_routes, "twilio_validator", validator),
+        mock.patch.object(callback_routes, "SMS_STATUS_CALLBACK_URL", None),  # signed against the replay URL
+        mock.patch.object(callback_routes, "SMS_CALLBACK_SECRET", secret),
+        mock.patch.object(buffer, "_retry", stub_retry),
+        mock.patch.object(buffer, "_escalate", stub_escalate),
+    ]
+    for patch in patches:
+        patch.start()
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    async def post(client: httpx.AsyncClient, message_id: str, status: str):
+        started = time.perf_counter()
+        if rng.random() < 0.5:
+            url = "http://replay/api/sms/status/twilio"
+            params = {"MessageSid": message_id, "MessageStatus": status}
+            response = await client.post(url, data=params, headers={
+                "X-Twilio-Signature": validator.compute_signature(url, params)})
+        else:
+            response = await client.post("/api/sms/status/fast2sms", json={"message_id": message_id, "status": status},
+                                         headers={"X-Callback-Token": secret})
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    flush_calls = messages.op_counts.get("bulk_write", 0) if hasattr(messages, "op_counts") else None
+    flusher = asyncio.create_task(buffer.run_flush_loop())
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay") as client:
+            started = time.perf_counter()
+            for i in range(0, len(reports), args.concurrency):
+                await asyncio.gather(*(post(client, m, s) for m, s in reports[i:i + args.concurrency]))
+            ingest_wall = time.perf_counter() - started
+        while len(buffer):
+            await buffer.flush()
+        await asyncio.sleep(0)
+        drain_wall = time.perf_counter() - started
+    finally:
+        flusher.cancel()
+        for patch in reversed(patches):
+            patch.stop()
+
+    final = {doc["_id"]: doc["status"] async for doc in messages.find({}, {"status": 1})}
+    distribution: Dict[str, int] = {}
+    for status in final.values():
+        distribution[status] = distribution.get(status, 0) + 1
+    wrong = sum(1 for message_id, status in expected.items() if final.get(message_id) != status)
+    emergency_failed = sum(1 for doc in seeds if doc["emergency"] and expected[doc["_id"]] != "delivered")
+
+    return {
+        "messages": args.messages,
+        "mongo": args.mongo,
+        "callbacks": {
+            "sent": len(reports),
+            "responses": statuses,
+            "callbacks_per_s": round(len(reports) / ingest_wall, 1) if ingest_wall else None,
+            "latency_ms": summarize(latencies, 1000),
+            "drained_after_s": round(drain_wall, 3),
+        },
+        "buffer": buffer.stats(),
+        "bulk_writes": (messages.op_counts.get("bulk_write", 0) - flush_calls) if flush_calls is not None else None,
+        "final_status": distribution,
+        "wrong_final_status": wrong,
+        "followups": {"emergency_undelivered": emergency_failed, **followups},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--emergency-fraction", type=float, default=0.3)
+    parser.add_argument("--undelivered-fraction", type=float, default=0.05)
+    parser.add_argument("--failed-fraction", type=float, default=0.02)
+    parser.add_argument("--duplicate-fraction", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--mongo", default="memory", help='"memory" or a mongodb:// URL')
+    parser.add_argument("--db-name", default="shieldx_sms_replay")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(replay(parse_args())), indent=2))
@@ -0,0 +1,87 @@
+"""
+Import and startup timing for the API process.
+
+    python -m benchmarks.startup_time
+    python -m benchmarks.startup_time --runs 10 --mongo mongodb://localhost:27017
+
+Imports app.main in fresh interpreters and reports the wall time, the
+slowest modules from `python -X importtime`, and whether the SDKs meant to
+load lazily (Twilio REST, Firebase Admin, geopy) stayed out of the import.
+
+With --mongo, it then runs the startup warm-up against that server in
+process and reports each step's duration, the warm-up wall time and the
+sum of the step durations (what a sequential startup would have taken).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+from benchmarks.stats import summarize
+
+LAZY_MODULES = ("twilio.rest", "firebase_admin", "geopy")
+
+IMPORT_PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import app.main\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(elapsed, ','.join(m for m in {lazy!r} if m in sys.modules))\n"
+)
+
+
+def _python(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+
+
+def measure_imports(runs: int) -> Dict:
+    samples, eager = [], set()
+    for _ in range(runs):
+        elapsed, _, loaded = _python(["-c", IMPORT_PROBE.format(lazy=LAZY_MODULES)]).stdout.strip().splitlines()[-1].partition(" ")
+        samples.append(float(elapsed))
+        eager.update(m for m in loaded.split(",") if m)
+
+    rows = []
+    for line in _python(["-X", "importtime", "-c", "import app.main"]).stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    slowest = sorted(rows, reverse=True)[1:11]  # [0] is app.main itself
+    return {
+        "runs": runs,
+        "import_ms": summarize(samples, 1000, 1),
+        "slowest_modules_cumulative_ms": {name: round(us / 1000, 1) for us, name in slowest},
+        "lazy_modules_loaded_at_import": sorted(eager),
+    }
+
+
+async def measure_warm_up(mongo_url: str) -> Dict:
+    os.environ["MONGO_URL"] = mongo_url
+    from app.main import warm_up
+
+    await warm_up.run()
+    report = warm_up.report()
+    return {
+        "ready": report["ready"],
+        "wall_ms": report["duration_ms"],
+        "sequential_ms": round(sum(step.get("duration_ms", 0) for step in report["steps"].values()), 1),
+        "steps": report["steps"],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time the import in")
+    parser.add_argument("--mongo", help="mongodb:// URL to run the warm-up against (skipped when omitted)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = {"imports": measure_imports(args.runs)}
+    if args.mongo:
+        result["warm_up"] = asyncio.run(measure_warm_up(args.mongo))
+    print(json.dumps(result, indent=2, default=str))
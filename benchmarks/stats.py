@@ -0,0 +1,23 @@
+from typing import Dict, Iterable
+
+
+def percentile(sorted_samples, fraction: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples: Iterable[float], scale: float = 1.0, digits: int = 3) -> Dict[str, float]:
+    """count/mean/p50/p95/p99/max of `samples`, each multiplied by `scale` (e.g. 1000 for ms)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * scale, digits),
+        "p50": round(percentile(ordered, 0.50) * scale, digits),
+        "p95": round(percentile(ordered, 0.95) * scale, digits),
+        "p99": round(percentile(ordered, 0.99) * scale, digits),
+        "max": round(ordered[-1] * scale, digits),
+    }
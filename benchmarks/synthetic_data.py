@@ -0,0 +1,407 @@
+"""
+Deterministic bulk data for query, index and retention work.
+
+    python -m benchmarks.synthetic_data --users 10000 --days 30 --mongo mongodb://localhost:27017
+    python -m benchmarks.synthetic_data --users 50000 --days 90 --fixes-per-hour 120 --workers 8 --indexes
+
+Generates `users` in the Mongoose shape (deviceToken, emergencyContacts,
+isSecurityCheckEnabled, securityCheckSlot, hashed_security_code,
+lastLocation), their journeys in `user_routes`, the `locations` fixes shared
+along those journeys and `sos_history` rows, over the --days before --end.
+Every document comes from a random stream seeded by (seed, user, kind), so
+the same arguments always give the same documents, _ids included. That holds
+whatever the --workers sharding or batch sizes are. Documents are generated
+lazily and written with unordered insert_many batches, --concurrency in
+flight per worker process. --indexes builds the service's indexes
+(database.setup_indexes) once the data is in, which is faster than
+maintaining them during the load.
+
+Volumes are roughly users x days x journeys-per-day journeys, that times
+the average journey length (35 min) x fixes-per-hour locations, and
+users x days x sos-per-user-day SOS rows. The defaults (10k users, 30
+days) give about 450k journeys, 15.7M fixes and 30k SOS rows; --dry-run
+prints the counts without writing.
+
+`SyntheticDataset` and `load_into()` also work against the in-memory
+stand-in, which is how the load suite and tests use them.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import struct
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from bson import ObjectId
+
+COLLECTIONS = ("users", "user_routes", "locations", "sos_history")
+# Cities users live around: (lat, lng).
+CITIES = ((18.5204, 73.8567), (19.0760, 72.8777), (28.6139, 77.2090), (12.9716, 77.5946), (17.3850, 78.4867))
+METERS_PER_DEGREE_LAT = 111_320.0
+JOURNEY_MINUTES = (10, 60)
+# bcrypt of "123456" (cost 12), shared by every synthetic user; see benchmarks.load_suite.SECURITY_CODE.
+SECURITY_CODE_HASH = "$2b$12$W.kOjAX4Y6ZCssAv40RrauFs.LbojMvb3sjejzAsgGcp9qe9K5fXu"
+SOS_REASONS = ("Manual SOS", "Manual SOS", "Manual SOS", "Inactivity Alert", "Security Check Failed",
+               "Security Check Timeout", "Location Alert")
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit, k, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        k += 1
+        product *= rng.random()
+    return k
+
+
+def _object_id(rng: random.Random, at: datetime) -> ObjectId:
+    # Real ObjectIds start with their creation time, so _id order follows time order here too.
+    return ObjectId(struct.pack(">I", int(at.timestamp())) + rng.getrandbits(64).to_bytes(8, "big"))
+
+
+def _offset(lat: float, lng: float, north_m: float, east_m: float):
+    return (lat + north_m / METERS_PER_DEGREE_LAT,
+            lng + east_m / (METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))))
+
+
+class _Journey:
+    __slots__ = ("index", "journey_id", "started_at", "minutes", "start", "end", "status")
+
+    def __init__(self, index, journey_id, started_at, minutes, start, end, status):
+        self.index = index
+        self.journey_id = journey_id
+        self.started_at = started_at
+        self.minutes = minutes
+        self.start = start
+        self.end = end
+        self.status = status
+
+
+class SyntheticDataset:
+    """The documents for users `shard`, `shard + shards`, ... of a seeded population."""
+
+    def __init__(self, users: int = 10000, days: int = 30, fixes_per_hour: float = 60, journeys_per_day: float = 1.5,
+                 sos_per_user_day: float = 0.1, end: Optional[datetime] = None, seed: int = 42,
+                 shard: int = 0, shards: int = 1):
+        self.users = users
+        self.days = days
+        self.fixes_per_hour = fixes_per_hour
+        self.journeys_per_day = journeys_per_day
+        self.sos_per_user_day = sos_per_user_day
+        self.end = end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.seed = seed
+        self.shard = shard
+        self.shards = shards
+
+    def shard_of(self, shard: int, shards: int) -> "SyntheticDataset":
+        return SyntheticDataset(self.users, self.days, self.fixes_per_hour, self.journeys_per_day,
+                                self.sos_per_user_day, self.end, self.seed, shard, shards)
+
+    def _rng(self, user: int, kind: str, *parts) -> random.Random:
+        return random.Random(":".join(map(str, (self.seed, user, kind, *parts))))
+
+    def _user_indexes(self) -> range:
+        return range(self.shard, self.users, self.shards)
+
+    @staticmethod
+    def email(user: int) -> str:
+        return f"user{user}@shieldx.test"
+
+    def _home(self, user: int):
+        rng = self._rng(user, "home")
+        lat, lng = rng.choice(CITIES)
+        return _offset(lat, lng, rng.gauss(0, 6000), rng.gauss(0, 6000))
+
+    def _contacts(self, user: int) -> List[str]:
+        rng = self._rng(user, "contacts")
+        return [f"+91{rng.randrange(6_000_000_000, 9_999_999_999)}" for _ in range(rng.randint(1, 3))]
+
+    def _journeys(self, user: int) -> List[_Journey]:
+        rng = self._rng(user, "journeys")
+        home = self._home(user)
+        journeys = []
+        for day in range(self.days):
+            day_start = self.start + timedelta(days=day)
+            for _ in range(_poisson(rng, self.journeys_per_day)):
+                started_at = day_start + timedelta(seconds=rng.uniform(6 * 3600, 23 * 3600))
+                minutes = rng.uniform(*JOURNEY_MINUTES)
+                start = _offset(*home, rng.gauss(0, 2000), rng.gauss(0, 2000))
+                distance = minutes * 60 * rng.uniform(1.2, 8.0)  # walking to driving, m/s
+                bearing = rng.uniform(0, 2 * math.pi)
+                end = _offset(*start, distance * math.cos(bearing), distance * math.sin(bearing))
+                ends_at = started_at + timedelta(minutes=minutes)
+                roll = rng.random()
+                status = ("running" if ends_at > self.end else "inactivity_alert" if roll < 0.03 else
+                          "deviation_alert" if roll < 0.04 else "completed")
+                journey_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+                journeys.append(_Journey(len(journeys), journey_id, started_at, minutes, start, end, status))
+        return journeys
+
+    def _fix_count(self, journey: _Journey) -> int:
+        count = max(1, int(journey.minutes / 60 * self.fixes_per_hour))
+        if journey.status == "running" and self.fixes_per_hour:
+            # fixes after the end of the window have not happened yet
+            count = min(count, math.ceil((self.end - journey.started_at).total_seconds() * self.fixes_per_hour / 3600))
+        return count
+
+    @staticmethod
+    def _along(journey: _Journey, k: int, count: int):
+        progress = k / max(1, count - 1)
+        return (journey.start[0] + (journey.end[0] - journey.start[0]) * progress,
+                journey.start[1] + (journey.end[1] - journey.start[1]) * progress)
+
+    def _fixes(self, user: int, journey: _Journey) -> Iterator[tuple]:
+        """(timestamp, lat, lng) along the journey at the configured fix rate, with GPS jitter."""
+        rng = self._rng(user, "fixes", journey.index)
+        count = self._fix_count(journey)
+        step = timedelta(hours=1 / self.fixes_per_hour) if self.fixes_per_hour else timedelta(0)
+        (start_lat, start_lng), (end_lat, end_lng) = journey.start, journey.end
+        lat_per_m = 1 / METERS_PER_DEGREE_LAT
+        lng_per_m = 1 / (METERS_PER_DEGREE_LAT * math.cos(math.radians(start_lat)))
+        gauss = rng.gauss
+        for k in range(count):
+            progress = k / max(1, count - 1)
+            yield (journey.started_at + step * k,
+                   start_lat + (end_lat - start_lat) * progress + gauss(0, 8) * lat_per_m,
+                   start_lng + (end_lng - start_lng) * progress + gauss(0, 8) * lng_per_m)
+
+    # --- documents per collection ---
+
+    def users_documents(self) -> Iterator[dict]:
+        from utils.security_check_schedule import hashed_slot
+
+        for user in self._user_indexes():
+            rng = self._rng(user, "profile")
+            created_at = self.start - timedelta(days=rng.uniform(1, 365))
+            email = self.email(user)
+            doc = {
+                "_id": _object_id(rng, created_at),
+                "name": f"User {user}",
+                "username": f"user{user}",
+                "email": email,
+                "password": SECURITY_CODE_HASH,
+                "phone": f"+91{rng.randrange(6_000_000_000, 9_999_999_999)}",
+                "emergencyContacts": self._contacts(user),
+                "isSecurityCheckEnabled": rng.random() < 0.3,
+                "hashed_security_code": SECURITY_CODE_HASH,
+                "lastLocation": dict(zip(("latitude", "longitude"), self._home(user))),
+                "createdAt": created_at,
+                "updatedAt": self.end - timedelta(seconds=rng.uniform(0, self.days * 86400)),
+                "__v": 0,
+            }
+            if doc["isSecurityCheckEnabled"]:
+                doc["securityCheckSlot"] = hashed_slot(email)
+            roll = rng.random()
+            if roll < 0.9:
+                expo = roll < 0.6
+                token = (f"ExponentPushToken[{rng.getrandbits(88):022x}]" if expo else
+                         f"{rng.getrandbits(128):032x}:APA91b{rng.getrandbits(256):064x}")
+                doc["deviceToken"] = {"token": token, "type": "expo" if expo else "fcm",
+                                      "registered_at": created_at, "updated_at": doc["updatedAt"]}
+                if rng.random() < 0.05:
+                    doc["deviceToken"].update(invalid=True, invalid_reason="DeviceNotRegistered",
+                                              invalidated_at=doc["updatedAt"])
+            yield doc
+
+    def user_routes_documents(self) -> Iterator[dict]:
+        for user in self._user_indexes():
+            rng = self._rng(user, "routes")
+            user_id, contacts = self.email(user), self._contacts(user)
+            for journey in self._journeys(user):
+                # the last two fixes' points, without their GPS jitter
+                count = self._fix_count(journey)
+                last_at = journey.started_at + timedelta(hours=(count - 1) / self.fixes_per_hour) \
+                    if self.fixes_per_hour else journey.started_at
+                current, previous = self._along(journey, count - 1, count), self._along(journey, max(0, count - 2), count)
+                doc = {
+                    "_id": _object_id(rng, journey.started_at),
+                    "user_id": user_id,
+                    "journey_id": journey.journey_id,
+                    "start_point": {"latitude": journey.start[0], "longitude": journey.start[1]},
+                    "end_point": {"latitude": journey.end[0], "longitude": journey.end[1]},
+                    "current_loc_coordinates": {"latitude": current[0], "longitude": current[1]},
+                    "previous_loc_coordinates": {"latitude": previous[0], "longitude": previous[1]},
+                    "last_updated_at": last_at,
+                    "emergency_contact": contacts[0],
+                    "emergency_contacts": contacts,
+                    "created_at": journey.started_at,
+                    "status": journey.status,
+                }
+                if journey.status in ("inactivity_alert", "deviation_alert"):
+                    doc["last_notification_time"] = last_at + timedelta(minutes=rng.uniform(5, 15))
+                yield doc
+
+    def locations_documents(self) -> Iterator[dict]:
+        for user in self._user_indexes():
+            rng = self._rng(user, "locations")
+            user_id = self.email(user)
+            for journey in self._journeys(user):
+                for at, lat, lng in self._fixes(user, journey):
+                    yield {"_id": _object_id(rng, at), "user_id": user_id, "lat": lat, "lng": lng, "timestamp": at}
+
+    def sos_history_documents(self) -> Iterator[dict]:
+        seconds = self.days * 86400
+        for user in self._user_indexes():
+            rng = self._rng(user, "sos")
+            user_id, contacts, home = self.email(user), self._contacts(user), self._home(user)
+            times = sorted(self.start + timedelta(seconds=rng.uniform(0, seconds))
+                           for _ in range(_poisson(rng, self.sos_per_user_day * self.days)))
+            for at in times:
+                lat, lng = _offset(*home, rng.gauss(0, 3000), rng.gauss(0, 3000))
+                doc = {
+                    "_id": _object_id(rng, at),
+                    "user_id": user_id,
+                    "location_latitude": lat,
+                    "location_longitude": lng,
+                    "timestamp": at,
+                    "notifiedContacts": contacts,
+                    "status": "triggered",
+                    "reason": rng.choice(SOS_REASONS),
+                    "incident_id": _object_id(rng, at),
+                }
+                if rng.random() < 0.6:
+                    doc.update(status="resolved", resolved_at=at + timedelta(seconds=rng.expovariate(1 / 900)))
+                yield doc
+
+    def documents(self, collection: str) -> Iterator[dict]:
+        return getattr(self, f"{collection}_documents")()
+
+    def expected_counts(self) -> Dict[str, int]:
+        """Exact document counts, computed without building the documents."""
+        counts = {"users": len(self._user_indexes()), "user_routes": 0, "locations": 0, "sos_history": 0}
+        for user in self._user_indexes():
+            for journey in self._journeys(user):
+                counts["user_routes"] += 1
+                counts["locations"] += self._fix_count(journey)
+            counts["sos_history"] += _poisson(self._rng(user, "sos"), self.sos_per_user_day * self.days)
+        return counts
+
+
+def _batches(documents: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def load_into(db, dataset: SyntheticDataset, collections: Sequence[str] = COLLECTIONS,
+                    batch_size: int = 5000, concurrency: int = 4) -> Dict[str, int]:
+    """
+    Inserts the dataset into `db` (Motor database or benchmarks.memory_mongo
+    stand-in) with unordered insert_many, up to `concurrency` batches in
+    flight while the next one is generated. Returns documents inserted per collection.
+    """
+    inserted = {}
+    for name in collections:
+        collection = db[name]
+        in_flight = set()
+        total = 0
+        for batch in _batches(dataset.documents(name), batch_size):
+            if len(in_flight) >= concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            in_flight.add(asyncio.ensure_future(collection.insert_many(batch, ordered=False)))
+            total += len(batch)
+        if in_flight:
+            for task in (await asyncio.wait(in_flight))[0]:
+                task.result()
+        inserted[name] = total
+    return inserted
+
+
+def _load_shard(mongo_url: str, db_name: str, dataset: SyntheticDataset, collections: Sequence[str],
+                batch_size: int, concurrency: int) -> Dict[str, int]:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(mongo_url)
+        try:
+            return await load_into(client[db_name], dataset, collections, batch_size, concurrency)
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+
+async def build_indexes(mongo_url: str, db_name: str):
+    """Creates the service's indexes (database.setup_indexes) on `db_name`."""
+    from database import get_mongo_client, setup_indexes
+
+    await setup_indexes(get_mongo_client(mongo_url)[db_name])
+
+
+def generate(args) -> Dict:
+    dataset = SyntheticDataset(args.users, args.days, args.fixes_per_hour, args.journeys_per_day,
+                               args.sos_per_user_day, datetime.fromisoformat(args.end) if args.end else None, args.seed)
+    collections = args.collection or list(COLLECTIONS)
+    report = {"window": {"start": dataset.start.isoformat(), "end": dataset.end.isoformat()}}
+    if args.dry_run:
+        counts = dataset.expected_counts()
+        report["documents"] = {name: counts[name] for name in collections}
+        return report
+
+    if args.drop:
+        from pymongo import MongoClient
+        with MongoClient(args.mongo) as sync_client:
+            for name in collections:
+                sync_client[args.db_name].drop_collection(name)
+
+    started = time.perf_counter()
+    totals = {name: 0 for name in collections}
+    # Spawned, not forked: each worker builds its own Mongo client.
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_load_shard, args.mongo, args.db_name, dataset.shard_of(shard, args.workers),
+                               collections, args.batch_size, args.concurrency) for shard in range(args.workers)]
+        for future in futures:
+            for name, count in future.result().items():
+                totals[name] += count
+    load_seconds = time.perf_counter() - started
+    report["documents"] = totals
+    report["load_seconds"] = round(load_seconds, 1)
+    report["documents_per_s"] = round(sum(totals.values()) / load_seconds) if load_seconds else None
+
+    if args.indexes:
+        started = time.perf_counter()
+        asyncio.run(build_indexes(args.mongo, args.db_name))
+        report["index_seconds"] = round(time.perf_counter() - started, 1)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--fixes-per-hour", type=float, default=60, help="location fixes per hour of journey")
+    parser.add_argument("--journeys-per-day", type=float, default=1.5, help="mean journeys per user per day")
+    parser.add_argument("--sos-per-user-day", type=float, default=0.1)
+    parser.add_argument("--end", help="end of the generated window, ISO date (default: today 00:00 UTC)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--collection", action="append", choices=COLLECTIONS, help="only these; repeatable")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="shieldx_synthetic")
+    parser.add_argument("--drop", action="store_true", help="drop the target collections first")
+    parser.add_argument("--workers", type=int, default=max(1, (multiprocessing.cpu_count() or 2) // 2))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight per worker")
+    parser.add_argument("--indexes", action="store_true", help="build the service's indexes after loading")
+    parser.add_argument("--dry-run", action="store_true", help="print document counts only")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    print(json.dumps(generate(parse_args()), indent=2))
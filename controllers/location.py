@@ -1,11 +1,17 @@
 import asyncio
+import logging
 from fastapi import BackgroundTasks, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from database import location_collection , user_collection
 from datetime import datetime
 from utils.notifier import send_push_notification, play_alert_sound, is_valid_phone
+from utils.admission import Priority, mongo_write_gate, priority
+from utils.geocoding import reverse_geocoder
 from utils.network import is_online
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 # Define LocationRequest Data Model
 class LocationRequest(BaseModel):
@@ -25,15 +31,18 @@ class LocationRequest(BaseModel):
         return self.emergency_contacts
 
 # Enhanced Message Generator
-def generate_message(username: str, lat: float, lon: float, is_emergency: bool = False) -> str:
+def generate_message(username: str, lat: float, lon: float, is_emergency: bool = False,
+                     address: Optional[str] = None) -> str:
     """
-    Generates a concise notification message with live location.
+    Generates a concise notification message with live location, and the
+    reverse-geocoded address of an emergency when one is known.
     """
     location_link = f"https://www.google.com/maps?q={lat},{lon}"
     
     if is_emergency:
         # Include the Google Maps link explicitly in the message
-        message = f"🚨 EMERGENCY: {username} needs help! Location: {location_link}"
+        near = f" Near {address}." if address else ""
+        message = f"🚨 EMERGENCY: {username} needs help!{near} Location: {location_link}"
     else:
         # Include the Google Maps link explicitly in the message
         message = f"📍 {username}'s location: {location_link}"
@@ -58,23 +67,24 @@ async def send_notifications(contacts: list[str], message: str, is_emergency: bo
     sms_tasks = []
     for contact in contacts:
         if is_valid_phone(contact):
-            print(f"✅ Valid contact: {contact}")
             sms_tasks.append(send_notification(contact, message, network_status))
         else:
-            print(f"⚠️ Skipping invalid contact: {contact}")
+            logger.warning("Skipping invalid contact", extra={"contact": contact})
 
     # Execute all tasks in parallel
     results = await asyncio.gather(*sms_tasks, return_exceptions=True)
     
-    for contact, result in zip(contacts, results):
-        if isinstance(result, Exception):
-            print(f"❌ Error sending notification to {contact}: {result}")
-        else:
-            print(f"📩 Notification result for {contact}: {result}")
+    valid_contacts = [contact for contact in contacts if is_valid_phone(contact)]
+    failed = [contact for contact, result in zip(valid_contacts, results) if isinstance(result, Exception)]
+    for contact in failed:
+        logger.error("Sending notification failed", extra={"contact": contact})
+    logger.info("Notifications sent", extra={"sent": len(results) - len(failed), "failed": len(failed),
+                                              "online": network_status})
 
     return network_status
 
 # Main Async Endpoint for Location Sharing
+@traced("user.lookup_username")
 async def get_username_by_email(email: str) -> Optional[str]:
     user_doc = await user_collection.find_one({"email": email})
     if user_doc:
@@ -98,25 +108,29 @@ async def share_location(user_id: str, lat: float, lng: float, contacts: List[st
             "timestamp": datetime.utcnow()
         }
         
-        await location_collection.insert_one(location_data)
-        
-        # 2. Send notifications if contacts are provided
-        if contacts:
-            print(f"Sending notifications to contacts: {contacts}")
-            message = generate_message(username, lat, lng, is_emergency)
-            print(f"Generated message: {message}")
-            network_status = await send_notifications(contacts, message, is_emergency)
-            mode = "Online Mode" if network_status else "Offline Mode"
-            print(f"Notification sending mode: {mode}")
-            return {
-                "status": "success", 
-                "message": f"Location saved and notifications sent ({mode})",
-                "notification_mode": mode
-            }
+        # Emergency alerts name the place; the lookup runs while the fix is saved
+        address_task = asyncio.create_task(reverse_geocoder.lookup(lat, lng)) if is_emergency and contacts else None
+
+        # An emergency share gets SOS's reserved capacity for its write and alerts
+        with priority(Priority.SOS if is_emergency else Priority.SHARE):
+            async with mongo_write_gate.slot():
+                await location_collection.insert_one(location_data)
+
+            # 2. Send notifications if contacts are provided
+            if contacts:
+                address = await address_task if address_task is not None else None
+                message = generate_message(username, lat, lng, is_emergency, address)
+                network_status = await send_notifications(contacts, message, is_emergency)
+                mode = "Online Mode" if network_status else "Offline Mode"
+                return {
+                    "status": "success", 
+                    "message": f"Location saved and notifications sent ({mode})",
+                    "notification_mode": mode
+                }
         
         return {"status": "success", "message": "Location saved successfully"}
         
     except Exception as e:
         # Fix: Return JSON response with error message instead of raising Exception
-        print(f"Error in share_location: {e}")
+        logger.error("share_location failed", extra={"user_id": user_id, "error": str(e)})
         return {"status": "error", "message": f"Failed to share location: {str(e)}"}
@@ -1,102 +1,217 @@
 import os
 import time
+import uuid
 import asyncio
-import bcrypt
-from typing import List
+import logging
+import httpx
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple
 from fastapi import HTTPException
 
-from database import user_collection
-from utils.sos import trigger_sos
-from utils.notifier import send_push_notification
+from database import user_collection, job_runs_collection
+from controllers.sos_controller import trigger_sos
+from models.sos import SOSReason
+from utils.notifier import send_push_batch
+from utils.push_receipts import record_skipped_sends
+from utils.security_check_sessions import SecurityCheckStatus, security_check_sessions
+from utils.admission import Priority, admission
+from utils.cpu_executor import AttemptThrottle, CpuExecutorOverloaded, cpu_executor, verify_bcrypt
 
-# 🧠 In-memory security state (for 1 global session)
-security_state = {
-    "pending": False,
-    "timestamp": None,
-    "user_email_pending": None
-}
+logger = logging.getLogger(__name__)
+
+# 🧠 Per-user check sessions (Mongo-backed, shared by all workers)
 
 # ✅ 1. INITIATE SECURITY CHECK (Triggered hourly or on demand)
-async def initiate_hourly_security_check():
-    if security_state["pending"]:
-        print("🟡 Security check already pending. Skipping...")
-        return
-
-    print("🟢 Starting hourly security check...")
-
-    users_to_notify = await user_collection.find({
-        "deviceToken.token": {"$exists": True, "$ne": None},
-        "isSecurityCheckEnabled": True
-    }).to_list(length=None)
-
-    if not users_to_notify:
-        print("😴 No eligible users found.")
-        return
-
-    for user_doc in users_to_notify:
-        user_email = user_doc.get("email")
-        device_token = user_doc.get("deviceToken", {}).get("token")
-
-        if not user_email or not device_token:
-            continue
-
-        check_id = str(time.time())
-        print(f"📲 Sending push notification to {user_email}")
-
-        # 🧠 Track current user (global state — basic)
-        security_state.update({
-            "pending": True,
-            "timestamp": time.time(),
-            "user_email_pending": user_email
-        })
-
-        await send_push_notification(
-            device_token,
-            title="🔐 ShieldX Security Check Required",
-            body="Enter your code to confirm you're safe. Tap to respond.",
-            data={
-                "type": "security_check",
-                "check_id": check_id,
-                "user_email": user_email
-            }
-        )
+SECURITY_CHECK_JOB_ID = "hourly_security_check"
+SECURITY_CHECK_BATCH_SIZE = int(os.getenv("SECURITY_CHECK_BATCH_SIZE", "500"))
+SECURITY_CHECK_PUSH_CONCURRENCY = int(os.getenv("SECURITY_CHECK_PUSH_CONCURRENCY", "8"))
+# An interrupted run younger than this is resumed instead of starting over.
+SECURITY_CHECK_RESUME_WINDOW_SECONDS = int(os.getenv("SECURITY_CHECK_RESUME_WINDOW_SECONDS", "3600"))
+
+# Code verifications allowed per user per window, on top of one in flight at a time.
+SECURITY_CODE_MAX_ATTEMPTS = int(os.getenv("SECURITY_CODE_MAX_ATTEMPTS", "5"))
+SECURITY_CODE_ATTEMPT_WINDOW_SECONDS = float(os.getenv("SECURITY_CODE_ATTEMPT_WINDOW_SECONDS", "60"))
+security_code_throttle = AttemptThrottle(SECURITY_CODE_MAX_ATTEMPTS, SECURITY_CODE_ATTEMPT_WINDOW_SECONDS)
+
+SECURITY_CHECK_ELIGIBILITY_FILTER = {
+    "deviceToken.token": {"$exists": True, "$ne": None},
+    "deviceToken.invalid": {"$ne": True},  # flagged dead by push receipts / FCM errors
+    "isSecurityCheckEnabled": True
+}
 
-# 🔁 2. BACKGROUND TASK FOR TIMEOUT (Check every 10s)
+async def _start_or_resume_run(job_id: str) -> Tuple[dict, bool]:
+    """Returns (run, resumed)."""
+    now = datetime.utcnow()
+    previous = await job_runs_collection.find_one({"_id": job_id})
+    if (previous and previous.get("status") == "running"
+            and (now - previous["started_at"]).total_seconds() < SECURITY_CHECK_RESUME_WINDOW_SECONDS):
+        logger.info("Resuming security check run", extra={"run_id": previous["run_id"], "after": str(previous.get("last_id"))})
+        return previous, True
+
+    run = {
+        "_id": job_id,
+        "run_id": uuid.uuid4().hex,
+        "status": "running",
+        "started_at": now,
+        "last_id": None,
+        "sent": 0,
+        "failed": 0,
+        "skipped": 0,
+    }
+    await job_runs_collection.replace_one({"_id": job_id}, run, upsert=True)
+    return run, False
+
+async def _send_security_check_batch(users: list, http_client, resumed_since: Optional[datetime] = None) -> dict:
+    """
+    Opens sessions for one batch of users and pushes to them with the providers' batch APIs.
+    With `resumed_since`, sessions the interrupted run opened but never pushed are pushed now.
+    """
+    # Scheduled pushes take what the classes above leave of the notifier
+    async with admission.admit(Priority.SCHEDULED_PUSH):
+        sessions = await asyncio.gather(*(security_check_sessions.open(email) for email, _ in users))
+        if resumed_since is not None and None in sessions:
+            unnotified = await security_check_sessions.find_unnotified(
+                [email for (email, _), session in zip(users, sessions) if session is None], resumed_since
+            )
+            sessions = [session or unnotified.get(email) for (email, _), session in zip(users, sessions)]
+
+        messages, owners, skipped = [], [], 0
+        for (email, token), session in zip(users, sessions):
+            if session is None:
+                skipped += 1  # already has a pending check
+                continue
+            owners.append((email, session["check_id"]))
+            messages.append({
+                "token": token,
+                "title": "🔐 ShieldX Security Check Required",
+                "body": "Enter your code to confirm you're safe. Tap to respond.",
+                "data": {"type": "security_check", "check_id": session["check_id"], "user_email": email}
+            })
+
+        results = await send_push_batch(messages, http_client) if messages else []
+
+        # Only sessions whose push was accepted can time out into an SOS.
+        await security_check_sessions.mark_notified([check_id for (_, check_id), ok in zip(owners, results) if ok])
+        undelivered = [owner for owner, ok in zip(owners, results) if not ok]
+        await asyncio.gather(*(
+            security_check_sessions.resolve(email, check_id, SecurityCheckStatus.UNDELIVERED)
+            for email, check_id in undelivered
+        ))
+        return {"sent": len(messages) - len(undelivered), "failed": len(undelivered), "skipped": skipped}
+
+async def initiate_hourly_security_check(slot: Optional[int] = None):
+    """
+    Streams eligible users in _id order from a projected cursor and pushes to
+    them batch by batch, with at most SECURITY_CHECK_PUSH_CONCURRENCY batches
+    in flight. Progress is checkpointed in job_runs after each batch, so an
+    interrupted run resumes from the last fully sent batch.
+
+    With `slot`, only users assigned to that schedule slot are checked (see
+    utils.security_check_schedule); without it every eligible user is.
+    """
+    job_id = SECURITY_CHECK_JOB_ID if slot is None else f"{SECURITY_CHECK_JOB_ID}:{slot}"
+    logger.info("Starting security check", extra={"slot": slot})
+    run, resumed = await _start_or_resume_run(job_id)
+    resumed_since = run["started_at"] if resumed else None
+    started = time.monotonic()
+    # A resumed run carries on from the totals checkpointed with its last_id.
+    totals = {key: run.get(key, 0) for key in ("sent", "failed", "skipped")}
+    carried_over = sum(totals.values())
+
+    query = dict(SECURITY_CHECK_ELIGIBILITY_FILTER)
+    if slot is not None:
+        query["securityCheckSlot"] = slot
+    if run.get("last_id") is not None:
+        query["_id"] = {"$gt": run["last_id"]}
+    cursor = user_collection.find(query, {"email": 1, "deviceToken.token": 1}) \
+        .sort("_id", 1).batch_size(SECURITY_CHECK_BATCH_SIZE)
+
+    in_flight = deque()  # (last _id in batch, task), oldest first
+
+    async def settle_oldest():
+        last_id, task = in_flight.popleft()
+        counts = await task
+        for key, value in counts.items():
+            totals[key] += value
+        # Every batch before this one has already been awaited, so last_id is a safe resume point.
+        await job_runs_collection.update_one(
+            {"_id": job_id, "run_id": run["run_id"]},
+            {"$set": {"last_id": last_id}, "$inc": counts}
+        )
+        processed = sum(totals.values())
+        elapsed = time.monotonic() - started
+        logger.info(f"Security check run {run['run_id']}: {processed} users processed "
+                    f"({totals['sent']} sent, {totals['failed']} failed), {(processed - carried_over) / elapsed:.0f} users/s")
+
+    async with httpx.AsyncClient(timeout=10) as http_client:
+        batch, last_id = [], None
+        async for user_doc in cursor:
+            user_email = user_doc.get("email")
+            device_token = (user_doc.get("deviceToken") or {}).get("token")
+            last_id = user_doc["_id"]
+            if user_email and device_token:
+                batch.append((user_email, device_token))
+            if len(batch) >= SECURITY_CHECK_BATCH_SIZE:
+                if len(in_flight) >= SECURITY_CHECK_PUSH_CONCURRENCY:
+                    await settle_oldest()
+                in_flight.append((last_id, asyncio.create_task(_send_security_check_batch(batch, http_client, resumed_since))))
+                batch = []
+        if batch:
+            in_flight.append((last_id, asyncio.create_task(_send_security_check_batch(batch, http_client, resumed_since))))
+        while in_flight:
+            await settle_oldest()
+
+    # Users who would still be pushed to without dead-token filtering
+    dead_token_query = {**SECURITY_CHECK_ELIGIBILITY_FILTER, "deviceToken.invalid": True}
+    if slot is not None:
+        dead_token_query["securityCheckSlot"] = slot
+    dead_tokens_skipped = await user_collection.count_documents(dead_token_query)
+    await record_skipped_sends(dead_tokens_skipped)
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "run_id": run["run_id"],
+        **totals,
+        "dead_tokens_skipped": dead_tokens_skipped,
+        "duration_seconds": round(elapsed, 2),
+        "users_per_second": round((sum(totals.values()) - carried_over) / elapsed, 1) if elapsed else None,
+    }
+    await job_runs_collection.update_one(
+        {"_id": job_id, "run_id": run["run_id"]},
+        {"$set": {"status": "completed", "finished_at": datetime.utcnow(), "summary": summary}}
+    )
+    if not any(totals.values()):
+        logger.info("No eligible users found for security check", extra={"slot": slot})
+    logger.info("Security check run finished", extra={"slot": slot, "summary": summary})
+    return summary
+
+# 🔁 2. BACKGROUND TASK FOR TIMEOUTS (wakes at the next check's deadline)
 async def periodic_check_task():
-    while True:
-        await asyncio.sleep(10)
-        await periodic_safety_check()
+    await security_check_sessions.load()
+    await security_check_sessions.run_timeout_loop(handle_security_check_timeout)
 
 # ⏰ 3. HANDLE 1-MINUTE TIMEOUT
-async def periodic_safety_check():
-    if not security_state["pending"]:
-        return
-
-    if time.time() - security_state["timestamp"] <= 60:
-        return  # still within 1 min
-
-    user_email = security_state["user_email_pending"]
-    print(f"🚨 Timeout! No response from {user_email}. Triggering SOS...")
+async def handle_security_check_timeout(user_email: str):
+    logger.warning("Security check timed out, triggering SOS", extra={"user_email": user_email})
 
-    user_doc = await user_collection.find_one({"email": user_email})
+    user_doc = await user_collection.find_one({"email": user_email}) or {}
     lat = user_doc.get("lastLocation", {}).get("latitude", 0.0)
     lng = user_doc.get("lastLocation", {}).get("longitude", 0.0)
 
     emergency_contacts = user_doc.get("emergencyContacts") or [os.getenv("EMERGENCY_CONTACT", "+917620101655")]
 
-    await trigger_sos(user_email, lat, lng, emergency_contacts)
+    await trigger_sos(user_email, lat, lng, emergency_contacts, reason=SOSReason.SECURITY_CHECK_TIMEOUT)
 
-    # 🔁 Reset
-    security_state.update({
-        "pending": False,
-        "timestamp": None,
-        "user_email_pending": None
-    })
+async def periodic_safety_check():
+    """One-off pass: times out every overdue check, including ones opened by other workers."""
+    await security_check_sessions.expire_due(handle_security_check_timeout)
+    await security_check_sessions.sweep_overdue(handle_security_check_timeout)
 
-# 🔐 4. VALIDATE CODE (called from UI)
 # 🔐 4. VALIDATE CODE (called from UI)
 async def check_security(code: str, user_email: str, emergency_contacts: List[str] = None):
-    if not security_state["pending"] or security_state["user_email_pending"] != user_email:
+    session = await security_check_sessions.get_pending(user_email)
+    if not session:
         raise HTTPException(status_code=400, detail="No active check for this user.")
 
     user_doc = await user_collection.find_one({"email": user_email})
@@ -107,24 +222,34 @@ async def check_security(code: str, user_email: str, emergency_contacts: List[st
     if not hashed_code:
         raise HTTPException(status_code=400, detail="Security code not set for this user.")
 
+    if not security_code_throttle.acquire(user_email):
+        raise HTTPException(
+            status_code=429, detail="Too many security code attempts.",
+            headers={"Retry-After": str(security_code_throttle.retry_after(user_email))}
+        )
     try:
-        is_valid = bcrypt.checkpw(code.encode(), hashed_code.encode())
+        # bcrypt takes 100-300 ms of CPU; run it in the process pool, never on the event loop.
+        is_valid = await cpu_executor.run(verify_bcrypt, code, hashed_code)
+    except CpuExecutorOverloaded:
+        raise HTTPException(status_code=503, detail="Server busy, try again.", headers={"Retry-After": "1"})
     except Exception as e:
-        print(f"❌ Error comparing code: {e}")
+        logger.error("Comparing security code failed", extra={"user_email": user_email, "error": str(e)})
         raise HTTPException(status_code=500, detail="Internal error.")
+    finally:
+        security_code_throttle.release(user_email)
 
     # ✅ If the code is correct
     if is_valid:
-        print(f"✅ Correct code for {user_email}")
-        security_state.update({
-            "pending": False,
-            "timestamp": None,
-            "user_email_pending": None
-        })
+        if not await security_check_sessions.resolve(user_email, session["check_id"], SecurityCheckStatus.PASSED):
+            raise HTTPException(status_code=409, detail="Security check already resolved.")
+        logger.info("Security check passed", extra={"user_email": user_email})
         return {"status": "success", "message": "✅ Access Granted"}
 
-    # ❌ If the code is wrong
-    print(f"🚨 Wrong code for {user_email} — Triggering SOS")
+    # ❌ If the code is wrong (only the request that resolves the session triggers SOS)
+    if not await security_check_sessions.resolve(user_email, session["check_id"], SecurityCheckStatus.FAILED):
+        raise HTTPException(status_code=409, detail="Security check already resolved.")
+
+    logger.warning("Wrong security code, triggering SOS", extra={"user_email": user_email})
 
     lat = user_doc.get("lastLocation", {}).get("latitude", 0.0)
     lng = user_doc.get("lastLocation", {}).get("longitude", 0.0)
@@ -133,16 +258,6 @@ async def check_security(code: str, user_email: str, emergency_contacts: List[st
     if not emergency_contacts or not isinstance(emergency_contacts, list) or not all(isinstance(c, str) for c in emergency_contacts):
         emergency_contacts = user_doc.get("emergencyContacts") or [os.getenv("EMERGENCY_CONTACT", "+917620101655")]
 
-    print(f"📡 Using emergency contacts: {emergency_contacts}")
-
-    await trigger_sos(user_email, lat, lng, emergency_contacts)
-
-    # Reset state
-    security_state.update({
-        "pending": False,
-        "timestamp": None,
-        "user_email_pending": None
-    })
+    await trigger_sos(user_email, lat, lng, emergency_contacts, reason=SOSReason.SECURITY_CHECK_FAILED)
 
     return {"status": "error", "message": "🚨 Wrong Code! SOS Triggered"}
-
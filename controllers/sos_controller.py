@@ -1,14 +1,25 @@
 from models.sos_history import SOSHistory
-from database import sos_history_collection
+from database import sos_history_archive_collection, sos_history_collection
 from utils.notifier import send_notification, play_alert_sound, is_valid_email, is_valid_phone
 from datetime import datetime
 from fastapi import BackgroundTasks
 import asyncio
 from models.sos import SOSStatus, SOSReason
 from typing import Optional
+from utils.admission import Priority, admission, mongo_write_gate
+from utils.archival import update_across_tiers
+from utils.geocoding import reverse_geocoder
 from utils.network import is_online
+from utils.sos_incidents import sos_incidents
+from utils.sos_stats import record_sos_alert, record_sos_response
+from utils.tracing import current_span, traced
+from bson import ObjectId
+import logging
 
-async def save_sos_history(user_id: str, lat: float, lon: float, contacts: list, status: str = "triggered", reason: Optional[str] = None): # Modified signature
+logger = logging.getLogger(__name__)
+
+async def save_sos_history(user_id: str, lat: float, lon: float, contacts: list, status: str = "triggered", reason: Optional[str] = None,
+                           incident_id=None):
     """
     Save SOS alert to database with user ID
     """
@@ -20,52 +31,153 @@ async def save_sos_history(user_id: str, lat: float, lon: float, contacts: list,
             "timestamp": datetime.utcnow(),
             "notifiedContacts": contacts,
             "status": status,
-            "reason": reason # Add reason to the document
+            "reason": reason, # Add reason to the document
+            "incident_id": incident_id
         }
 
-        result = await sos_history_collection.insert_one(sos_doc)
-        print(f"[Database] SOS history saved with ID: {result.inserted_id} for user: {user_id}")
+        async with mongo_write_gate.slot():
+            result = await sos_history_collection.insert_one(sos_doc)
+        logger.info("SOS history saved", extra={"user_id": user_id, "history_id": str(result.inserted_id)})
+        await record_sos_alert(user_id, reason, sos_doc["timestamp"])
         return str(result.inserted_id)
 
     except Exception as e:
-        print(f"[Database Error] Failed to save SOS history: {str(e)}")
+        logger.error("Saving SOS history failed", extra={"user_id": user_id, "error": str(e)})
         return None
-async def trigger_sos(user_id: str, lat: float, lon: float, contacts: list, background_tasks: BackgroundTasks):
-    print(f"🚨 SOS Triggered at ({lat}, {lon}) for contacts: {contacts}")
 
-    await play_alert_sound()
+async def add_contacts_to_sos_history(incident_id, contacts: list):
+    """Records contacts first alerted by a later trigger on the incident's history row."""
+    try:
+        await sos_history_collection.update_one(
+            {"incident_id": incident_id},
+            {"$addToSet": {"notifiedContacts": {"$each": contacts}}}
+        )
+    except Exception as e:
+        logger.error("Updating SOS history failed", extra={"incident_id": str(incident_id), "error": str(e)})
+
+# Monitor-raised alerts rank below an SOS someone actually asked for
+_ALERT_REASONS = {SOSReason.INACTIVITY_ALERT, SOSReason.ROUTE_MONITOR_ALERT}
+
+@traced("sos.trigger", root=True)
+async def trigger_sos(user_id: str, lat: float, lon: float, contacts: list, background_tasks: Optional[BackgroundTasks] = None,
+                      reason: SOSReason = SOSReason.MANUAL_SOS, status: SOSStatus = SOSStatus.ACTIVE):
+    async with admission.admit(Priority.INACTIVITY_ALERT if reason in _ALERT_REASONS else Priority.SOS):
+        return await _trigger_sos(user_id, lat, lon, contacts, background_tasks, reason)
+
+async def _trigger_sos(user_id: str, lat: float, lon: float, contacts: list, background_tasks: Optional[BackgroundTasks],
+                       reason: SOSReason):
+    logger.warning("SOS triggered", extra={"user_id": user_id, "reason": reason.value, "lat": lat, "lon": lon,
+                                           "contacts": len(contacts)})
+
+    # Triggers within the incident window join one incident: each contact is alerted
+    # once per incident, and later triggers only send throttled location follow-ups.
+    try:
+        async with mongo_write_gate.slot():
+            incident, opened = await sos_incidents.record_trigger(user_id, lat, lon, reason.value)
+        alert_contacts, followup_contacts = await sos_incidents.plan_notifications(incident, contacts)
+        incident_id = incident["_id"]
+    except Exception as e:
+        # Never hold back an alert because the incident store is unavailable.
+        logger.error("SOS incident tracking failed, alerting every contact", extra={"user_id": user_id, "error": str(e)})
+        opened, incident_id = True, None
+        alert_contacts, followup_contacts = list(contacts), []
+
+    sos_span = current_span()
+    if sos_span is not None:
+        sos_span.attributes.update(user_id=user_id, reason=reason.value, opened=opened,
+                                   alerted=len(alert_contacts), followups=len(followup_contacts))
+
+    # The address lookup (bounded by its latency budget) overlaps the alert sound
+    address_task = asyncio.create_task(reverse_geocoder.lookup(lat, lon))
+    if opened:
+        await play_alert_sound()
 
     location_link = f"https://www.google.com/maps?q={lat},{lon}"
-    sos_message = f"🚨 EMERGENCY: {user_id} needs help! Location: {location_link}"
+    address = await address_task
+    near = f" Near {address}." if address else ""
+    sos_message = f"🚨 EMERGENCY: {user_id} needs help!{near} Location: {location_link}"
+    followup_message = f"📍 UPDATE: {user_id} still needs help ({reason.value}).{near} Latest location: {location_link}"
 
     network_status = await is_online()
     notification_tasks = []
+    notified = []
 
-    for contact in contacts:
+    for contact, message in [(c, sos_message) for c in alert_contacts] + [(c, followup_message) for c in followup_contacts]:
         if is_valid_phone(contact):
-            task = send_notification(contact, sos_message, network_status)
+            task = send_notification(contact, message, network_status)
             notification_tasks.append(task)
+            notified.append(contact)
         elif is_valid_email(contact):
             pass # Email sending placeholder
 
     if notification_tasks:
-        await asyncio.gather(*notification_tasks)
-
-    # 4️⃣ Save to Database (can be done in background)
-    background_tasks.add_task(
-        save_sos_history,
-        user_id=user_id,
-        lat=lat,
-        lon=lon,
-        contacts=contacts,
-        status="triggered",
-        reason=SOSReason.MANUAL_SOS.value # Pass the reason here
-    )
+        # Only a provider-accepted send ("✅") counts; a raised send (e.g. shed by the notifier gate) failed too.
+        results = await asyncio.gather(*notification_tasks, return_exceptions=True)
+        failed = [contact for contact, result in zip(notified, results)
+                  if isinstance(result, Exception) or not str(result).startswith("✅")]
+        if failed and sos_span is not None:
+            # Failed SOS traces are always kept by the tail sampler.
+            sos_span.fail(f"{len(failed)} of {len(results)} notifications failed")
+        # Contacts whose first alert did not go out are not "alerted": the next trigger claims them again.
+        unalerted = [contact for contact in failed if contact in alert_contacts]
+        if unalerted:
+            alert_contacts = [contact for contact in alert_contacts if contact not in unalerted]
+            if incident_id is not None:
+                try:
+                    await sos_incidents.release_alerts(incident_id, unalerted)
+                except Exception as e:
+                    logger.error("Releasing SOS alert claims failed", extra={"user_id": user_id, "error": str(e)})
+
+    # 4️⃣ Save to Database: one history row per incident (in the request's background tasks when called from an endpoint)
+    if opened:
+        history_task, history_kwargs = save_sos_history, dict(
+            user_id=user_id,
+            lat=lat,
+            lon=lon,
+            contacts=alert_contacts,
+            status="triggered",
+            reason=reason.value, # Pass the reason here
+            incident_id=incident_id
+        )
+    elif alert_contacts:
+        history_task, history_kwargs = add_contacts_to_sos_history, dict(incident_id=incident_id, contacts=alert_contacts)
+    else:
+        history_task = None
+    if history_task is not None:
+        if background_tasks is not None:
+            background_tasks.add_task(history_task, **history_kwargs)
+        else:
+            await history_task(**history_kwargs)
 
-    print("✅ SOS process completed successfully.")
+    logger.info("SOS process completed", extra={
+        "user_id": user_id, "incident_id": str(incident_id) if incident_id else None, "opened": opened,
+        "alerted": len(alert_contacts), "followups": len(followup_contacts)})
 
     return {
         "message": "SOS triggered successfully!",
         "contacts_notified": contacts,
+        "contacts_alerted": alert_contacts,
+        "contacts_followed_up": followup_contacts,
+        "incident_id": str(incident_id) if incident_id is not None else None,
+        "coalesced": not opened,
         "notification_mode": "Online Mode" if network_status else "Offline Mode"
     }
+
+async def resolve_sos_incident(incident_id: str):
+    """
+    Marks an SOS incident (and its history row) resolved and adds its
+    trigger-to-resolution time to the user's stats. None if there was nothing to resolve.
+    """
+    if not ObjectId.is_valid(incident_id):
+        return None
+    incident = await sos_incidents.resolve(ObjectId(incident_id))
+    if incident is None:
+        return None
+    response_seconds = (incident["resolved_at"] - incident["opened_at"]).total_seconds()
+    await update_across_tiers(
+        sos_history_collection, sos_history_archive_collection,
+        {"incident_id": incident["_id"]},
+        {"$set": {"status": "resolved", "resolved_at": incident["resolved_at"]}}
+    )
+    await record_sos_response(incident["user_id"], response_seconds)
+    return {"incident_id": incident_id, "user_id": incident["user_id"], "response_seconds": response_seconds}
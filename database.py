@@ -1,61 +1,332 @@
 import logging
 import datetime
+import asyncio
+import threading
+from typing import Dict, List, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ASCENDING
+from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, ReadPreference, WriteConcern, monitoring
+from pymongo.errors import OperationFailure
+from pymongo.read_concern import ReadConcern
 import os
 from dotenv import load_dotenv
 
+from utils.metrics import mongo_command_metrics
+from utils.tracing import mongo_tracing_listener
+
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+# MONGO_URI is still honoured for deployments that configured the old route tracker client.
+MONGO_URL = os.getenv("MONGO_URL") or os.getenv("MONGO_URI") or "mongodb://localhost:27017"
 DB_NAME = os.getenv("DB_NAME", "ShieldX")
 
-client = AsyncIOMotorClient(MONGO_URL)
+# Connection pool tuning
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+
+class PoolWaitListener(monitoring.ConnectionPoolListener):
+    """
+    Records how long operations wait to check a connection out of the pool.
+    A rising wait time means maxPoolSize is too small for the workload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.checked_out = 0
+
+    def connection_checked_out(self, event):
+        wait = event.duration or 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.total_wait_seconds += wait
+            if wait > self.max_wait_seconds:
+                self.max_wait_seconds = wait
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checked_out": self.checked_out,
+                "wait_seconds_total": round(self.total_wait_seconds, 6),
+                "wait_seconds_mean": round(self.total_wait_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_seconds_max": round(self.max_wait_seconds, 6),
+            }
+
+    # Remaining pool events are not needed for the wait-time metric.
+    def connection_check_out_started(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+
+
+pool_wait_listener = PoolWaitListener()
+
+# One client (and therefore one pool) per URL for the whole process.
+_clients: Dict[str, AsyncIOMotorClient] = {}
+
+
+def get_mongo_client(url: str = MONGO_URL) -> AsyncIOMotorClient:
+    """Return the shared Motor client for `url`, creating it on first use."""
+    if url not in _clients:
+        _clients[url] = AsyncIOMotorClient(
+            url,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            event_listeners=[pool_wait_listener, mongo_command_metrics, mongo_tracing_listener],
+        )
+    return _clients[url]
+
+
+client = get_mongo_client()
 db = client[DB_NAME]
 
+_sync_client = None
+
+
+def get_sync_mongo_client() -> MongoClient:
+    """
+    Small blocking pymongo client for libraries that cannot use Motor
+    (APScheduler's MongoDBJobStore). Keep request-path I/O on `client`.
+    """
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = MongoClient(MONGO_URL, maxPoolSize=4, minPoolSize=0)
+    return _sync_client
+
+# Read/write concern presets per workload
+WORKLOAD_PRESETS = {
+    # SOS records must survive a primary failover.
+    "critical": {
+        "write_concern": WriteConcern(w="majority", j=True),
+        "read_concern": ReadConcern("majority"),
+        "read_preference": ReadPreference.PRIMARY,
+    },
+    # Journey state read back by the monitor; primary acknowledgement is enough.
+    "realtime": {
+        "write_concern": WriteConcern(w=1),
+        "read_concern": ReadConcern("local"),
+        "read_preference": ReadPreference.PRIMARY,
+    },
+    # High-rate location fixes; losing one on failover is acceptable.
+    "telemetry": {
+        "write_concern": WriteConcern(w=1, j=False),
+        "read_concern": ReadConcern("local"),
+        "read_preference": ReadPreference.PRIMARY_PREFERRED,
+    },
+    # History and stats reads that tolerate slight staleness.
+    "reporting": {
+        "write_concern": WriteConcern(w=1),
+        "read_concern": ReadConcern("local"),
+        "read_preference": ReadPreference.SECONDARY_PREFERRED,
+    },
+}
+
+
+def get_collection(name: str, workload: str = "realtime"):
+    """Return a collection handle on the shared client with the workload's concern preset."""
+    return db.get_collection(name, **WORKLOAD_PRESETS[workload])
+
+
 # Collections
-sos_history_collection = db["sos_history"]
-route_collection = db["route"] # This collection was already defined by the user
-location_collection = db["locations"]
-user_collection = db["users"]  # This is the Mongoose-managed user collection
-user_routes_collection = db["user_routes"] # <-- NEW: User Route Collection
+sos_history_collection = get_collection("sos_history", "critical")
+sos_incidents_collection = get_collection("sos_incidents", "critical") # Coalesced SOS triggers, see utils.sos_incidents
+sos_user_stats_collection = get_collection("sos_user_stats") # Per-user SOS aggregates maintained on write, keyed by user_id
+route_collection = get_collection("route") # This collection was already defined by the user
+location_collection = get_collection("locations", "telemetry")
+user_collection = get_collection("users")  # This is the Mongoose-managed user collection
+user_routes_collection = get_collection("user_routes") # Journeys: written by /share_route, read by the route monitor
+security_checks_collection = get_collection("security_checks", "critical") # One security-check session per user
+job_runs_collection = get_collection("job_runs") # Progress of long-running background jobs, keyed by job id
+sms_messages_collection = get_collection("sms_messages") # Outbound SMS keyed by provider message id, updated by delivery callbacks
+push_tickets_collection = get_collection("push_tickets") # Expo push tickets awaiting receipts, see utils.push_receipts
+leases_collection = get_collection("leases", "critical") # Leader-election leases, one document per lease name
+geocode_cache_collection = get_collection("geocode_cache") # Reverse-geocoded addresses keyed by geohash, see utils.geocoding
+SCHEDULER_JOBS_COLLECTION = "scheduler_jobs" # APScheduler's persistent job store (written by pymongo, not Motor)
+
+# Cold tier: finished journeys and old SOS rows moved out of the hot collections by utils.archival
+user_routes_archive_collection = get_collection("user_routes_archive", "reporting")
+sos_history_archive_collection = get_collection("sos_history_archive", "reporting")
+
+# Raw sos_history expiry: "archive" moves rows older than the retention window
+# to sos_history_archive, "delete" lets a TTL index drop them, "keep" does neither.
+SOS_HISTORY_EXPIRY = os.getenv("SOS_HISTORY_EXPIRY", "archive")
+SOS_HISTORY_RETENTION_DAYS = int(os.getenv("SOS_HISTORY_RETENTION_DAYS", "180"))
+# Cached addresses are refreshed from the provider after this long.
+GEOCODE_CACHE_TTL_DAYS = int(os.getenv("GEOCODE_CACHE_TTL_DAYS", "30"))
+
+
+async def warm_up_mongo_pool():
+    """
+    Ping the server and open MONGO_MIN_POOL_SIZE connections up front so the
+    first requests after startup do not pay for connection handshakes.
+    """
+    await client.admin.command("ping")
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(MONGO_MIN_POOL_SIZE)))
+    logger.info(f"MongoDB pool warmed up with {MONGO_MIN_POOL_SIZE} connections.")
+
+
+def get_pool_stats() -> dict:
+    """Connection pool settings and checkout wait-time counters."""
+    return {
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        **pool_wait_listener.snapshot(),
+    }
 
 # JSON Schema validation rules for collections
 # (JSON schema definitions would go here if you use them for validation at the DB level)
 
 
-# Create indexes for faster queries
-async def setup_indexes():
-    # Create index on user_id for SOS history
-    await sos_history_collection.create_index([("user_id", ASCENDING)])
+class IndexSpec:
+    """
+    One index `setup_indexes` keeps in place. `replaces` names superseded
+    indexes that are dropped once this one exists.
+    """
+    __slots__ = ("collection", "keys", "options", "replaces")
+
+    def __init__(self, collection: str, keys: List[Tuple[str, int]], replaces: Tuple[str, ...] = (), **options):
+        self.collection = collection
+        self.keys = keys
+        self.options = options
+        self.replaces = replaces
+
+    @property
+    def name(self) -> str:
+        return self.options.get("name") or "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+def _sos_history_timestamp_options() -> dict:
+    """Plain timestamp index, or a TTL index when SOS_HISTORY_EXPIRY is "delete"."""
+    if SOS_HISTORY_EXPIRY != "delete":
+        return {}
+    return {"expireAfterSeconds": SOS_HISTORY_RETENTION_DAYS * 24 * 3600}
+
+
+# Every index the service relies on. Hot query shapes that must be served by
+# one of these are listed in utils.index_advisor.HOT_QUERIES.
+INDEXES: List[IndexSpec] = [
+    # SOS history per user, newest first; _id breaks timestamp ties for keyset pagination.
+    # The prefix also serves plain user_id lookups, so the old single-field index goes.
+    IndexSpec("sos_history", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+              replaces=("user_id_1",)),
+    # Later triggers of an incident update its history row
+    IndexSpec("sos_history", [("incident_id", ASCENDING)], sparse=True),
+    # Retention: the archival scan, or the TTL itself when SOS_HISTORY_EXPIRY is "delete"
+    IndexSpec("sos_history", [("timestamp", ASCENDING)], **_sos_history_timestamp_options()),
 
-    # Create index on timestamp for SOS history (for sorting by recency)
-    await sos_history_collection.create_index([("timestamp", ASCENDING)])
+    # At most one open SOS incident per user; concurrent triggers coalesce on it
+    IndexSpec("sos_incidents", [("user_id", ASCENDING)], unique=True, name="one_open_incident_per_user",
+              partialFilterExpression={"status": "open"}),
+    IndexSpec("sos_incidents", [("user_id", ASCENDING), ("opened_at", DESCENDING)]),
 
-    # Create compound index for user location history
-    await location_collection.create_index([
-        ("user_id", ASCENDING),
-        ("timestamp", ASCENDING)
-    ])
+    # User location history
+    IndexSpec("locations", [("user_id", ASCENDING), ("timestamp", ASCENDING)]),
 
-    # NEW: Indexes for user_routes collection
-    await user_routes_collection.create_index([("user_id", ASCENDING)])
-    await user_routes_collection.create_index([("journey_id", ASCENDING)], unique=True) # Assuming journey_id is unique per route
-    await user_routes_collection.create_index([("status", ASCENDING)])
-    await user_routes_collection.create_index([("last_updated_at", ASCENDING)])
+    # Journeys: written by /share_route, read by the route monitor and the history API.
+    # The single-field user_id/status/last_updated_at indexes are prefixes of the compound ones.
+    IndexSpec("user_routes", [("journey_id", ASCENDING)], unique=True),
+    # Active-journey lookup: equality on user_id/status, newest fix first
+    IndexSpec("user_routes", [("user_id", ASCENDING), ("status", ASCENDING), ("last_updated_at", DESCENDING)],
+              replaces=("user_id_1",)),
+    # Journey history: every status for one user, newest first with _id as the tie-break
+    IndexSpec("user_routes", [("user_id", ASCENDING), ("last_updated_at", DESCENDING), ("_id", DESCENDING)]),
+    # Registry load (status == running) and the archival scan (terminal status, older than cutoff)
+    IndexSpec("user_routes", [("status", ASCENDING), ("last_updated_at", ASCENDING)],
+              replaces=("status_1", "last_updated_at_1")),
 
-    # Mongoose uses '_id' as the primary key. If you have a separate 'user_id' field,
-    # make sure it's indexed. Mongoose also typically creates an index on 'email' for unique.
-    # Assuming Mongoose handles 'email' unique index. If your Python code also refers to a
-    # generic 'user_id' string, you might add this if not managed by Mongoose:
-    # await user_collection.create_index([("user_id", ASCENDING)], unique=True)
-    # The Mongoose schema uses 'email' as unique identifier, so we might need to query by email instead of 'user_id' string.
-    await user_collection.create_index([("email", ASCENDING)], unique=True)  # Ensure index on email for quick lookup
+    # Security-check sessions: one per user, overdue sweep by status/deadline
+    IndexSpec("security_checks", [("user_email", ASCENDING)], unique=True),
+    IndexSpec("security_checks", [("status", ASCENDING), ("expires_at", ASCENDING)]),
+
+    # Archive tier, read newest first per user in the same order as the hot tier
+    IndexSpec("user_routes_archive", [("journey_id", ASCENDING)], unique=True),
+    IndexSpec("user_routes_archive", [("user_id", ASCENDING), ("last_updated_at", DESCENDING), ("_id", DESCENDING)],
+              replaces=("user_id_1_last_updated_at_-1",)),
+    IndexSpec("sos_history_archive", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+              replaces=("user_id_1_timestamp_-1",)),
+
+    # The Mongoose schema uses 'email' as the unique identifier
+    IndexSpec("users", [("email", ASCENDING)], unique=True),
+    # Dead-token invalidation looks users up by token value
+    IndexSpec("users", [("deviceToken.token", ASCENDING)], sparse=True),
+    # Each slotted security check walks its slot's enabled users in _id order...
+    IndexSpec("users", [("isSecurityCheckEnabled", ASCENDING), ("securityCheckSlot", ASCENDING), ("_id", ASCENDING)]),
+    # ...and an unslotted run walks every enabled user in _id order
+    IndexSpec("users", [("isSecurityCheckEnabled", ASCENDING), ("_id", ASCENDING)]),
+
+    # Callbacks update SMS by _id; this serves the sweep for emergency SMS that never got a final report
+    IndexSpec("sms_messages", [("emergency", ASCENDING), ("status_rank", ASCENDING), ("created_at", ASCENDING)]),
+    # Receipts are fetched for pending tickets oldest first; settled ones expire after two days
+    IndexSpec("push_tickets", [("status", ASCENDING), ("sent_at", ASCENDING)]),
+    IndexSpec("push_tickets", [("sent_at", ASCENDING)], expireAfterSeconds=2 * 24 * 3600),
+    # Reverse-geocode cache entries are looked up by _id (the geohash) and expire
+    IndexSpec("geocode_cache", [("cached_at", ASCENDING)], expireAfterSeconds=GEOCODE_CACHE_TTL_DAYS * 24 * 3600),
+]
+
+
+async def setup_indexes(database=None):
+    """
+    Creates every index in INDEXES and drops the ones they supersede. Safe to
+    run on every startup: existing indexes with the same spec are left alone.
+    """
+    database = database if database is not None else db
+    for spec in INDEXES:
+        await _ensure_index(database, spec)
+        for index_name in spec.replaces:
+            await _drop_index_if_exists(database[spec.collection], index_name)
+    if SOS_HISTORY_EXPIRY == "delete":
+        logger.info(f"sos_history TTL set to {SOS_HISTORY_RETENTION_DAYS} days.")
 
     logger.info("Database indexes created successfully")
 
+async def _ensure_index(database, spec: IndexSpec):
+    """
+    An existing index can't be recreated with different options, so a changed
+    TTL is applied with collMod instead. Removing a TTL has to be done by hand.
+    """
+    collection = database[spec.collection]
+    try:
+        await collection.create_index(spec.keys, **spec.options)
+    except OperationFailure:
+        if "expireAfterSeconds" not in spec.options:
+            raise
+        await database.command(
+            "collMod", spec.collection,
+            index={"keyPattern": dict(spec.keys), "expireAfterSeconds": spec.options["expireAfterSeconds"]}
+        )
+
+async def _drop_index_if_exists(collection, index_name: str):
+    try:
+        await collection.drop_index(index_name)
+        logger.info(f"Dropped superseded index {collection.name}.{index_name}")
+    except OperationFailure:
+        pass  # IndexNotFound / NamespaceNotFound: nothing to drop
+
 # --- Device Token Operations (Modified for Mongoose Schema) ---
 
 async def save_device_token(user_identifier: str, token: str, token_type: str = "expo"):
@@ -76,6 +347,12 @@ async def save_device_token(user_identifier: str, token: str, token_type: str =
                 },
                 "$setOnInsert": {
                     "deviceToken.registered_at": current_time,
+                },
+                # A (re-)registered token is live again until a provider says otherwise
+                "$unset": {
+                    "deviceToken.invalid": "",
+                    "deviceToken.invalid_reason": "",
+                    "deviceToken.invalidated_at": ""
                 }
             },
             upsert=False
@@ -92,6 +369,52 @@ async def save_device_token(user_identifier: str, token: str, token_type: str =
         logger.error(f"Error saving device token for {user_identifier}: {e}")
         raise
 
+async def mark_device_tokens_invalid(tokens: list, reason: str) -> int:
+    """
+    Flags push tokens a provider reported as permanently dead, so fan-out jobs
+    stop sending to them. Matches on the token value: a user who has since
+    registered a new token is left alone. Returns how many users were flagged.
+    """
+    try:
+        update_result = await user_collection.update_many(
+            {"deviceToken.token": {"$in": list(tokens)}, "deviceToken.invalid": {"$ne": True}},
+            {"$set": {
+                "deviceToken.invalid": True,
+                "deviceToken.invalid_reason": reason,
+                "deviceToken.invalidated_at": datetime.datetime.utcnow()
+            }}
+        )
+        if update_result.modified_count:
+            logger.info(f"Marked {update_result.modified_count} device tokens invalid ({reason}).")
+        return update_result.modified_count
+    except Exception as e:
+        logger.error(f"Error marking device tokens invalid: {e}")
+        return 0
+
+async def record_outbound_sms(message_id: str, provider: str, to: str, body: str, emergency: bool,
+                              attempt: int = 1, retry_of: str | None = None):
+    """
+    Stores an SMS the provider accepted, keyed by the provider's message id,
+    so delivery callbacks can be applied to it without a lookup.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        await sms_messages_collection.insert_one({
+            "_id": message_id,
+            "provider": provider,
+            "to": to,
+            "body": body,
+            "emergency": emergency,
+            "attempt": attempt,
+            "retry_of": retry_of,
+            "status": "queued",
+            "status_rank": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+    except Exception as e:
+        logger.error(f"Error recording outbound SMS {message_id}: {e}")
+
 async def get_device_token(user_identifier: str) -> str | None:
     """
     Retrieves a device token for a user from their user document.
@@ -111,6 +434,11 @@ async def get_device_token(user_identifier: str) -> str | None:
 
 # Optional: Function to close the client explicitly if needed
 def close_mongo_client():
-    if client:
-        client.close()
-        logger.info("MongoDB client closed.")
\ No newline at end of file
+    for mongo_client in _clients.values():
+        mongo_client.close()
+    _clients.clear()
+    global _sync_client
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+    logger.info("MongoDB client closed.")
\ No newline at end of file
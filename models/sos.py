@@ -17,6 +17,8 @@ class SOSReason(str, Enum):
     # GEOFENCE_BREACH = "Geofence Breach"     # Triggered if user leaves a defined safe zone
     ROUTE_MONITOR_ALERT = "Route Monitor Alert" # General alert from route monitoring
     LOCATION_ALERT = "Location Alert"       # General alert from location tracking
+    SECURITY_CHECK_FAILED = "Security Check Failed"    # Wrong code entered for a security check
+    SECURITY_CHECK_TIMEOUT = "Security Check Timeout"  # Security check not answered in time
     # EMERGENCY_BUTTON = "Emergency Button"   # Specific for physical/software emergency button
     # CRITICAL_BATTERY = "Critical Battery"   # If triggered by low device battery
 
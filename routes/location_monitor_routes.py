@@ -1,6 +1,6 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from controllers import location_monitor_controller
+from utils.route_tracker import update_user_current_location
 
 location_mon_router = APIRouter()
 
@@ -12,11 +12,13 @@ class LocationUpdateRequest(BaseModel):
 
 @location_mon_router.post("/update_location")
 async def update_user_location(request: LocationUpdateRequest):
-    result = await location_monitor_controller.update_location_and_monitor(
-        request.user_id,
-        request.lat,
-        request.lng,
-        request.journey_id
-    )
-    return {"status": result}
-
+    try:
+        await update_user_current_location(
+            request.user_id,
+            request.lat,
+            request.lng,
+            request.journey_id
+        )
+        return {"status": "Location updated successfully."}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update location: {e}")
@@ -1,10 +1,17 @@
 # controllers/periodic_check_router.py (Revised)
+import logging
+
 from fastapi import APIRouter, Body, HTTPException
-from pydantic import BaseModel
-# Import the updated check_security and security_state
-from controllers.periodic_check_controller import check_security, initiate_hourly_security_check, security_state
+from pydantic import BaseModel, Field
+from typing import Optional
+from controllers.periodic_check_controller import check_security, initiate_hourly_security_check
+from utils.security_check_sessions import SecurityCheckStatus, security_check_sessions
+from utils.journey_registry import to_epoch
+from utils.security_check_schedule import hashed_slot, slot_for_minute
 from database import user_collection # Import user_collection
 
+logger = logging.getLogger(__name__)
+
 periodic_router = APIRouter()
 
 # --- MODIFIED: SecurityCodeRequest to include user_email ---
@@ -15,6 +22,8 @@ class SecurityCodeRequest(BaseModel):
 class SecurityCheckToggleRequest(BaseModel):
     email: str
     enabled: bool
+    # Minute past the hour the user wants to be checked; a stable hashed slot is used when omitted.
+    slot_minute: Optional[int] = Field(default=None, ge=0, le=59)
 
 @periodic_router.post("/security-check")
 async def security_check_endpoint(request: SecurityCodeRequest): # Renamed to avoid clash with function
@@ -23,11 +32,18 @@ async def security_check_endpoint(request: SecurityCodeRequest): # Renamed to av
     return await check_security(request.code, request.user_email)
 
 @periodic_router.get("/security-check-status")
-async def security_check_status():
-    """Return the current security check status."""
-    return {"pending": security_state["pending"],
-            "timestamp": security_state["timestamp"],
-            "user_email_pending": security_state["user_email_pending"]}
+async def security_check_status(user_email: str):
+    """Return the security check status for one user."""
+    session = await security_check_sessions.get(user_email)
+    if not session:
+        return {"pending": False, "timestamp": None, "user_email_pending": None, "status": None}
+    pending = session["status"] == SecurityCheckStatus.PENDING
+    return {"pending": pending,
+            "timestamp": to_epoch(session["issued_at"]),
+            "expires_at": to_epoch(session["expires_at"]),
+            "check_id": session["check_id"],
+            "status": session["status"],
+            "user_email_pending": user_email if pending else None}
 
 @periodic_router.post("/trigger-security-check")
 async def trigger_security_check_manual():
@@ -42,9 +58,15 @@ async def toggle_security_check_feature(request: SecurityCheckToggleRequest):
     Allows a user to enable or disable the continuous security check feature.
     """
     try:
+        update_fields = {"isSecurityCheckEnabled": request.enabled}
+        if request.enabled:
+            update_fields["securityCheckSlot"] = (
+                hashed_slot(request.email) if request.slot_minute is None
+                else slot_for_minute(request.slot_minute)
+            )
         update_result = await user_collection.update_one(
             {"email": request.email},
-            {"$set": {"isSecurityCheckEnabled": request.enabled}}
+            {"$set": update_fields}
         )
         if update_result.matched_count == 0:
             raise HTTPException(status_code=404, detail=f"User with email {request.email} not found.")
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+import logging
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
 from pydantic import BaseModel
 from utils.route_tracker import initialize_user_tracking
+from utils.archival import decode_cursor, encode_cursor, find_journeys
 
 share_router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class RouteShareRequest(BaseModel):
     user_id: str
@@ -28,12 +32,30 @@ async def start_route_tracking(request: RouteShareRequest, background_tasks: Bac
             "status": "success",
             "message": "Route tracking initialized successfully!",
             "user_id": request.user_id,
-            "journey_id": journey_id,  # 👈 returned from Mongo
+            "journey_id": journey_id,
             "start_point": {"latitude": request.start_lat, "longitude": request.start_lng},
             "end_point": {"latitude": request.end_lat, "longitude": request.end_lng},
             "emergency_contacts": request.emergency_contacts
         }
 
     except Exception as e:
-        print(f"Error initializing route tracking for user {request.user_id}: {e}")
+        logger.error("Initializing route tracking failed", extra={"user_id": request.user_id, "error": str(e)})
         raise HTTPException(status_code=500, detail=f"Failed to initialize route tracking: {e}")
+
+@share_router.get("/journeys/{user_id}")
+async def list_user_journeys(user_id: str, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    """
+    Lists a user's journeys newest first, including ones already moved to the archive.
+    Pass `next_cursor` from the previous response as `cursor` to page further back.
+    """
+    try:
+        before, before_id = decode_cursor(cursor) if cursor else (None, None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    journeys = await find_journeys(user_id, limit + 1, before, before_id)  # one extra to know if there's a next page
+    has_more = len(journeys) > limit
+    journeys = journeys[:limit]
+    next_cursor = encode_cursor(journeys[-1], "last_updated_at") if has_more else None
+    for journey in journeys:
+        journey["_id"] = str(journey["_id"])
+    return {"user_id": user_id, "journeys": journeys, "next_cursor": next_cursor}
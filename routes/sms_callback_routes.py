@@ -0,0 +1,75 @@
+import hmac
+import logging
+import os
+from urllib.parse import parse_qsl
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import BaseModel
+from twilio.request_validator import RequestValidator
+from typing import Optional
+
+from utils.notifier import SMS_STATUS_CALLBACK_URL
+from utils.sms_delivery import STATUS_RANK, delivery_reports
+
+logger = logging.getLogger(__name__)
+
+sms_callback_router = APIRouter()
+
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+# Shared secret other providers (or the replay stub) send in X-Callback-Token.
+SMS_CALLBACK_SECRET = os.getenv("SMS_CALLBACK_SECRET")
+
+twilio_validator = RequestValidator(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else None
+
+
+def warn_if_callbacks_unauthenticated():
+    """Startup check: callbacks without a configured secret are refused, so say which ones."""
+    if twilio_validator is None:
+        logger.warning("TWILIO_AUTH_TOKEN is not set; Twilio delivery callbacks will be rejected with 503.")
+    if not SMS_CALLBACK_SECRET:
+        logger.warning("SMS_CALLBACK_SECRET is not set; provider delivery callbacks will be rejected with 503.")
+
+
+class DeliveryReport(BaseModel):
+    message_id: str
+    status: str
+    error_code: Optional[str] = None
+
+
+def _accept(message_id: str, status: str, error_code: Optional[str]) -> Response:
+    if not message_id or status not in STATUS_RANK:
+        raise HTTPException(status_code=400, detail="Missing message id or unknown status.")
+    if not delivery_reports.add(message_id, status, error_code):
+        raise HTTPException(status_code=503, detail="Delivery report buffer full.", headers={"Retry-After": "5"})
+    return Response(status_code=204)
+
+
+@sms_callback_router.post("/sms/status/twilio")
+async def twilio_status_callback(request: Request):
+    """Twilio StatusCallback: form-encoded, signed with X-Twilio-Signature."""
+    if twilio_validator is None:
+        raise HTTPException(status_code=503, detail="Twilio callbacks are not configured.")
+    body = (await request.body()).decode()
+    params = dict(parse_qsl(body, keep_blank_values=True))
+    signature = request.headers.get("X-Twilio-Signature", "")
+    # Twilio signs the public URL it was given; behind the TLS-terminating proxy request.url is the internal one.
+    signed_url = SMS_STATUS_CALLBACK_URL or str(request.url)
+    if not twilio_validator.validate(signed_url, params, signature):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature.")
+    return _accept(params.get("MessageSid"), params.get("MessageStatus"), params.get("ErrorCode") or None)
+
+
+@sms_callback_router.post("/sms/status/{provider}")
+async def provider_status_callback(provider: str, report: DeliveryReport, request: Request):
+    """Delivery report from any other provider (or the replay stub), normalised to Twilio's status names."""
+    if not SMS_CALLBACK_SECRET:
+        raise HTTPException(status_code=503, detail="Delivery callbacks are not configured.")
+    if not hmac.compare_digest(request.headers.get("X-Callback-Token", ""), SMS_CALLBACK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid callback token.")
+    return _accept(report.message_id, report.status.lower(), report.error_code)
+
+
+@sms_callback_router.get("/sms/status/stats")
+async def delivery_report_stats():
+    """Callback buffer depth and counters for this worker."""
+    return delivery_reports.stats()
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
 from pydantic import BaseModel, Field
-from controllers.sos_controller import trigger_sos
+from typing import Optional
+from controllers.sos_controller import trigger_sos, resolve_sos_incident
+from utils.archival import decode_cursor, encode_cursor, find_sos_history
+from utils.sos_stats import get_sos_stats
 import asyncio
 
 sos_router = APIRouter()
@@ -39,4 +42,37 @@ async def sos_alert(request: LocationRequest, background_tasks: BackgroundTasks)
         }
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@sos_router.get("/sos/history/{user_id}")
+async def sos_history(user_id: str, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    """
+    Lists a user's SOS alerts newest first, including archived ones.
+    Pass `next_cursor` from the previous response as `cursor` to page further back.
+    """
+    try:
+        before, before_id = decode_cursor(cursor) if cursor else (None, None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    alerts = await find_sos_history(user_id, limit + 1, before, before_id)  # one extra to know if there's a next page
+    has_more = len(alerts) > limit
+    alerts = alerts[:limit]
+    next_cursor = encode_cursor(alerts[-1], "timestamp") if has_more else None
+    for alert in alerts:
+        alert["_id"] = str(alert["_id"])
+        if alert.get("incident_id") is not None:
+            alert["incident_id"] = str(alert["incident_id"])
+    return {"user_id": user_id, "alerts": alerts, "next_cursor": next_cursor}
+
+@sos_router.get("/sos/stats/{user_id}")
+async def sos_stats(user_id: str):
+    """Precomputed SOS totals, per-reason counts, last alert and mean response time for a user."""
+    return await get_sos_stats(user_id)
+
+@sos_router.post("/sos/incidents/{incident_id}/resolve")
+async def resolve_incident(incident_id: str):
+    """Marks an SOS incident as over; its response time feeds the user's stats."""
+    result = await resolve_sos_incident(incident_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No unresolved incident with this id.")
+    return {"status": "success", **result}
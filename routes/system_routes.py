@@ -0,0 +1,155 @@
+import hmac
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from database import db, get_pool_stats
+from utils.admission import admission_stats
+from utils.cpu_executor import cpu_executor
+from utils.geocoding import reverse_geocoder
+from utils.index_advisor import index_report
+from utils.loop_watchdog import loop_watchdog
+from utils.metrics import CONTENT_TYPE, metrics
+from utils.periodic_check_scheduler import list_jobs
+from utils.profiler import profiler
+from utils.push_receipts import get_push_health
+from utils.structured_logging import get_log_levels, set_log_level
+from utils.tracing import tracer
+
+system_router = APIRouter()
+
+# Shared secret for the endpoints that change a worker's behaviour or put load on the database.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: set ADMIN_TOKEN.")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+admin_only = [Depends(require_admin_token)]
+
+
+@system_router.get("/system/db-pool")
+async def db_pool_stats():
+    """MongoDB connection pool settings and checkout wait-time counters."""
+    return get_pool_stats()
+
+@system_router.get("/system/cpu-executor")
+async def cpu_executor_stats():
+    """CPU process pool size, queue depth and rejection counters."""
+    return cpu_executor.stats()
+
+@system_router.get("/system/admission")
+async def admission_state():
+    """Per priority class: limits, in-flight work, queue depth and rejections, for admission and each shared resource."""
+    return admission_stats()
+
+@system_router.get("/system/geocoding")
+async def geocoding_stats():
+    """Reverse-geocode lookups answered by each cache level, the provider and the gazetteer, and the hit rate."""
+    return reverse_geocoder.stats()
+
+@system_router.get("/system/jobs")
+async def scheduled_jobs():
+    """Scheduled jobs with next run and last run duration, plus the current scheduler leader."""
+    return await list_jobs()
+
+@system_router.get("/system/push-health")
+async def push_health():
+    """Dead device tokens, push receipt outcomes and the number of wasted sends avoided."""
+    return await get_push_health()
+
+@system_router.get("/system/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """All metrics in the Prometheus text format, for scraping."""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+@system_router.get("/system/traces")
+async def recent_traces():
+    """Tracing counters and the most recent traces kept by the tail sampler."""
+    return {**tracer.stats(), "recent": list(tracer.recent)}
+
+@system_router.get("/system/loop-stalls")
+async def loop_stalls():
+    """Event-loop stalls over the watchdog threshold, aggregated by the blocking call site."""
+    return loop_watchdog.report()
+
+@system_router.delete("/system/loop-stalls", dependencies=admin_only)
+async def reset_loop_stalls():
+    """Clears the stall report, e.g. before exercising a fix."""
+    loop_watchdog.reset()
+    return loop_watchdog.report()
+
+@system_router.get("/system/indexes", dependencies=admin_only)
+async def index_advisor():
+    """Query plans of the hot queries, flagging collection scans and in-memory sorts, plus missing indexes."""
+    return await index_report(db)
+
+
+class LogLevelRequest(BaseModel):
+    level: str
+    logger: Optional[str] = None  # root logger when omitted
+
+
+@system_router.get("/system/log-level")
+async def log_levels():
+    """Root and explicitly set logger levels, plus records dropped because the log queue was full."""
+    return get_log_levels()
+
+@system_router.put("/system/log-level", dependencies=admin_only)
+async def change_log_level(request: LogLevelRequest):
+    """Changes a logger's level in this worker, without a restart."""
+    try:
+        set_log_level(request.level, request.logger)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_log_levels()
+
+
+class ProfileRequestsRequest(BaseModel):
+    # Path prefixes such as /api/share-location, or "route_monitor_tick" for the monitor pass
+    routes: List[str] = Field(..., min_length=1)
+    sample_rate: float = Field(0.1, gt=0, le=1)
+    seconds: int = Field(60, ge=1)
+    max_requests: Optional[int] = Field(None, ge=1)
+
+
+class ProfileCaptureRequest(BaseModel):
+    seconds: int = Field(10, ge=1)
+
+
+def _profiler_call(start, *args):
+    if not profiler.directory:
+        raise HTTPException(status_code=503, detail="Profiling is disabled: set PROFILE_DIR.")
+    try:
+        return start(*args)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@system_router.get("/system/profiler")
+async def profiler_status():
+    """Running profiling sessions and the most recently written profiles."""
+    return profiler.status()
+
+@system_router.post("/system/profiler/requests", dependencies=admin_only)
+async def profile_requests(request: ProfileRequestsRequest):
+    """Profiles a fraction of the requests to the given routes for `seconds`; written as folded stacks to PROFILE_DIR."""
+    targets = {route: request.sample_rate for route in request.routes}
+    return _profiler_call(profiler.start_requests, targets, request.seconds, request.max_requests)
+
+@system_router.post("/system/profiler/capture", dependencies=admin_only)
+async def profile_process(request: ProfileCaptureRequest):
+    """Samples every thread of this worker for `seconds`; written as folded stacks to PROFILE_DIR."""
+    return _profiler_call(profiler.capture, request.seconds)
+
+@system_router.delete("/system/profiler", dependencies=admin_only)
+async def stop_profiling():
+    """Ends running sessions early and writes what they collected."""
+    return profiler.stop()
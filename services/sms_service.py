@@ -1,7 +1,6 @@
 import time
 import logging
 import serial
-from twilio.rest import Client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,6 +17,8 @@ class SMSService:
             twilio_phone_number (str): Twilio phone number to send from
             gsm_port (str): GSM modem port (default: 'COM3' for Windows)
         """
+        from twilio.rest import Client  # heavy; only needed once a real service is built
+
         self.twilio_client = Client(twilio_account_sid, twilio_auth_token)
         self.twilio_phone_number = twilio_phone_number
         self.gsm_port = gsm_port
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from utils.admission import (AdmissionController, AdmissionRejected, ClassPolicy, PRIORITIES, Priority,
+                             PriorityGate, priority)
+
+
+def _policies(**overrides):
+    policies = {cls: ClassPolicy(None, None, None, 0.0) for cls in PRIORITIES}
+    policies.update(overrides)
+    return policies
+
+
+def test_lower_classes_queue_or_shed_and_leave_reserved_capacity_to_higher_ones():
+    async def run():
+        admission = AdmissionController(_policies(**{Priority.SHARE: ClassPolicy(1, 1, 0.05, 0.0)}))
+        hold = asyncio.Event()
+
+        async def share():
+            async with admission.admit(Priority.SHARE):
+                await hold.wait()
+
+        first = asyncio.create_task(share())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(share())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):  # queue full
+            await share()
+        with pytest.raises(AdmissionRejected):  # queued past its timeout
+            await queued
+        async with admission.admit(Priority.SOS):  # other classes are unaffected
+            pass
+        hold.set()
+        await first
+        stats = admission.stats()[Priority.SHARE]
+        assert (stats["admitted"], stats["rejected"], stats["in_flight"], stats["queue_depth"]) == (1, 2, 0, 0)
+
+        # SOS reserves half the gate: scheduled pushes wait at 2 of 4, and SOS is served first when a slot frees
+        gate = PriorityGate("test", 4, _policies(**{Priority.SOS: ClassPolicy(None, None, None, 0.5)}))
+        release, order = asyncio.Event(), []
+
+        async def use(cls, name):
+            with priority(cls):
+                async with gate.slot():
+                    order.append(name)
+                    await release.wait()
+
+        tasks = [asyncio.create_task(use(Priority.SCHEDULED_PUSH, f"push{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        assert order == ["push0", "push1"] and gate.stats()[Priority.SCHEDULED_PUSH]["queue_depth"] == 1
+        tasks += [asyncio.create_task(use(Priority.SOS, f"sos{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        assert order[2:] == ["sos0", "sos1"] and gate.stats()[Priority.SOS]["queue_depth"] == 1
+        with priority(Priority.SCHEDULED_PUSH):
+            assert not gate.acquire_nowait()
+        release.set()
+        await asyncio.gather(*tasks)
+        assert order[4:] == ["sos2", "push2"] and gate.in_use == 0
+        assert gate.stats()[Priority.SCHEDULED_PUSH]["rejected"] == 1
+
+    asyncio.run(run())
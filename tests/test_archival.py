@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+from bson import ObjectId
+
+import routes.route_monitor_routes as route_monitor_routes
+import utils.archival as archival
+from benchmarks.memory_mongo import InMemoryDatabase
+
+NOW = datetime(2026, 6, 1)
+
+
+def journey(journey_id, status, age_days):
+    return {
+        "journey_id": journey_id,
+        "user_id": "user@example.com",
+        "status": status,
+        "last_updated_at": NOW - timedelta(days=age_days),
+    }
+
+
+def test_only_old_terminal_journeys_are_archived():
+    db = InMemoryDatabase()
+    hot, cold = db["user_routes"], db["user_routes_archive"]
+    for doc in (
+        journey("old-done", "completed", 30),
+        journey("old-alert", "inactivity_alert", 30),
+        journey("old-running", "running", 30),
+        journey("recent-done", "completed", 1),
+    ):
+        asyncio.run(hot.insert_one(doc))
+
+    with mock.patch.multiple(archival, user_routes_collection=hot, user_routes_archive_collection=cold, ARCHIVE_BATCH_SIZE=1):
+        moved = asyncio.run(archival.archive_finished_journeys(NOW))
+
+    assert moved == 2
+    assert sorted(d["journey_id"] for d in cold.docs) == ["old-alert", "old-done"]
+    assert sorted(d["journey_id"] for d in hot.docs) == ["old-running", "recent-done"]
+
+
+def test_read_api_merges_tiers_newest_first_and_pages_through_ties():
+    db = InMemoryDatabase()
+    hot, cold = db["user_routes"], db["user_routes_archive"]
+    asyncio.run(hot.insert_one(journey("recent", "completed", 1)))
+    for journey_id in ("tie-a", "tie-b", "tie-c"):  # same last_updated_at across a page boundary
+        asyncio.run(hot.insert_one({"_id": ObjectId(), **journey(journey_id, "completed", 10)}))
+    asyncio.run(cold.insert_one(journey("older", "completed", 20)))
+    asyncio.run(cold.insert_one(journey("oldest", "completed", 40)))
+
+    pages, cursor = [], None
+    with mock.patch.multiple(archival, user_routes_collection=hot, user_routes_archive_collection=cold):
+        while True:
+            page = asyncio.run(route_monitor_routes.list_user_journeys("user@example.com", limit=2, cursor=cursor))
+            pages.append([d["journey_id"] for d in page["journeys"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    journeys = [journey_id for page in pages for journey_id in page]
+    assert journeys[0] == "recent" and journeys[-2:] == ["older", "oldest"]
+    assert sorted(journeys[1:4]) == ["tie-a", "tie-b", "tie-c"]
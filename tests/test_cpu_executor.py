@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+import pytest
+
+from utils.cpu_executor import AttemptThrottle, CpuExecutor, CpuExecutorOverloaded, verify_bcrypt
+
+
+def test_full_queue_rejects_without_submitting():
+    executor = CpuExecutor(workers=1, queue_limit=0)
+
+    with pytest.raises(CpuExecutorOverloaded):
+        asyncio.run(executor.run(verify_bcrypt, "123456", "unused"))
+
+    assert executor.stats()["rejected"] == 1
+    assert executor._pool is None
+
+
+def _exit_worker_once(marker: str) -> str:
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "ok"
+
+
+def test_broken_pool_is_replaced_and_failed_jobs_are_not_counted_completed(tmp_path):
+    executor = CpuExecutor(workers=1, queue_limit=2)
+
+    async def scenario():
+        try:
+            first = await executor.run(_exit_worker_once, str(tmp_path / "died"))
+            with pytest.raises(ValueError):
+                await executor.run(int, "not a number")
+            return first
+        finally:
+            executor.shutdown()
+
+    assert asyncio.run(scenario()) == "ok"
+    stats = executor.stats()
+    assert (stats["completed"], stats["failed"], stats["pending"]) == (1, 1, 0)
+
+
+def test_attempt_throttle_limits_concurrent_and_repeated_attempts():
+    throttle = AttemptThrottle(max_attempts=2, window_seconds=60)
+
+    assert throttle.acquire("a@example.com", now=100)
+    assert not throttle.acquire("a@example.com", now=100.1)  # one verification in flight per user
+    assert throttle.acquire("b@example.com", now=100.1)
+    throttle.release("a@example.com")
+
+    assert throttle.acquire("a@example.com", now=101)
+    throttle.release("a@example.com")
+    assert not throttle.acquire("a@example.com", now=102)
+    assert throttle.retry_after("a@example.com", now=102) == 59
+
+    assert throttle.acquire("a@example.com", now=161)
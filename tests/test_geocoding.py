@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from benchmarks.memory_mongo import InMemoryDatabase
+from utils.geocoding import ReverseGeocoder, geohash
+
+ADDRESS = "221B Baker Street, Marylebone, London, Greater London, England, United Kingdom"
+
+
+def test_lookups_go_through_memory_then_mongo_then_provider_within_budget(tmp_path):
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    gazetteer = tmp_path / "places.csv"
+    gazetteer.write_text("name,lat,lng\nMarylebone Station,51.5225,-0.1631\nRegent's Park,51.5313,-0.1570\n")
+    calls = []
+
+    def provider(lat, lng, delay=0.0):
+        calls.append((lat, lng))
+        time.sleep(delay)
+        return ADDRESS
+
+    async def run():
+        cache = InMemoryDatabase()["geocode_cache"]
+        geocoder = ReverseGeocoder(cache, enabled=True, budget_ms=100, gazetteer_path=str(gazetteer))
+        geocoder._reverse = provider
+
+        # concurrent alerts from one cell share a single provider call
+        first = await asyncio.gather(*(geocoder.lookup(51.52377, -0.15855) for _ in range(3)))
+        assert first == ["221B Baker Street, Marylebone, London"] * 3 and len(calls) == 1
+        assert await geocoder.lookup(51.52378, -0.15856) == first[0]  # same geohash cell, from memory
+        restarted = ReverseGeocoder(cache, enabled=True, budget_ms=100)
+        restarted._reverse = provider
+        assert await restarted.lookup(51.52377, -0.15855) == first[0] and len(calls) == 1  # from Mongo
+        assert cache.docs[0]["_id"] == geohash(51.52377, -0.15855)
+
+        # over budget: the message gets the gazetteer's nearest place, and the cache fills behind it
+        geocoder._reverse = lambda lat, lng: provider(lat, lng, delay=0.3)
+        assert await geocoder.lookup(51.5230, -0.1620) == "Marylebone Station"
+        await asyncio.sleep(0.4)
+        assert await geocoder.lookup(51.5230, -0.1620) == first[0] and len(calls) == 2
+
+        offline = ReverseGeocoder(cache, enabled=True, mode="offline", gazetteer_path=str(gazetteer))
+        assert await offline.lookup(51.5300, -0.1560) == "Regent's Park"
+        assert await offline.lookup(48.8566, 2.3522) is None  # nothing within range
+        assert await ReverseGeocoder(cache).lookup(51.52377, -0.15855) is None  # disabled by default
+        return geocoder.stats()
+
+    stats = asyncio.run(run())
+    assert {key: stats[key] for key in ("memory", "provider", "timeout", "gazetteer")} == \
+        {"memory": 2, "provider": 3, "timeout": 1, "gazetteer": 1}
+    assert stats["hit_rate"] == round(2 / 6, 4)
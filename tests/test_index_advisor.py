@@ -0,0 +1,49 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+from database import INDEXES, setup_indexes
+from utils.index_advisor import HOT_QUERIES, index_report, plan_problems, uncovered_queries
+
+# explain() needs a real server; the in-memory stand-in has no query planner.
+MONGO_TEST_URL = os.getenv("MONGO_TEST_URL")
+
+
+def test_every_hot_query_has_a_registered_index():
+    assert uncovered_queries() == []
+    # dropping the journey-history index leaves both tiers' history pages without one
+    without = [spec for spec in INDEXES if spec.name != "user_id_1_last_updated_at_-1__id_-1"]
+    assert uncovered_queries(indexes=without) == ["journey_history", "journey_history_archive"]
+
+    index_scan = {"stage": "IXSCAN", "indexName": "email_1"}
+    assert plan_problems({"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": index_scan}}}) == \
+        {"indexes": ["email_1"], "problems": []}
+    sbe_sort = {"queryPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}, "slotBasedPlan": {"stages": ""}}
+    assert plan_problems({"queryPlanner": {"winningPlan": sbe_sort}})["problems"] == \
+        ["collection scan", "in-memory sort"]
+
+
+@pytest.mark.skipif(not MONGO_TEST_URL, reason="set MONGO_TEST_URL to run explain() against a real server")
+def test_hot_query_plans_use_indexes_on_seeded_data():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from benchmarks.synthetic_data import SyntheticDataset, load_into
+
+    async def run():
+        client = AsyncIOMotorClient(MONGO_TEST_URL)
+        db_name = "shieldx_explain_test"
+        await client.drop_database(db_name)
+        try:
+            db = client[db_name]
+            await load_into(db, SyntheticDataset(users=300, days=3, fixes_per_hour=30, end=datetime(2026, 10, 1)))
+            await setup_indexes(db)
+            return await index_report(db)
+        finally:
+            await client.drop_database(db_name)
+            client.close()
+
+    report = asyncio.run(run())
+    assert report["missing_indexes"] == []
+    assert report["failing"] == [], [query for query in report["queries"] if query["problems"]]
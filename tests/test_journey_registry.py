@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from benchmarks.memory_mongo import InMemoryDatabase
+from utils.journey_registry import JourneyRecord, JourneyRegistry, from_epoch, to_epoch
+
+
+def make_record(journey_id, user_id="user@example.com"):
+    return JourneyRecord(
+        journey_id=journey_id, user_id=user_id,
+        cur_lat=18.5, cur_lng=73.8, prev_lat=18.5, prev_lng=73.8,
+        end_lat=18.6, end_lng=73.9, last_updated_at=1_700_000_000.0,
+    )
+
+
+class FakeBulkCollection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise RuntimeError("primary stepped down")
+        self.batches.append(operations)
+
+
+def test_record_fix_shifts_coordinates_and_marks_dirty():
+    registry = JourneyRegistry()
+    registry.add(make_record("j1"))
+
+    record = registry.record_fix("user@example.com", 18.51, 73.81, 1_700_000_030.0)
+
+    assert (record.prev_lat, record.cur_lat) == (18.5, 18.51)
+    assert record.last_updated_at == 1_700_000_030.0
+    assert registry.record_fix("someone-else", 1.0, 1.0, 0.0, journey_id="j1") is None
+
+
+def test_checkpoint_writes_only_dirty_journeys_once():
+    registry = JourneyRegistry()
+    registry.add(make_record("j1", "a@example.com"))
+    registry.add(make_record("j2", "b@example.com"))
+    registry.record_fix("a@example.com", 18.51, 73.81, 1_700_000_030.0)
+    collection = FakeBulkCollection()
+
+    assert asyncio.run(registry.checkpoint(collection)) == 1
+    assert asyncio.run(registry.checkpoint(collection)) == 0
+    assert len(collection.batches) == 1
+
+
+def test_failed_checkpoint_keeps_journeys_dirty():
+    registry = JourneyRegistry()
+    registry.add(make_record("j1"))
+    registry.record_fix("user@example.com", 18.51, 73.81, 1_700_000_030.0)
+
+    assert asyncio.run(registry.checkpoint(FakeBulkCollection(fail=True))) == 0
+    assert asyncio.run(registry.checkpoint(FakeBulkCollection())) == 1
+
+
+def test_epoch_round_trip_matches_naive_utc_documents():
+    value = from_epoch(1_700_000_000.5)
+    assert value.tzinfo is None
+    assert to_epoch(value) == 1_700_000_000.5
+
+
+def test_sync_merges_checkpoints_from_other_workers_and_drops_ended_journeys():
+    now = time.time()
+
+    def doc(journey_id, user_id, lat, updated, status="running"):
+        return {"journey_id": journey_id, "user_id": user_id, "status": status,
+                "start_point": {"latitude": 18.5, "longitude": 73.8}, "end_point": {"latitude": 18.6, "longitude": 73.9},
+                "current_loc_coordinates": {"latitude": lat, "longitude": 73.8}, "last_updated_at": from_epoch(updated)}
+
+    async def run():
+        routes = InMemoryDatabase()["user_routes"]
+        for route in (doc("j1", "a@example.com", 18.55, now - 5), doc("j2", "b@example.com", 18.5, now - 60, "completed"),
+                      doc("j3", "c@example.com", 18.5, now - 60)):
+            await routes.insert_one(route)
+        registry = JourneyRegistry()
+        for journey_id, user_id in (("j1", "a@example.com"), ("j2", "b@example.com")):
+            record = make_record(journey_id, user_id)
+            record.last_updated_at = now - 60
+            registry.add(record)
+
+        assert await registry.sync(routes) == 2
+        assert registry.get("j1").cur_lat == 18.55  # another worker's newer checkpoint
+        assert registry.get("j2") is None and registry.get("j3") is not None
+        assert registry.evict_idle(now - 30) == 1 and registry.get("j3") is None
+
+    asyncio.run(run())
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+import utils.periodic_check_scheduler as periodic_scheduler
+from benchmarks.memory_mongo import InMemoryDatabase
+from utils.leader_lease import LeaderLease
+
+
+def test_only_one_holder_until_the_lease_expires_or_is_released():
+    leases = InMemoryDatabase()["leases"]
+    first = LeaderLease(leases, "scheduler", ttl_seconds=15, holder="worker-1")
+    second = LeaderLease(leases, "scheduler", ttl_seconds=15, holder="worker-2")
+    now = datetime(2024, 1, 1)
+
+    async def scenario():
+        assert await first.try_acquire(now)
+        assert not await second.try_acquire(now)
+        assert await first.try_acquire(now + timedelta(seconds=10))  # renewal
+        assert not await second.try_acquire(now + timedelta(seconds=20))
+        # worker-1 stops renewing: worker-2 takes over once the lease has expired
+        assert await second.try_acquire(now + timedelta(seconds=26))
+        assert not await first.try_acquire(now + timedelta(seconds=27))
+        await second.release()
+        assert await first.try_acquire(now + timedelta(seconds=28))
+
+    asyncio.run(scenario())
+    assert leases.docs[0]["holder"] == "worker-1"
+
+
+def test_job_sync_keeps_next_run_of_unchanged_jobs():
+    async def scenario():
+        scheduler = AsyncIOScheduler(job_defaults=periodic_scheduler.scheduler._job_defaults)
+        scheduler.start(paused=True)
+        with mock.patch.object(periodic_scheduler, "scheduler", scheduler):
+            periodic_scheduler._sync_job_definitions()
+            first = {job.id: job.next_run_time for job in scheduler.get_jobs()}
+            await asyncio.sleep(0.01)
+            periodic_scheduler._sync_job_definitions()
+            second = {job.id: job.next_run_time for job in scheduler.get_jobs()}
+        scheduler.shutdown(wait=False)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert set(first) == {"security_check_slots_job", "archival_job", "push_receipts_job", "sms_delivery_sweep_job"}
+    assert first == second
+
+
+def test_election_hooks_return_without_waiting_for_leader_work():
+    async def forever():
+        await asyncio.Event().wait()
+
+    async def scenario():
+        scheduler = AsyncIOScheduler()
+        scheduler.start(paused=True)
+        with mock.patch.multiple(periodic_scheduler, scheduler=scheduler, assign_missing_slots=forever,
+                                 periodic_check_task=forever, monitor_all_routes_background_task=forever,
+                                 _sync_job_definitions=lambda: None):
+            # a slow backfill must not delay the lease renewal that follows the hook
+            await asyncio.wait_for(periodic_scheduler._on_elected(), timeout=1)
+            tasks = list(periodic_scheduler._leader_tasks)
+            await periodic_scheduler._on_demoted()
+            await asyncio.sleep(0)
+        scheduler.shutdown(wait=False)
+        return tasks
+
+    tasks = asyncio.run(scenario())
+    assert len(tasks) == 3 and all(task.cancelled() for task in tasks)
@@ -0,0 +1,30 @@
+import asyncio
+
+from benchmarks.load_suite import compare, parse_args, run_suite
+from utils.security_check_sessions import security_check_sessions
+
+
+def test_suite_drives_the_app_against_provider_stand_ins():
+    args = parse_args(["--duration", "0.5", "--users", "20", "--bcrypt-rounds", "4", "--wrong-code-fraction", "0.5",
+                       "--only", "share_location", "--only", "update_location", "--only", "security_check",
+                       "--rps", "share_location=10", "--rps", "update_location=40", "--rps", "security_check=10",
+                       "--failure-rate", "twilio=1.0"])
+    report = asyncio.run(run_suite(args))
+
+    scenarios = report["scenarios"]
+    assert list(scenarios) == ["share_location", "update_location", "security_check"]
+    for result in scenarios.values():
+        assert result["error_rate"] == 0 and result["latency_ms"]["count"] == result["requests"]
+    assert scenarios["update_location"]["requests"] == 20 and scenarios["update_location"]["providers"] == {}
+    # every Twilio send fails, so each SMS falls back to Fast2SMS
+    sms = scenarios["share_location"]["providers"]
+    assert sms["twilio"] == {"requests": 5, "failures": 5} and sms["fast2sms"] == {"requests": 5, "failures": 0}
+    # wrong codes trigger SOS, whose SMS go through the same fallback
+    assert scenarios["security_check"]["providers"]["fast2sms"]["requests"] >= 1
+    assert security_check_sessions.backlog == 0
+
+    slower = {"scenarios": {name: {**result, "latency_ms": {**result["latency_ms"],
+                                                            "p95": result["latency_ms"]["p95"] * 2}}
+                            for name, result in scenarios.items()}}
+    assert compare(report, report) == []
+    assert [line.split(":")[0] for line in compare(report, slower)] == list(scenarios)
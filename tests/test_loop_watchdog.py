@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import time
+
+from utils.loop_watchdog import LoopWatchdog
+
+
+def blocking_provider_call():
+    time.sleep(0.2)
+
+
+def blocking_library_wait():
+    threading.Event().wait(0.15)
+
+
+def test_stalls_are_attributed_to_the_blocking_call_site():
+    watchdog = LoopWatchdog(threshold_ms=50)
+
+    async def handler():
+        blocking_provider_call()
+        await asyncio.sleep(0.05)
+        blocking_provider_call()
+        await asyncio.sleep(0.05)
+        blocking_library_wait()
+
+    async def scenario():
+        watchdog.start()
+        # short awaits and sleeps are not stalls
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+        assert watchdog.stalls == 0
+        await asyncio.create_task(handler(), name="sos-request")
+        await asyncio.sleep(0.1)  # let the last heartbeat close the stall
+        watchdog.stop()
+        return watchdog.report()
+
+    report = asyncio.run(scenario())
+    assert report["stalls"] == 3 and not report["enabled"]
+    worst, second = report["sites"]
+    assert worst["site"].startswith("tests/test_loop_watchdog.py:") and worst["site"].endswith("in blocking_provider_call")
+    assert worst["count"] == 2 and 350 <= worst["total_ms"] < 1000 and worst["task"] == "sos-request"
+    assert second["site"].endswith("in blocking_library_wait") and "threading.py" in second["leaf"]
+    assert any("in handler" in frame for frame in worst["stack"])
+
+    watchdog.reset()
+    assert watchdog.report()["sites"] == []
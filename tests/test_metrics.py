@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+import app.main as main
+from utils.metrics import MetricsRegistry, MongoCommandMetrics, MONGO_OPERATION_SECONDS
+
+
+def test_histogram_renders_cumulative_buckets_per_label_set():
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1.0))
+    child = latency.labels('/a"b')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        child.observe(value)
+    registry.gauge("demo_depth", "Depth.", lambda: {(): 7})
+
+    lines = registry.render().splitlines()
+    assert 'demo_seconds_bucket{route="/a\\"b",le="0.1"} 2' in lines
+    assert 'demo_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'demo_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'demo_seconds_count{route="/a\\"b"} 4' in lines
+    assert "# TYPE demo_seconds histogram" in lines and "demo_depth 7" in lines
+    assert latency.labels('/a"b') is child
+
+
+def test_requests_are_labelled_by_route_template_and_mongo_commands_by_collection():
+    listener = MongoCommandMetrics()
+    listener.started(SimpleNamespace(command={"find": "users", "filter": {}}, command_name="find", request_id=41))
+    listener.succeeded(SimpleNamespace(command_name="find", request_id=41, duration_micros=2500))
+    listener.started(SimpleNamespace(command={"getMore": 7215, "collection": "users"}, command_name="getMore", request_id=42))
+    listener.succeeded(SimpleNamespace(command_name="getMore", request_id=42, duration_micros=900))
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            await client.get("/ready")
+            await client.get("/no/such/path")
+            return await client.get("/api/system/metrics")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'shieldx_http_request_duration_seconds_count{method="GET",route="/ready",status="503"}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert 'shieldx_mongo_operation_duration_seconds_bucket{collection="users",operation="find",outcome="ok",le="0.0025"}' in body
+    assert 'shieldx_mongo_operation_duration_seconds_count{collection="users",operation="getMore",outcome="ok"} 1' in body
+    assert "shieldx_security_check_backlog 0" in body
+    assert MONGO_OPERATION_SECONDS.labels("users", "find", "ok").sum >= 0.0025
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from unittest import mock
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import utils.profiler as profiler_module
+from utils.profiler import ProfilerMiddleware, SamplingProfiler
+
+
+def hot_path_work():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+def other_route_work():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+def build_app():
+    app = FastAPI()
+    app.add_middleware(ProfilerMiddleware)
+
+    @app.post("/api/share-location")
+    async def share_location():
+        for _ in range(4):
+            hot_path_work()
+            await asyncio.sleep(0)
+        return {}
+
+    @app.get("/api/other")
+    async def other():
+        for _ in range(4):
+            other_route_work()
+            await asyncio.sleep(0)
+        return {}
+
+    return app
+
+
+def read_folded(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rsplit(" ", 1) for line in f.read().splitlines()]
+
+
+def test_request_profile_only_contains_the_armed_route(tmp_path):
+    fresh = SamplingProfiler(str(tmp_path), interval_ms=1)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app()), base_url="http://test") as client:
+            # disarmed: nothing is tracked and no sampler thread exists
+            await client.post("/api/share-location")
+            assert fresh._thread is None and fresh.profile("/api/share-location") is profiler_module._NO_PROFILE
+
+            fresh.start_requests({"/api/share-location": 1.0}, seconds=60, max_requests=3)
+            await asyncio.gather(*[client.post("/api/share-location") for _ in range(2)],
+                                 *[client.get("/api/other") for _ in range(2)])
+            assert fresh.status()["requests"]["requests"] == 2
+            return fresh.stop()
+
+    with mock.patch.object(profiler_module, "profiler", fresh):
+        status = asyncio.run(scenario())
+
+    assert status["requests"] is None and not fresh.armed and len(status["written"]) == 1
+    stacks = read_folded(status["written"][0])
+    assert stacks and all(stack.startswith("/api/share-location;") for stack, _ in stacks)
+    joined = "\n".join(stack for stack, _ in stacks)
+    assert "hot_path_work (test_profiler.py:" in joined and "other_route_work" not in joined
+    assert sum(int(count) for _, count in stacks) >= 20
+
+
+def test_whole_process_capture_expires_and_writes_every_thread(tmp_path):
+    fresh = SamplingProfiler(str(tmp_path), interval_ms=1)
+
+    async def scenario():
+        fresh.capture(seconds=1)
+        await asyncio.to_thread(hot_path_work)
+        while fresh.status()["process"] is not None:
+            await asyncio.sleep(0.05)
+        fresh._thread.join(1)
+        return fresh.status()
+
+    status = asyncio.run(scenario())
+    stacks = read_folded(status["written"][0])
+    roots = {stack.split(";", 1)[0] for stack, _ in stacks}
+    assert "MainThread" in roots and not fresh._thread.is_alive()
+    assert any("hot_path_work" in stack for stack, _ in stacks)
+
+    async def unconfigured_capture():
+        SamplingProfiler(None).capture(seconds=1)
+
+    with pytest.raises(RuntimeError, match="PROFILE_DIR"):
+        asyncio.run(unconfigured_capture())
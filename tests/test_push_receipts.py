@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httpx
+
+import controllers.periodic_check_controller as controller
+import utils.push_receipts as push_receipts
+from benchmarks.memory_mongo import InMemoryDatabase
+from utils.security_check_sessions import SecurityCheckSessions
+
+NOW = datetime(2026, 6, 1, 12, 0)
+
+
+def expo_receipts(request: httpx.Request) -> httpx.Response:
+    receipts = {
+        "ticket-ok": {"status": "ok"},
+        "ticket-dead": {"status": "error", "message": "not registered", "details": {"error": "DeviceNotRegistered"}},
+        "ticket-big": {"status": "error", "message": "too big", "details": {"error": "MessageTooBig"}},
+    }
+    return httpx.Response(200, json={"data": receipts})
+
+
+def test_dead_tokens_are_flagged_from_receipts_and_skipped_by_the_fanout():
+    db = InMemoryDatabase()
+    users = db["users"]
+    for i, token in enumerate(["ExponentPushToken[ok]", "ExponentPushToken[dead]", "ExponentPushToken[big]", "ExponentPushToken[gone]"]):
+        asyncio.run(users.insert_one({"email": f"user{i}@example.com", "deviceToken": {"token": token},
+                                      "isSecurityCheckEnabled": True}))
+    messages = [{"token": token, "title": "t", "body": "b"} for token in
+                ["ExponentPushToken[ok]", "ExponentPushToken[dead]", "ExponentPushToken[big]", "ExponentPushToken[gone]"]]
+    tickets = [
+        {"status": "ok", "id": "ticket-ok"},
+        {"status": "ok", "id": "ticket-dead"},
+        {"status": "ok", "id": "ticket-big"},
+        {"status": "error", "details": {"error": "DeviceNotRegistered"}},  # rejected at send time
+    ]
+    sent_to = []
+
+    async def fake_send(batch, client=None):
+        sent_to.extend(m["token"] for m in batch)
+        return [True] * len(batch)
+
+    async def scenario():
+        with mock.patch.multiple(push_receipts, push_tickets_collection=db["push_tickets"],
+                                 job_runs_collection=db["job_runs"], user_collection=users), \
+                mock.patch("database.user_collection", users):
+            flagged_at_send = await push_receipts.record_expo_tickets(messages, tickets, now=NOW)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(expo_receipts)) as client:
+                settled = await push_receipts.process_expo_receipts(client, now=NOW + timedelta(minutes=20))
+            with mock.patch.multiple(controller, user_collection=users, job_runs_collection=db["job_runs"],
+                                     security_check_sessions=SecurityCheckSessions(db["security_checks"]),
+                                     send_push_batch=fake_send):
+                summary = await controller.initiate_hourly_security_check()
+            return flagged_at_send, settled, summary, await push_receipts.get_push_health()
+
+    flagged_at_send, settled, summary, health = asyncio.run(scenario())
+
+    assert flagged_at_send == 1
+    assert settled == {"delivered": 1, "errors": 2, "expired": 0, "tokens_invalidated": 1}
+    assert sent_to == ["ExponentPushToken[ok]", "ExponentPushToken[big]"]
+    assert summary["dead_tokens_skipped"] == 2
+    assert health["invalid_tokens"] == 2 and health["sends_avoided"] == 2
+    assert health["tickets"]["delivered"] == 1 and health["tickets"]["error"] == 2
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import utils.route_tracker as route_tracker
+from utils.journey_registry import JourneyRecord, journey_registry
+
+
+class FakeRoutesCollection:
+    def __init__(self, running_doc=None, still_running=True):
+        self.running_doc = running_doc
+        self.still_running = still_running
+        self.filters = []
+        self.updates = []
+
+    async def find_one_and_update(self, filter_query, update, **kwargs):
+        self.filters.append(filter_query)
+        return self.running_doc
+
+    async def update_one(self, filter_query, update):
+        self.updates.append((filter_query, update))
+        return SimpleNamespace(matched_count=1 if self.still_running else 0)
+
+
+def make_record(journey_id="journey-1", user_id="user@example.com", last_updated_at=None, lat=18.52, lng=73.85):
+    return JourneyRecord(
+        journey_id=journey_id, user_id=user_id,
+        cur_lat=lat, cur_lng=lng, prev_lat=lat, prev_lng=lng,
+        end_lat=18.60, end_lng=73.95,
+        last_updated_at=last_updated_at if last_updated_at is not None else time.time(),
+        contact="+919999999999",
+    )
+
+
+def running_doc(journey_id="journey-2", user_id="user@example.com"):
+    return {
+        "journey_id": journey_id,
+        "user_id": user_id,
+        "status": "running",
+        "start_point": {"latitude": 18.5, "longitude": 73.8},
+        "end_point": {"latitude": 18.6, "longitude": 73.9},
+        "current_loc_coordinates": {"latitude": 18.52, "longitude": 73.85},
+        "emergency_contact": "+919999999999",
+    }
+
+
+def run_update(collection, user_id="user@example.com", journey_id=None):
+    with mock.patch.object(route_tracker, "user_routes_collection", collection):
+        asyncio.run(route_tracker.update_user_current_location(user_id, 18.53, 73.86, journey_id))
+
+
+def test_registered_journey_is_updated_in_memory_without_mongo():
+    journey_registry.clear()
+    journey_registry.add(make_record())
+    collection = FakeRoutesCollection()
+
+    run_update(collection)
+
+    record = journey_registry.for_user("user@example.com")
+    assert collection.filters == []
+    assert (record.prev_lat, record.cur_lat) == (18.52, 18.53)
+
+
+def test_unknown_journey_falls_back_to_mongo_and_is_adopted():
+    journey_registry.clear()
+    collection = FakeRoutesCollection(running_doc())
+
+    run_update(collection)
+    run_update(collection)
+
+    assert collection.filters == [{"user_id": "user@example.com", "status": "running"}]
+    assert journey_registry.for_user("user@example.com").journey_id == "journey-2"
+
+
+def test_pipeline_shifts_current_into_previous():
+    stage = route_tracker._location_update_pipeline(1.0, 2.0, None)[0]["$set"]
+    assert stage["previous_loc_coordinates"]["$ifNull"][0] == "$current_loc_coordinates"
+    assert stage["current_loc_coordinates"] == {"latitude": 1.0, "longitude": 2.0}
+
+
+def test_initialize_tracking_writes_monitor_shaped_journey():
+    journey_registry.clear()
+    inserted = []
+
+    class InsertCollection:
+        async def insert_one(self, doc):
+            inserted.append(doc)
+
+    with mock.patch.object(route_tracker, "user_routes_collection", InsertCollection()):
+        journey_id = asyncio.run(route_tracker.initialize_user_tracking(
+            "user@example.com", 18.5, 73.8, 18.6, 73.9, ["+919999999999"]
+        ))
+
+    doc = inserted[0]
+    assert doc["journey_id"] == journey_id
+    assert doc["status"] == "running"
+    assert doc["end_point"] == {"latitude": 18.6, "longitude": 73.9}
+    assert doc["emergency_contact"] == "+919999999999"
+    assert journey_registry.for_user("user@example.com").journey_id == journey_id
+
+
+def test_monitor_pass_raises_inactivity_only_for_journeys_still_running():
+    triggered = []
+
+    async def fake_trigger_sos(**kwargs):
+        triggered.append(kwargs)
+
+    async def run(collection):
+        journey_registry.clear()
+        journey_registry.add(make_record(last_updated_at=time.time() - 10 * 60))
+        with mock.patch.object(route_tracker, "user_routes_collection", collection), \
+                mock.patch.object(route_tracker, "trigger_sos", fake_trigger_sos):
+            evaluated = await route_tracker.run_monitor_pass()
+            await asyncio.sleep(0)
+        return evaluated
+
+    collection = FakeRoutesCollection()
+    assert asyncio.run(run(collection)) == 1
+    assert triggered[0]["reason"] == route_tracker.SOSReason.INACTIVITY_ALERT
+    assert collection.updates[0][0] == {"journey_id": "journey-1", "status": "running"}
+    assert collection.updates[0][1]["$set"]["status"] == "inactivity_alert"
+    assert len(journey_registry) == 0
+
+    # ended by the user (or another pass) before this one got to it: no SOS
+    asyncio.run(run(FakeRoutesCollection(still_running=False)))
+    assert len(triggered) == 1 and len(journey_registry) == 0
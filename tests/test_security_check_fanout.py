@@ -0,0 +1,87 @@
+import asyncio
+from unittest import mock
+
+import controllers.periodic_check_controller as controller
+from benchmarks.memory_mongo import InMemoryDatabase
+from utils.security_check_sessions import SecurityCheckSessions
+
+
+def new_db():
+    db = InMemoryDatabase()
+    # one pending session per user, as with the real security_checks index
+    asyncio.run(db["security_checks"].create_index([("user_email", 1)], unique=True))
+    return db
+
+
+def seed_users(users, count):
+    for i in range(count):
+        asyncio.run(users.insert_one({
+            "email": f"user{i}@example.com",
+            "deviceToken": {"token": f"ExponentPushToken[{i}]"},
+            "isSecurityCheckEnabled": True,
+        }))
+    asyncio.run(users.insert_one({"email": "off@example.com", "deviceToken": {"token": "x"}, "isSecurityCheckEnabled": False}))
+
+
+def run_check(db, send_push_batch):
+    sessions = SecurityCheckSessions(db["security_checks"])
+    with mock.patch.multiple(
+        controller,
+        user_collection=db["users"],
+        job_runs_collection=db["job_runs"],
+        security_check_sessions=sessions,
+        send_push_batch=send_push_batch,
+        SECURITY_CHECK_BATCH_SIZE=3,
+        SECURITY_CHECK_PUSH_CONCURRENCY=2,
+    ):
+        return asyncio.run(controller.initiate_hourly_security_check()), sessions
+
+
+def test_fanout_streams_batches_and_checkpoints_progress():
+    db = new_db()
+    seed_users(db["users"], 7)
+    batches = []
+
+    async def fake_send(messages, client=None):
+        batches.append(len(messages))
+        return [not m["data"]["user_email"].startswith("user6") for m in messages]
+
+    summary, _ = run_check(db, fake_send)
+
+    assert batches == [3, 3, 1]
+    assert (summary["sent"], summary["failed"]) == (6, 1)
+    run = db["job_runs"].docs[0]
+    assert run["status"] == "completed"
+    statuses = {d["user_email"]: d["status"] for d in db["security_checks"].docs}
+    assert statuses["user6@example.com"] == "undelivered"
+    assert statuses["user0@example.com"] == "pending"
+
+
+def test_interrupted_run_resumes_after_last_checkpoint():
+    db = new_db()
+    seed_users(db["users"], 7)
+    sent_to = []
+
+    async def crash_on_third_batch(messages, client=None):
+        if any(m["data"]["user_email"] == "user6@example.com" for m in messages):
+            raise RuntimeError("worker killed")
+        sent_to.extend(m["data"]["user_email"] for m in messages)
+        return [True] * len(messages)
+
+    try:
+        run_check(db, crash_on_third_batch)
+    except RuntimeError:
+        pass
+
+    async def ok(messages, client=None):
+        sent_to.extend(m["data"]["user_email"] for m in messages)
+        return [True] * len(messages)
+
+    summary, _ = run_check(db, ok)
+
+    assert sent_to.count("user0@example.com") == 1
+    # user6's session was opened before the crash but never pushed: the resumed run pushes it
+    assert sent_to.count("user6@example.com") == 1
+    assert [d["notified"] for d in db["security_checks"].docs if d["user_email"] == "user6@example.com"] == [True]
+    assert summary["run_id"] == db["job_runs"].docs[0]["run_id"]
+    assert (summary["sent"], summary["skipped"]) == (7, 0)  # totals carried over from before the crash
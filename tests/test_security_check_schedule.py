@@ -0,0 +1,44 @@
+import asyncio
+from collections import Counter
+from unittest import mock
+
+import utils.security_check_schedule as schedule
+from benchmarks.memory_mongo import InMemoryDatabase
+
+
+def test_hashed_slots_are_stable_and_spread_over_the_interval():
+    emails = [f"user{i}@example.com" for i in range(6000)]
+    slots = Counter(schedule.hashed_slot(email) for email in emails)
+
+    assert schedule.hashed_slot("User1@Example.com") == schedule.hashed_slot("user1@example.com")
+    assert set(slots) == set(range(schedule.SECURITY_CHECK_SLOTS))
+    average = len(emails) / schedule.SECURITY_CHECK_SLOTS
+    assert max(slots.values()) < 1.5 * average
+    assert schedule.slot_for_minute(59) == schedule.SECURITY_CHECK_SLOTS - 1
+
+
+def test_drain_catches_up_on_missed_slots_without_repeating():
+    db = InMemoryDatabase()
+    drained = []
+
+    async def fake_check(slot=None):
+        drained.append(slot)
+
+    start = 10 * schedule.SECURITY_CHECK_INTERVAL_SECONDS
+    users = db["users"]
+    for i in range(3):  # enabled by an import, not through /toggle-security-check
+        asyncio.run(users.insert_one({"email": f"user{i}@example.com", "isSecurityCheckEnabled": True}))
+    with mock.patch.multiple(schedule, job_runs_collection=db["job_runs"], user_collection=users,
+                             initiate_hourly_security_check=fake_check, SLOT_BACKFILL_PER_DRAIN=2):
+        assert asyncio.run(schedule.drain_due_security_check_slots(now=start + 1)) == 1
+        assert sum("securityCheckSlot" in user for user in users.docs) == 2  # bounded per drain
+        assert asyncio.run(schedule.drain_due_security_check_slots(now=start + 2)) == 0
+        # Down for three slots: all three are drained on the next tick.
+        later = start + 3 * schedule.SLOT_SECONDS + 1
+        assert asyncio.run(schedule.drain_due_security_check_slots(now=later)) == 3
+        # Down for a day: at most one interval of slots is replayed.
+        day_later = later + 86400
+        assert asyncio.run(schedule.drain_due_security_check_slots(now=day_later)) == schedule.SECURITY_CHECK_SLOTS
+
+    assert drained[:4] == [0, 1, 2, 3]
+    assert all(user["securityCheckSlot"] == schedule.hashed_slot(user["email"]) for user in users.docs)
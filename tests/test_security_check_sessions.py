@@ -0,0 +1,65 @@
+import asyncio
+
+from benchmarks.memory_mongo import InMemoryCollection
+from utils.security_check_sessions import (
+    SECURITY_CHECK_TIMEOUT_SECONDS,
+    SecurityCheckSessions,
+    SecurityCheckStatus,
+)
+
+NOW = 1_700_000_000.0
+
+
+def test_only_due_unanswered_sessions_time_out():
+    async def run():
+        sessions = SecurityCheckSessions(InMemoryCollection("security_checks"))
+        timed_out = []
+
+        async def on_timeout(user_email):
+            timed_out.append(user_email)
+
+        # only the process running the timeout loop tracks deadlines
+        await sessions.open("elsewhere@example.com", now=NOW - 1000)
+        assert sessions.backlog == 0
+        await sessions.load()
+        early = await sessions.open("early@example.com", now=NOW)
+        answered = await sessions.open("answered@example.com", now=NOW + 1)
+        late = await sessions.open("late@example.com", now=NOW + 30)
+        await sessions.mark_notified([early["check_id"], answered["check_id"], late["check_id"]])
+        await sessions.resolve("answered@example.com", answered["check_id"], SecurityCheckStatus.PASSED)
+
+        expired = await sessions.expire_due(on_timeout, now=NOW + SECURITY_CHECK_TIMEOUT_SECONDS + 5)
+        await asyncio.sleep(0)
+        return expired, timed_out, sessions.backlog
+
+    expired, timed_out, backlog = asyncio.run(run())
+    assert expired == 1
+    assert timed_out == ["early@example.com"]
+    assert backlog == 1
+
+
+def test_session_resolves_exactly_once():
+    async def run():
+        sessions = SecurityCheckSessions(InMemoryCollection("security_checks"))
+        session = await sessions.open("user@example.com", now=NOW)
+        first = await sessions.resolve("user@example.com", session["check_id"], SecurityCheckStatus.FAILED)
+        second = await sessions.resolve("user@example.com", session["check_id"], SecurityCheckStatus.TIMED_OUT)
+        return first, second, (await sessions.get("user@example.com"))["status"]
+
+    assert asyncio.run(run()) == (True, False, "failed")
+
+
+def test_session_never_pushed_expires_without_sos():
+    async def run():
+        sessions = SecurityCheckSessions(InMemoryCollection("security_checks"))
+        timed_out = []
+
+        async def on_timeout(user_email):
+            timed_out.append(user_email)
+
+        await sessions.load()
+        await sessions.open("user@example.com", now=NOW)
+        expired = await sessions.expire_due(on_timeout, now=NOW + SECURITY_CHECK_TIMEOUT_SECONDS + 1)
+        return expired, timed_out, (await sessions.get("user@example.com"))["status"]
+
+    assert asyncio.run(run()) == (0, [], "undelivered")
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httpx
+from fastapi import FastAPI
+from twilio.request_validator import RequestValidator
+
+import routes.sms_callback_routes as callback_routes
+import utils.notifier as notifier
+import utils.sms_delivery as sms_delivery
+from benchmarks.memory_mongo import InMemoryDatabase
+
+NOW = datetime(2026, 6, 1, 12, 0)
+
+
+def seed(messages, message_id, emergency=True, attempt=1, created_at=NOW):
+    asyncio.run(messages.insert_one({
+        "_id": message_id, "provider": "twilio", "to": "+919800000000", "body": "🚨 help",
+        "emergency": emergency, "attempt": attempt, "status": "queued", "status_rank": 0, "created_at": created_at,
+    }))
+
+
+def test_out_of_order_reports_are_batched_and_never_regress_the_status():
+    messages = InMemoryDatabase()["sms_messages"]
+    seed(messages, "SM1", emergency=False)
+    seed(messages, "SM2", emergency=False)
+    buffer = sms_delivery.DeliveryReportBuffer(messages)
+
+    async def scenario():
+        for message_id, status in [("SM1", "delivered"), ("SM1", "sent"), ("SM2", "sent")]:
+            buffer.add(message_id, status)
+        await buffer.flush()
+        buffer.add("SM1", "sending")  # straggler from before delivery
+        await buffer.flush()
+
+    asyncio.run(scenario())
+    statuses = {doc["_id"]: doc["status"] for doc in messages.docs}
+    assert statuses == {"SM1": "delivered", "SM2": "sent"}
+    assert messages.op_counts["bulk_write"] == 2
+    assert buffer.stats() == {"buffered": 0, "received": 4, "applied": 3, "rejected": 0}
+
+
+def test_undelivered_emergency_sms_is_retried_then_escalated():
+    db = InMemoryDatabase()
+    messages = db["sms_messages"]
+    seed(messages, "SM-first")
+    seed(messages, "SM-last", attempt=sms_delivery.SMS_MAX_ATTEMPTS)
+    seed(messages, "SM-silent", created_at=NOW - timedelta(minutes=sms_delivery.SMS_DELIVERY_TIMEOUT_MINUTES + 1))
+    buffer = sms_delivery.DeliveryReportBuffer(messages)
+    retried, escalated = [], []
+
+    async def fake_send(contact, message, network_status=None, attempt=1, retry_of=None):
+        retried.append((retry_of, attempt))
+
+    async def scenario():
+        with mock.patch.object(sms_delivery, "send_notification", fake_send), \
+                mock.patch.object(sms_delivery, "sms_messages_collection", messages), \
+                mock.patch.object(sms_delivery, "delivery_reports", buffer), \
+                mock.patch.object(sms_delivery.sms_service, "send_via_gsm", lambda to, body: escalated.append(to)):
+            buffer.add("SM-first", "undelivered", "30003")
+            buffer.add("SM-last", "failed", "30008")
+            buffer.add("SM-first", "undelivered")  # duplicate callback must not retry twice
+            await buffer.flush()
+            swept = await sms_delivery.sweep_unconfirmed_emergency_sms(now=NOW)
+            await asyncio.gather(*buffer._followups)
+        return swept
+
+    swept = asyncio.run(scenario())
+    assert swept == 1
+    assert sorted(retried) == [("SM-first", 2), ("SM-silent", 2)]
+    assert escalated == ["+919800000000"]
+    followups = {doc["_id"]: doc["followup"] for doc in messages.docs}
+    assert followups == {"SM-first": "retried", "SM-last": "escalated", "SM-silent": "retried"}
+
+
+def test_emergency_sms_that_only_took_the_gsm_fallback_is_retried_then_escalated():
+    messages = InMemoryDatabase()["sms_messages"]
+    buffer = sms_delivery.DeliveryReportBuffer(messages)
+    gsm_sends = []
+
+    def provider_down(contact, message):
+        raise ConnectionError("provider unreachable")
+
+    async def no_sound():
+        pass
+
+    async def scenario():
+        with mock.patch("database.sms_messages_collection", messages), \
+                mock.patch.object(sms_delivery, "delivery_reports", buffer), \
+                mock.patch.object(notifier, "play_alert_sound", no_sound), \
+                mock.patch.multiple(notifier.sms_service, send_via_twilio=provider_down, send_via_fast2sms=provider_down,
+                                    send_via_gsm=lambda to, body: gsm_sends.append(to) or {"status": "sent_simulated"}):
+            result = await notifier.send_notification("+919812345678", "🚨 EMERGENCY: help")
+            while buffer._followups:
+                await asyncio.gather(*buffer._followups)
+        return result
+
+    assert asyncio.run(scenario()).startswith("❌")
+    attempts = sorted((doc["attempt"], doc["provider"], doc["followup"]) for doc in messages.docs)
+    assert attempts == [(1, "gsm_simulated", "retried"), (2, "gsm_simulated", "retried"),
+                        (3, "gsm_simulated", "escalated")]
+    assert len(gsm_sends) == sms_delivery.SMS_MAX_ATTEMPTS + 1  # each attempt, then the escalation
+
+
+def test_callback_endpoints_validate_before_buffering():
+    buffer = sms_delivery.DeliveryReportBuffer(InMemoryDatabase()["sms_messages"])
+    validator = RequestValidator("auth-token")
+    app = FastAPI()
+    app.include_router(callback_routes.sms_callback_router, prefix="/api")
+    twilio_url = "http://test/api/sms/status/twilio"
+
+    def twilio_post(client, params, validator=validator):
+        return client.post(twilio_url, data=params, headers={"X-Twilio-Signature": validator.compute_signature(twilio_url, params)})
+
+    async def scenario(twilio_validator, secret):
+        with mock.patch.object(callback_routes, "delivery_reports", buffer), \
+                mock.patch.object(callback_routes, "twilio_validator", twilio_validator), \
+                mock.patch.object(callback_routes, "SMS_STATUS_CALLBACK_URL", None), \
+                mock.patch.object(callback_routes, "SMS_CALLBACK_SECRET", secret):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return [
+                    (await twilio_post(client, {"MessageSid": "SM1", "MessageStatus": "delivered"})).status_code,
+                    (await twilio_post(client, {"MessageSid": "SM1", "MessageStatus": "bogus"})).status_code,
+                    (await twilio_post(client, {"MessageSid": "SM1", "MessageStatus": "failed"},
+                                       RequestValidator("forged"))).status_code,
+                    (await client.post("/api/sms/status/fast2sms", json={"message_id": "F1", "status": "DELIVERED"},
+                                       headers={"X-Callback-Token": "s3cret"})).status_code,
+                    (await client.post("/api/sms/status/fast2sms", json={"message_id": "F1", "status": "delivered"},
+                                       headers={"X-Callback-Token": "wrong"})).status_code,
+                ]
+
+    assert asyncio.run(scenario(validator, "s3cret")) == [204, 400, 403, 204, 403]
+    assert len(buffer) == 2
+    # no token or secret configured: refused rather than accepted unauthenticated
+    assert asyncio.run(scenario(None, None)) == [503, 503, 503, 503, 503]
+    assert len(buffer) == 2
+
+    # behind the proxy: Twilio signs the public https URL, the app sees http://test
+    public_url = "https://api.shieldx.example/api/sms/status/twilio"
+    params = {"MessageSid": "SM2", "MessageStatus": "delivered"}
+
+    async def proxied():
+        with mock.patch.object(callback_routes, "delivery_reports", buffer), \
+                mock.patch.object(callback_routes, "twilio_validator", validator), \
+                mock.patch.object(callback_routes, "SMS_STATUS_CALLBACK_URL", public_url):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                signed_public = await client.post(twilio_url, data=params, headers={
+                    "X-Twilio-Signature": validator.compute_signature(public_url, params)})
+                signed_internal = await twilio_post(client, params)
+                return signed_public.status_code, signed_internal.status_code
+
+    assert asyncio.run(proxied()) == (204, 403)
+    assert len(buffer) == 3
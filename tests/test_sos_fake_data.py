@@ -0,0 +1,52 @@
+import asyncio
+import math
+from datetime import datetime, timedelta
+
+from benchmarks.memory_mongo import InMemoryDatabase
+from benchmarks.synthetic_data import COLLECTIONS, SyntheticDataset, load_into
+
+END = datetime(2026, 10, 1)
+
+
+def test_dataset_is_deterministic_and_sharding_does_not_change_it():
+    dataset = SyntheticDataset(users=30, days=5, fixes_per_hour=30, sos_per_user_day=0.3, end=END, seed=7)
+    again = SyntheticDataset(users=30, days=5, fixes_per_hour=30, sos_per_user_day=0.3, end=END, seed=7)
+    shards = [dataset.shard_of(shard, 3) for shard in range(3)]
+    counts = dataset.expected_counts()
+
+    for name in COLLECTIONS:
+        docs = list(dataset.documents(name))
+        assert docs == list(again.documents(name)) and len(docs) == counts[name] > 0
+        sharded = sorted((d for shard in shards for d in shard.documents(name)), key=lambda d: d["_id"])
+        assert sharded == sorted(docs, key=lambda d: d["_id"])
+        assert len({d["_id"] for d in docs}) == len(docs)
+    assert list(SyntheticDataset(users=30, days=5, end=END, seed=8).users_documents()) != \
+        list(SyntheticDataset(users=30, days=5, end=END, seed=7).users_documents())
+
+    users = list(dataset.users_documents())
+    assert {"email", "deviceToken", "emergencyContacts", "isSecurityCheckEnabled", "lastLocation"} <= \
+        set().union(*users)
+    assert all("securityCheckSlot" in u for u in users if u["isSecurityCheckEnabled"])
+
+    # every fix lies inside one of its user's journeys, and journeys end where their fixes do
+    routes = list(dataset.user_routes_documents())
+    windows = {}
+    for route in routes:
+        windows.setdefault(route["user_id"], []).append((route["created_at"], route["last_updated_at"]))
+        assert dataset.start <= route["created_at"] <= route["last_updated_at"] < END
+        if route["status"] == "running":
+            assert route["created_at"] > END - timedelta(hours=1)
+    for fix in dataset.locations_documents():
+        assert any(start <= fix["timestamp"] <= end for start, end in windows[fix["user_id"]])
+        assert fix["_id"].generation_time.replace(tzinfo=None) == fix["timestamp"].replace(microsecond=0)
+
+
+def test_load_into_streams_unordered_batches():
+    dataset = SyntheticDataset(users=20, days=3, fixes_per_hour=60, end=END)
+    db = InMemoryDatabase()
+    inserted = asyncio.run(load_into(db, dataset, batch_size=500, concurrency=3))
+
+    assert inserted == dataset.expected_counts()
+    for name, count in inserted.items():
+        assert len(db[name].docs) == count
+        assert db[name].op_counts["insert_many"] == math.ceil(count / 500)
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+from bson import ObjectId
+
+import controllers.sos_controller as sos_controller
+import routes.sos_routes as sos_routes
+from benchmarks.memory_mongo import InMemoryDatabase
+from utils.sos_incidents import SOSIncidents
+
+NOW = datetime(2026, 6, 1)
+
+
+def test_history_pages_newest_first_across_tiers_without_skipping_ties():
+    db = InMemoryDatabase()
+    hot, cold = db["sos_history"], db["sos_history_archive"]
+    for i, minutes_ago in enumerate([0, 10, 10, 10, 20]):
+        asyncio.run(hot.insert_one({"_id": ObjectId(), "user_id": "u", "timestamp": NOW - timedelta(minutes=minutes_ago), "n": i}))
+    archived = {"_id": ObjectId(), "user_id": "u", "timestamp": NOW - timedelta(days=200), "n": 5}
+    asyncio.run(cold.insert_one(dict(archived)))
+    asyncio.run(hot.insert_one(dict(archived)))  # a move that has upserted the row but not yet deleted it
+    asyncio.run(hot.insert_one({"_id": ObjectId(), "user_id": "other", "timestamp": NOW}))
+
+    pages, cursor = [], None
+    with mock.patch.multiple("utils.archival", sos_history_collection=hot, sos_history_archive_collection=cold):
+        while True:
+            page = asyncio.run(sos_routes.sos_history("u", limit=2, cursor=cursor))
+            pages.append([alert["n"] for alert in page["alerts"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    assert pages[0][0] == 0
+    assert sorted(n for page in pages for n in page) == [0, 1, 2, 3, 4, 5]
+    assert pages[-1][-1] == 5
+
+
+def test_stats_are_maintained_on_write_and_resolution():
+    db = InMemoryDatabase()
+    incidents = SOSIncidents(db["sos_incidents"])
+    stats = db["sos_user_stats"]
+
+    async def scenario():
+        with mock.patch.multiple(sos_controller, sos_incidents=incidents, sos_history_collection=db["sos_history"]), \
+                mock.patch("utils.sos_stats.sos_user_stats_collection", stats):
+            incident, _ = await incidents.record_trigger("u", 1.0, 2.0, "Manual SOS", now=NOW)
+            await sos_controller.save_sos_history("u", 1.0, 2.0, ["+919999999999"], reason="Manual SOS",
+                                                  incident_id=incident["_id"])
+            await sos_controller.save_sos_history("u", 1.0, 2.0, ["+919999999999"], reason="Inactivity Alert")
+            with mock.patch("utils.sos_incidents.datetime") as fake_datetime:
+                fake_datetime.utcnow.return_value = NOW + timedelta(minutes=4)
+                resolved = await sos_controller.resolve_sos_incident(str(incident["_id"]))
+            again = await sos_controller.resolve_sos_incident(str(incident["_id"]))
+            return resolved, again, await sos_routes.sos_stats("u")
+
+    resolved, again, summary = asyncio.run(scenario())
+
+    assert resolved["response_seconds"] == 240 and again is None
+    assert summary["total_alerts"] == 2
+    assert summary["alerts_by_reason"] == {"Manual SOS": 1, "Inactivity Alert": 1}
+    assert summary["mean_response_seconds"] == 240
+    assert db["sos_history"].docs[0]["status"] == "resolved"
+
+
+def test_resolution_reaches_a_history_row_already_archived():
+    db = InMemoryDatabase()
+    incidents = SOSIncidents(db["sos_incidents"])
+    hot, cold = db["sos_history"], db["sos_history_archive"]
+
+    async def scenario():
+        with mock.patch.multiple(sos_controller, sos_incidents=incidents, sos_history_collection=hot,
+                                 sos_history_archive_collection=cold), \
+                mock.patch("utils.sos_stats.sos_user_stats_collection", db["sos_user_stats"]):
+            incident, _ = await incidents.record_trigger("u", 1.0, 2.0, "Manual SOS", now=NOW)
+            await sos_controller.save_sos_history("u", 1.0, 2.0, ["+919999999999"], reason="Manual SOS",
+                                                  incident_id=incident["_id"])
+            cold.docs.extend(hot.docs)
+            hot.docs.clear()
+            return await sos_controller.resolve_sos_incident(str(incident["_id"]))
+
+    assert asyncio.run(scenario()) is not None
+    assert cold.docs[0]["status"] == "resolved"
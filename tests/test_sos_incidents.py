@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+import controllers.sos_controller as sos_controller
+import utils.notifier as notifier
+import utils.sms_delivery as sms_delivery
+from benchmarks.memory_mongo import InMemoryDatabase
+from models.sos import SOSReason
+from utils.admission import AdmissionRejected, Priority
+from utils.sos_incidents import SOSIncidents
+
+
+def make_incidents(db):
+    collection = db["sos_incidents"]
+    asyncio.run(collection.create_index([("user_id", 1)], unique=True, partialFilterExpression={"status": "open"}))
+    return SOSIncidents(collection)
+
+
+def test_burst_of_triggers_alerts_each_contact_once_and_throttles_followups():
+    db = InMemoryDatabase()
+    incidents = make_incidents(db)
+    db_history = db["sos_history"]
+    sent = []
+
+    async def fake_send(contact, message, network_status=None):
+        sent.append((contact, message.split(":")[0]))
+        return "✅ SMS sent"
+
+    async def no_sound():
+        pass
+
+    async def burst():
+        with mock.patch.multiple(sos_controller, sos_incidents=incidents, sos_history_collection=db_history,
+                                 send_notification=fake_send, play_alert_sound=no_sound), \
+                mock.patch("utils.sos_stats.sos_user_stats_collection", db["sos_user_stats"]):
+            results = await asyncio.gather(*(
+                sos_controller.trigger_sos("user@example.com", 18.5, 73.8, ["+919999999999", "+918888888888"])
+                for _ in range(5)
+            ))
+            # the route monitor joins the same incident a few minutes later with a new contact
+            with mock.patch("utils.sos_incidents.datetime") as fake_datetime:
+                fake_datetime.utcnow.return_value = datetime.utcnow() + timedelta(minutes=3)
+                late = await sos_controller.trigger_sos(
+                    "user@example.com", 18.6, 73.9, ["+919999999999", "+917777777777"],
+                    reason=SOSReason.INACTIVITY_ALERT
+                )
+        return results, late
+
+    results, late = asyncio.run(burst())
+
+    assert len(db["sos_incidents"].docs) == 1
+    incident = db["sos_incidents"].docs[0]
+    assert incident["triggers"] == 6
+    assert incident["reasons"] == ["Manual SOS", "Inactivity Alert"]
+    assert sum(not r["coalesced"] for r in results) == 1
+    assert sorted(c for c, kind in sent if kind == "🚨 EMERGENCY") == ["+917777777777", "+918888888888", "+919999999999"]
+    assert [c for c, kind in sent if kind == "📍 UPDATE"] == ["+919999999999"]
+    assert late["contacts_alerted"] == ["+917777777777"]
+    assert len(db_history.docs) == 1
+    assert db_history.docs[0]["notifiedContacts"] == ["+919999999999", "+918888888888", "+917777777777"]
+    assert db["sos_user_stats"].docs[0]["total_alerts"] == 1
+
+
+def test_quiet_incident_is_closed_and_next_trigger_opens_a_new_one():
+    db = InMemoryDatabase()
+    incidents = make_incidents(db)
+    start = datetime(2024, 1, 1)
+
+    async def scenario():
+        first, opened_first = await incidents.record_trigger("u", 1.0, 2.0, "Manual SOS", now=start)
+        again, opened_again = await incidents.record_trigger("u", 1.0, 2.0, "Manual SOS", now=start + timedelta(minutes=5))
+        later, opened_later = await incidents.record_trigger("u", 1.0, 2.0, "Manual SOS", now=start + timedelta(minutes=30))
+        return (first, opened_first), (again, opened_again), (later, opened_later)
+
+    (first, opened_first), (again, opened_again), (later, opened_later) = asyncio.run(scenario())
+
+    assert opened_first and not opened_again and opened_later
+    assert again["_id"] == first["_id"] and later["_id"] != first["_id"]
+    statuses = {doc["_id"]: doc["status"] for doc in db["sos_incidents"].docs}
+    assert statuses == {first["_id"]: "closed", later["_id"]: "open"}
+
+
+def test_failed_first_alert_releases_the_claim_for_the_next_trigger():
+    db = InMemoryDatabase()
+    incidents = make_incidents(db)
+    sent, down = [], {"+919999999999", "+918888888888"}
+
+    async def flaky_send(contact, message, network_status=None):
+        if contact in down:
+            if contact == "+918888888888":
+                raise AdmissionRejected(Priority.SOS, "queue full", retry_after=1)
+            # Twilio and Fast2SMS both fail inside the real send: only the simulated GSM fallback "sends"
+            return await notifier.send_notification(contact, message, network_status)
+        sent.append((contact, message.split(":")[0]))
+        return "✅ SMS sent"
+
+    def provider_down(contact, message):
+        raise ConnectionError("provider unreachable")
+
+    async def no_sound():
+        pass
+
+    async def no_followup(self, message):
+        pass
+
+    async def scenario():
+        with mock.patch.multiple(sos_controller, sos_incidents=incidents, sos_history_collection=db["sos_history"],
+                                 send_notification=flaky_send, play_alert_sound=no_sound), \
+                mock.patch.multiple(notifier.sms_service, send_via_twilio=provider_down, send_via_fast2sms=provider_down), \
+                mock.patch.object(notifier, "play_alert_sound", no_sound), \
+                mock.patch("database.sms_messages_collection", db["sms_messages"]), \
+                mock.patch.object(sms_delivery, "delivery_reports", sms_delivery.DeliveryReportBuffer(db["sms_messages"])), \
+                mock.patch.object(sms_delivery.DeliveryReportBuffer, "_retry", no_followup), \
+                mock.patch("utils.sos_stats.sos_user_stats_collection", db["sos_user_stats"]):
+            contacts = ["+919999999999", "+918888888888", "+917777777777"]
+            first = await sos_controller.trigger_sos("user@example.com", 18.5, 73.8, contacts)
+            down.clear()
+            second = await sos_controller.trigger_sos("user@example.com", 18.5, 73.8, contacts)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first["contacts_alerted"] == ["+917777777777"]
+    assert second["contacts_alerted"] == ["+919999999999", "+918888888888"]  # first alert, not a follow-up
+    assert [kind for _, kind in sent] == ["🚨 EMERGENCY"] * 3
+    assert db["sos_history"].docs[0]["notifiedContacts"] == ["+917777777777", "+919999999999", "+918888888888"]
+    assert [doc["followup"] for doc in db["sms_messages"].docs] == ["retried"]  # the fallback send is followed up too
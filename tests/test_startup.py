@@ -0,0 +1,51 @@
+import asyncio
+import subprocess
+import sys
+from unittest import mock
+
+import httpx
+
+import app.main as main
+from utils.startup import WarmUp
+
+
+def test_heavy_provider_sdks_are_not_imported_with_the_app():
+    probe = "import sys, app.main; print([m for m in ('twilio.rest', 'firebase_admin', 'geopy') if m in sys.modules])"
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == "[]"
+
+
+def test_warm_up_steps_run_concurrently_and_gate_readiness():
+    warm_up = WarmUp()
+
+    async def slow():
+        await asyncio.sleep(0.2)
+
+    async def broken():
+        raise RuntimeError("no firebase key")
+
+    warm_up.step("mongo_pool", slow, required=True)
+    warm_up.step("indexes", slow, required=True)
+    warm_up.step("firebase", broken)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            with mock.patch.object(main, "warm_up", warm_up):
+                before = await client.get("/ready")
+                await warm_up.run()
+                after = await client.get("/ready")
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before.status_code == 503 and before.json()["steps"]["mongo_pool"]["status"] == "pending"
+    assert after.status_code == 200
+    steps = after.json()["steps"]
+    assert steps["firebase"] == {"status": "failed", "required": False, "error": "no firebase key",
+                                 "duration_ms": steps["firebase"]["duration_ms"]}
+    assert after.json()["duration_ms"] < 350  # not 400: the two slow steps overlapped
+
+    failing = WarmUp()
+    failing.step("mongo_pool", broken, required=True)
+    assert asyncio.run(failing.run()) is False and failing.report()["finished"]
+    # sessions and incidents rely on unique indexes, so the app is not ready without them
+    assert main.warm_up.results["indexes"]["required"]
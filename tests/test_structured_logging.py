@@ -0,0 +1,70 @@
+import asyncio
+import json
+import logging
+import queue
+from unittest import mock
+
+import httpx
+
+import app.main as main
+import routes.system_routes as system_routes
+from utils.structured_logging import (
+    JsonFormatter, LogSampler, _ContextQueueHandler, journey_id_var, request_id_var,
+)
+
+
+def test_records_are_queued_unformatted_with_correlation_ids():
+    log_queue = queue.Queue(2)
+    handler = _ContextQueueHandler(log_queue)
+    logger = logging.getLogger("test.structured")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        request_token, journey_token = request_id_var.set("req-1"), journey_id_var.set("journey-9")
+        logger.warning("SOS triggered for %s", "alice", extra={"contacts": 2})
+        request_id_var.reset(request_token)
+        journey_id_var.reset(journey_token)
+        logger.warning("second")
+        logger.warning("dropped: queue is full")
+    finally:
+        logger.removeHandler(handler)
+
+    record = log_queue.get_nowait()
+    assert record.args == ("alice",)  # formatting is left to the writer thread
+    line = json.loads(JsonFormatter().format(record))
+    assert line["msg"] == "SOS triggered for alice" and line["level"] == "WARNING"
+    assert (line["request_id"], line["journey_id"], line["contacts"]) == ("req-1", "journey-9", 2)
+    assert "request_id" not in json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert handler.dropped == 1
+
+
+def test_sampler_logs_one_in_n():
+    sampler = LogSampler(every=10)
+    assert [i for i in range(35) if sampler.hit()] == [0, 10, 20, 30]
+
+
+def test_request_id_is_echoed_and_level_switches_at_runtime():
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            echoed = await client.get("/", headers={"X-Request-ID": "abc123"})
+            generated = await client.get("/")
+            change = {"logger": "utils.route_tracker", "level": "debug"}
+            with mock.patch.object(system_routes, "ADMIN_TOKEN", None):
+                unconfigured = await client.put("/api/system/log-level", json=change, headers={"X-Admin-Token": ""})
+            with mock.patch.object(system_routes, "ADMIN_TOKEN", "admin-secret"):
+                forbidden = await client.put("/api/system/log-level", json=change)
+                changed = await client.put("/api/system/log-level", json=change, headers={"X-Admin-Token": "admin-secret"})
+                rejected = await client.put("/api/system/log-level", json={"level": "LOUD"},
+                                            headers={"X-Admin-Token": "admin-secret"})
+        assert (unconfigured.status_code, forbidden.status_code) == (503, 403)
+        return echoed, generated, changed, rejected
+
+    try:
+        echoed, generated, changed, rejected = asyncio.run(scenario())
+        assert echoed.headers["x-request-id"] == "abc123"
+        assert len(generated.headers["x-request-id"]) == 16
+        assert changed.json()["loggers"]["utils.route_tracker"] == "DEBUG"
+        assert logging.getLogger("utils.route_tracker").isEnabledFor(logging.DEBUG)
+        assert rejected.status_code == 400
+    finally:
+        logging.getLogger("utils.route_tracker").setLevel(logging.NOTSET)
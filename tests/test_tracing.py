@@ -0,0 +1,90 @@
+import asyncio
+import contextvars
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+import controllers.sos_controller as sos_controller
+import utils.tracing as tracing
+from benchmarks.memory_mongo import InMemoryDatabase
+from benchmarks.otlp_collector_stub import render_trace
+from utils.metrics import NotificationTimer
+from utils.sos_incidents import SOSIncidents
+from utils.tracing import MongoTracingListener, Tracer, span
+
+
+def run_with_tracer(coroutine_factory):
+    fresh = Tracer()
+    exported = []
+    with mock.patch.object(tracing, "tracer", fresh), mock.patch.object(tracing, "TRACE_SAMPLE_RATE", 0.0), \
+            mock.patch.object(tracing, "TRACE_FILE", "unused"), \
+            mock.patch.object(fresh, "_ensure_exporter", lambda: None), \
+            mock.patch.object(fresh._export_queue, "put_nowait", exported.append):
+        asyncio.run(coroutine_factory())
+    return fresh, exported
+
+
+def test_failed_sos_trace_is_kept_with_provider_and_mongo_spans():
+    db = InMemoryDatabase()
+    listener = MongoTracingListener()
+
+    async def failing_send(contact, message, network_status=None):
+        with NotificationTimer("twilio", "sms") as timer:
+            # what pymongo reports from Motor's thread while the provider result is recorded
+            def mongo_call():
+                listener.started(SimpleNamespace(command={"insert": "sms_messages"}, command_name="insert", request_id=7))
+                listener.succeeded(SimpleNamespace(command_name="insert", request_id=7, duration_micros=1500))
+            await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, mongo_call)
+            timer.outcome = "rejected"
+        return "❌ All methods failed"
+
+    async def offline():
+        return False
+
+    async def no_sound():
+        pass
+
+    async def scenario():
+        with mock.patch.multiple(sos_controller, sos_incidents=SOSIncidents(db["sos_incidents"]),
+                                 sos_history_collection=db["sos_history"], send_notification=failing_send,
+                                 play_alert_sound=no_sound, is_online=offline), \
+                mock.patch("utils.sos_stats.sos_user_stats_collection", db["sos_user_stats"]):
+            await sos_controller.trigger_sos("user@example.com", 18.5, 73.8, ["+919999999999"])
+            # a fast, successful trace is dropped by the tail sampler
+            with span("HTTP GET /", root=True):
+                pass
+
+    fresh, exported = run_with_tracer(scenario)
+    assert fresh.stats()["kept"] == 1 and fresh.stats()["discarded"] == 1 and fresh.stats()["open"] == 0
+    spans = {s.name: s for s in exported[0]}
+    root = spans["sos.trigger"]
+    assert root.parent_id is None and root.error == "1 of 1 notifications failed"
+    assert root.attributes["user_id"] == "user@example.com" and root.attributes["opened"] is True
+    assert spans["notify.twilio"].parent_id == root.span_id and spans["notify.twilio"].error == "rejected"
+    assert spans["mongo.insert"].parent_id == spans["notify.twilio"].span_id
+    assert spans["mongo.insert"].attributes == {"collection": "sms_messages"}
+    assert round(spans["mongo.insert"].duration_seconds, 4) == 0.0015
+
+
+def test_slow_traces_are_kept_and_concurrent_children_keep_their_parents():
+    async def scenario():
+        async def child(name):
+            with span(name):
+                await asyncio.sleep(0.01)
+
+        with mock.patch.object(tracing, "TRACE_SLOW_SECONDS", 0.005):
+            with span("HTTP POST /api/sos", root=True):
+                await asyncio.gather(child("a"), child("b"))
+        with span("orphan"):  # no trace to join, nothing recorded
+            pass
+
+    fresh, exported = run_with_tracer(scenario)
+    assert fresh.stats()["started"] == 1 and len(exported) == 1
+    root = next(s for s in exported[0] if s.parent_id is None)
+    assert sorted(s.name for s in exported[0] if s.parent_id == root.span_id) == ["a", "b"]
+
+    otlp = tracing.to_otlp(exported)
+    otlp_spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert {s["name"] for s in otlp_spans} == {"HTTP POST /api/sos", "a", "b"}
+    assert render_trace(otlp_spans)[0].startswith("HTTP POST /api/sos")
+    json.dumps(otlp)
@@ -0,0 +1,377 @@
+"""
+Priority classes and admission control.
+
+Work is tagged with one of five classes, highest first: SOS, inactivity
+alerts, arrival notices, routine shares and scheduled pushes.
+
+`admission.admit(cls)` bounds how much of a class runs at once. Overflow
+either waits in the class's queue or, once the queue is full or the wait
+times out, is shed with AdmissionRejected.
+
+The class travels in a context variable. The shared resources further down
+(notifier, Mongo writers, CPU executor) are PriorityGates: each class may
+fill a gate only up to the share left after the reserves of the classes
+above it, and freed capacity goes to the highest waiting class first.
+Untagged work may use the whole gate, as before classes existed.
+"""
+import asyncio
+import contextvars
+import json
+import os
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional
+
+from utils.metrics import ADMISSION_REJECTIONS
+
+
+class Priority:
+    SOS = "sos"
+    INACTIVITY_ALERT = "inactivity_alert"
+    ARRIVAL = "arrival"
+    SHARE = "share"
+    SCHEDULED_PUSH = "scheduled_push"
+
+
+# Highest first
+PRIORITIES = (Priority.SOS, Priority.INACTIVITY_ALERT, Priority.ARRIVAL, Priority.SHARE, Priority.SCHEDULED_PUSH)
+# Gate service order: untagged work is served last but may use the whole gate
+_GATE_ORDER = PRIORITIES + (None,)
+
+_current_priority: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("priority", default=None)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a class is over its limit and cannot queue; the caller should shed the work."""
+
+    def __init__(self, priority: str, reason: str, retry_after: int = 1):
+        super().__init__(f"{priority} admission rejected: {reason}")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class ClassPolicy:
+    """
+    `concurrency`, `queue` and `queue_timeout` (seconds) of None mean
+    unlimited, unbounded and wait forever. `reserve` is the fraction of every
+    PriorityGate withheld from the classes below this one.
+    """
+    __slots__ = ("concurrency", "queue", "queue_timeout", "reserve")
+
+    def __init__(self, concurrency: Optional[int], queue: Optional[int], queue_timeout: Optional[float], reserve: float):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.reserve = reserve
+
+
+def _env_limit(name: str, default, cast):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return None if value.lower() == "unlimited" else cast(value)
+
+
+def _policy(priority: str, concurrency, queue, queue_timeout, reserve) -> ClassPolicy:
+    """Defaults, overridable with ADMISSION_<CLASS>_{CONCURRENCY,QUEUE,QUEUE_TIMEOUT,RESERVE} ("unlimited" for None)."""
+    prefix = f"ADMISSION_{priority.upper()}_"
+    return ClassPolicy(
+        _env_limit(prefix + "CONCURRENCY", concurrency, int),
+        _env_limit(prefix + "QUEUE", queue, int),
+        _env_limit(prefix + "QUEUE_TIMEOUT", queue_timeout, float),
+        float(os.getenv(prefix + "RESERVE", str(reserve))),
+    )
+
+
+# SOS is never limited, queued or shed. Alerts and notices queue rather than
+# drop; routine shares are shed after a short wait, and clients retry them.
+POLICIES: Dict[str, ClassPolicy] = {
+    Priority.SOS: _policy(Priority.SOS, None, None, None, 0.25),
+    Priority.INACTIVITY_ALERT: _policy(Priority.INACTIVITY_ALERT, 100, None, None, 0.10),
+    Priority.ARRIVAL: _policy(Priority.ARRIVAL, 50, None, None, 0.05),
+    Priority.SHARE: _policy(Priority.SHARE, 200, 200, 2.0, 0.10),
+    Priority.SCHEDULED_PUSH: _policy(Priority.SCHEDULED_PUSH, 8, None, None, 0.0),
+}
+
+
+def current_priority() -> Optional[str]:
+    return _current_priority.get()
+
+
+@contextmanager
+def priority(cls: str):
+    """Tags the work inside the block (and tasks it creates) with `cls`, without admission."""
+    token = _current_priority.set(cls)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def usable_share(cls: Optional[str], policies: Dict[str, ClassPolicy] = POLICIES) -> float:
+    """Fraction of a gate `cls` may fill: what the classes above it have not reserved."""
+    if cls is None:
+        return 1.0
+    above = PRIORITIES[:PRIORITIES.index(cls)]
+    return max(0.0, 1.0 - sum(policies[p].reserve for p in above))
+
+
+def _wake(waiters: Deque[asyncio.Future]) -> bool:
+    """Hands a slot to the oldest live waiter; False if there was none."""
+    while waiters:
+        waiter = waiters.popleft()
+        if not waiter.done():
+            waiter.set_result(None)
+            return True
+    return False
+
+
+class _ClassState:
+    __slots__ = ("in_flight", "waiters", "admitted", "queued", "rejected")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+
+class AdmissionController:
+    """Per-class concurrency limits with a bounded FIFO queue in front of each."""
+
+    resource = "admission"
+
+    def __init__(self, policies: Dict[str, ClassPolicy] = POLICIES):
+        self.policies = policies
+        self._states = {cls: _ClassState() for cls in PRIORITIES}
+
+    def _reject(self, cls: str, reason: str):
+        self._states[cls].rejected += 1
+        ADMISSION_REJECTIONS.labels(self.resource, cls).inc()
+        raise AdmissionRejected(cls, reason, retry_after=max(1, int(self.policies[cls].queue_timeout or 1)))
+
+    @asynccontextmanager
+    async def admit(self, cls: str):
+        """Runs the block as `cls` once the class has room; raises AdmissionRejected if it is shed."""
+        policy, state = self.policies[cls], self._states[cls]
+        if policy.concurrency is not None and state.in_flight >= policy.concurrency:
+            if policy.queue is not None and len(state.waiters) >= policy.queue:
+                self._reject(cls, "queue full")
+            waiter = asyncio.get_running_loop().create_future()
+            state.waiters.append(waiter)
+            state.queued += 1
+            try:
+                await asyncio.wait_for(waiter, policy.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject(cls, f"queued over {policy.queue_timeout}s")
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(state)  # the slot was handed over as we were cancelled
+                raise
+            finally:
+                if waiter in state.waiters:
+                    state.waiters.remove(waiter)
+            # the releasing task handed its slot over, so in_flight is unchanged
+        else:
+            state.in_flight += 1
+        state.admitted += 1
+        try:
+            with priority(cls):
+                yield
+        finally:
+            self._release(state)
+
+    def _release(self, state: _ClassState):
+        if not _wake(state.waiters):
+            state.in_flight -= 1
+
+    def stats(self) -> Dict[str, Dict[str, Optional[int]]]:
+        return {cls: {"limit": self.policies[cls].concurrency, "in_flight": state.in_flight,
+                      "queue_depth": len(state.waiters), "queued": state.queued,
+                      "admitted": state.admitted, "rejected": state.rejected}
+                for cls, state in self._states.items()}
+
+
+class PriorityGate:
+    """
+    A shared resource with `capacity` concurrent users. The current class may
+    hold at most `capacity * usable_share(class)` of it. `slot()` waits for
+    room; `acquire_nowait()` is for callers that shed instead of waiting.
+    """
+
+    def __init__(self, resource: str, capacity: int, policies: Dict[str, ClassPolicy] = POLICIES):
+        self.resource = resource
+        self.capacity = capacity
+        self.policies = policies
+        self.in_use = 0
+        self._waiters: Dict[Optional[str], Deque[asyncio.Future]] = {cls: deque() for cls in _GATE_ORDER}
+        self._held: Dict[Optional[str], int] = {cls: 0 for cls in _GATE_ORDER}
+        self._rejected: Dict[Optional[str], int] = {cls: 0 for cls in _GATE_ORDER}
+
+    def limit(self, cls: Optional[str]) -> int:
+        if self.capacity <= 0:
+            return 0
+        return max(1, int(self.capacity * usable_share(cls, self.policies)))
+
+    def _has_room(self, cls: Optional[str]) -> bool:
+        return self.in_use < self.limit(cls)
+
+    def _take(self, cls: Optional[str]):
+        self.in_use += 1
+        self._held[cls] += 1
+
+    def acquire_nowait(self) -> bool:
+        cls = current_priority()
+        if not self._has_room(cls):
+            self._rejected[cls] += 1
+            ADMISSION_REJECTIONS.labels(self.resource, cls or "untagged").inc()
+            return False
+        self._take(cls)
+        return True
+
+    def release(self, cls: Optional[str]):
+        self.in_use -= 1
+        self._held[cls] -= 1
+        for waiting in _GATE_ORDER:
+            waiters = self._waiters[waiting]
+            while waiters and self._has_room(waiting):
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self._take(waiting)  # held for the waiter before it runs
+                    waiter.set_result(None)
+            if waiters:
+                return  # no later class has a larger limit
+
+    @asynccontextmanager
+    async def slot(self):
+        cls = current_priority()
+        # waiters of this class or above go first
+        if self._has_room(cls) and not any(self._waiters[c] for c in _GATE_ORDER[:_GATE_ORDER.index(cls) + 1]):
+            self._take(cls)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[cls].append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    self.release(cls)
+                elif waiter in self._waiters[cls]:
+                    self._waiters[cls].remove(waiter)
+                raise
+        try:
+            yield
+        finally:
+            self.release(cls)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {cls or "untagged": {"limit": self.limit(cls), "in_use": self._held[cls],
+                                    "queue_depth": len(self._waiters[cls]), "rejected": self._rejected[cls]}
+                for cls in _GATE_ORDER}
+
+
+# Provider sends (SMS fallback chain and push batches) share the default thread
+# pool, so the notifier gate is sized to it; Mongo writers to the connection pool.
+NOTIFIER_CONCURRENCY = int(os.getenv("NOTIFIER_CONCURRENCY", str(min(32, (os.cpu_count() or 1) + 4))))
+MONGO_WRITE_CONCURRENCY = int(os.getenv("MONGO_WRITE_CONCURRENCY", os.getenv("MONGO_MAX_POOL_SIZE", "100")))
+
+admission = AdmissionController()
+notifier_gate = PriorityGate("notifier", NOTIFIER_CONCURRENCY)
+mongo_write_gate = PriorityGate("mongo_writes", MONGO_WRITE_CONCURRENCY)
+
+
+def admission_stats():
+    from utils.cpu_executor import cpu_executor  # imports this module
+    return {"admission": admission.stats(), "notifier": notifier_gate.stats(),
+            "mongo_writes": mongo_write_gate.stats(), "cpu_executor": cpu_executor.gate.stats()}
+
+
+# Requests admitted by method and path. Reads, provider callbacks and /system
+# endpoints are left unclassified; so is /trigger-security-check, whose push
+# batches are admitted one by one as scheduled pushes.
+ROUTE_PRIORITIES = {
+    ("POST", "/api/sos"): Priority.SOS,
+    ("POST", "/api/emergency/sos"): Priority.SOS,
+    ("POST", "/api/emergency/emergency-alert/"): Priority.SOS,
+    # a missed or wrong answer escalates to SOS, like inactivity
+    ("POST", "/api/security-check"): Priority.INACTIVITY_ALERT,
+    ("POST", "/api/share-location"): Priority.SHARE,
+    ("POST", "/api/location/update_location"): Priority.SHARE,
+    ("POST", "/api/update_location"): Priority.SHARE,
+    ("POST", "/api/share_route"): Priority.SHARE,
+    ("POST", "/share_route"): Priority.SHARE,
+}
+ROUTE_PREFIX_PRIORITIES = (("POST", "/api/sos/incidents/", Priority.SOS),)
+# Shares flagged is_emergency are run as SOS rather than shed
+EMERGENCY_SHARE_PATHS = {"/api/share-location", "/api/location/update_location"}
+
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    cls = ROUTE_PRIORITIES.get((method, path))
+    if cls is None:
+        cls = next((c for m, prefix, c in ROUTE_PREFIX_PRIORITIES if m == method and path.startswith(prefix)), None)
+    return cls
+
+
+async def _read_body(receive) -> bytes:
+    body, more = b"", True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return body
+
+
+def _is_emergency_share(body: bytes) -> bool:
+    try:
+        return json.loads(body or b"{}").get("is_emergency") is True
+    except (ValueError, AttributeError):
+        return False
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware admitting classified requests through `admission`.
+    Shed requests get a 503 with Retry-After before the body is parsed. The
+    body of a shed share is read only to spot an emergency share.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        cls = classify_request(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        admitted = False
+        try:
+            async with admission.admit(cls):
+                admitted = True
+                return await self.app(scope, receive, send)
+        except AdmissionRejected as rejected:
+            if admitted:
+                raise
+            shed = rejected
+
+        if scope["path"] in EMERGENCY_SHARE_PATHS:
+            body = await _read_body(receive)
+            if _is_emergency_share(body):
+                replayed = False
+
+                async def replay():
+                    nonlocal replayed
+                    if replayed:
+                        return await receive()  # http.disconnect
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+
+                async with admission.admit(Priority.SOS):
+                    return await self.app(scope, replay, send)
+
+        payload = json.dumps({"detail": "Server busy, try again."}).encode()
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode()),
+            (b"retry-after", str(shed.retry_after).encode())]})
+        await send({"type": "http.response.body", "body": payload})
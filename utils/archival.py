@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING, ReplaceOne
+
+from database import (
+    SOS_HISTORY_EXPIRY,
+    SOS_HISTORY_RETENTION_DAYS,
+    sos_history_archive_collection,
+    sos_history_collection,
+    user_routes_archive_collection,
+    user_routes_collection,
+)
+from models.user_route import UserRouteStatus
+
+logger = logging.getLogger(__name__)
+
+JOURNEY_RETENTION_DAYS = int(os.getenv("JOURNEY_RETENTION_DAYS", "7"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+
+# Journeys in these states are never touched again by the monitor or ingest path.
+TERMINAL_JOURNEY_STATUSES = [
+    UserRouteStatus.COMPLETED,
+    UserRouteStatus.INACTIVITY_ALERT,
+    UserRouteStatus.DEVIATION_ALERT,
+]
+
+
+async def move_to_archive(hot, cold, filter_query: dict, batch_size: Optional[int] = None) -> int:
+    """
+    Moves documents matching `filter_query` from `hot` to `cold` in batches.
+
+    Each batch is upserted into the archive by _id before it is deleted from
+    the hot collection, so an interrupted run leaves at most duplicates that
+    the next run overwrites and removes.
+    """
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    moved = 0
+    while True:
+        batch = await hot.find(filter_query).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        await cold.bulk_write([ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch], ordered=False)
+        result = await hot.delete_many({**filter_query, "_id": {"$in": [doc["_id"] for doc in batch]}})
+        moved += result.deleted_count
+
+        if len(batch) < batch_size:
+            break
+        await asyncio.sleep(0)  # let request handlers run between batches
+    return moved
+
+
+async def archive_finished_journeys(now: Optional[datetime] = None) -> int:
+    cutoff = (now or datetime.utcnow()) - timedelta(days=JOURNEY_RETENTION_DAYS)
+    return await move_to_archive(
+        user_routes_collection,
+        user_routes_archive_collection,
+        {"status": {"$in": TERMINAL_JOURNEY_STATUSES}, "last_updated_at": {"$lt": cutoff}},
+    )
+
+
+async def archive_sos_history(now: Optional[datetime] = None) -> int:
+    if SOS_HISTORY_EXPIRY != "archive":
+        return 0  # "delete" is handled by the TTL index, "keep" retains everything
+    cutoff = (now or datetime.utcnow()) - timedelta(days=SOS_HISTORY_RETENTION_DAYS)
+    return await move_to_archive(
+        sos_history_collection,
+        sos_history_archive_collection,
+        {"timestamp": {"$lt": cutoff}},
+    )
+
+
+async def run_archival():
+    """Scheduled job: moves expired journeys and SOS history into the archive tier."""
+    try:
+        journeys = await archive_finished_journeys()
+        sos_rows = await archive_sos_history()
+        logger.info(f"Archival run moved {journeys} journeys and {sos_rows} SOS history rows.")
+        return {"journeys": journeys, "sos_history": sos_rows}
+    except Exception as e:
+        logger.error(f"Archival run failed: {e}")
+        return {"error": str(e)}
+
+
+# --- Read API spanning the hot and archive tiers ---
+
+async def find_across_tiers(hot, cold, filter_query: dict, sort_field: str, limit: int = 50,
+                            before: Optional[datetime] = None, before_id=None) -> List[dict]:
+    """
+    Newest-first documents matching `filter_query` from both tiers. Pass the
+    last returned `sort_field` value as `before` (and its _id as `before_id`,
+    to page through ties exactly) to fetch the next page.
+    """
+    query = dict(filter_query)
+    if before is not None and before_id is not None:
+        query["$or"] = [{sort_field: {"$lt": before}}, {sort_field: before, "_id": {"$lt": before_id}}]
+    elif before is not None:
+        query[sort_field] = {"$lt": before}
+
+    order = [(sort_field, DESCENDING), ("_id", DESCENDING)]
+    hot_docs, cold_docs = await asyncio.gather(
+        hot.find(query).sort(order).limit(limit).to_list(length=limit),
+        cold.find(query).sort(order).limit(limit).to_list(length=limit),
+    )
+    # A move upserts into the archive before deleting from the hot tier, so a
+    # document can briefly be in both; the hot copy is the live one.
+    seen = {doc["_id"] for doc in hot_docs}
+    merged = hot_docs + [doc for doc in cold_docs if doc["_id"] not in seen]
+    merged = sorted(merged, key=lambda doc: (doc.get(sort_field) or datetime.min, doc["_id"]), reverse=True)
+    return merged[:limit]
+
+
+async def update_across_tiers(hot, cold, filter_query: dict, update: dict):
+    """update_one on the hot tier, or on the archive if the document has already been moved there."""
+    result = await hot.update_one(filter_query, update)
+    if result.matched_count == 0:
+        result = await cold.update_one(filter_query, update)
+    return result
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    """Page cursor after `doc`: its sort value and _id, for find_across_tiers' before/before_id."""
+    return f"{doc[sort_field].isoformat()}_{doc['_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    timestamp, _, doc_id = cursor.rpartition("_")
+    try:
+        return datetime.fromisoformat(timestamp), ObjectId(doc_id)
+    except (InvalidId, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+async def find_journeys(user_id: str, limit: int = 50, before: Optional[datetime] = None,
+                        before_id=None) -> List[dict]:
+    return await find_across_tiers(
+        user_routes_collection, user_routes_archive_collection,
+        {"user_id": user_id}, "last_updated_at", limit, before, before_id,
+    )
+
+
+async def find_sos_history(user_id: str, limit: int = 50, before: Optional[datetime] = None,
+                           before_id=None) -> List[dict]:
+    return await find_across_tiers(
+        sos_history_collection, sos_history_archive_collection,
+        {"user_id": user_id}, "timestamp", limit, before, before_id,
+    )
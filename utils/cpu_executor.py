@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+import bcrypt
+
+from utils.admission import PriorityGate, current_priority
+
+logger = logging.getLogger(__name__)
+
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait or run in the pool at once; beyond this, callers are rejected instead of queued.
+CPU_EXECUTOR_QUEUE_LIMIT = int(os.getenv("CPU_EXECUTOR_QUEUE_LIMIT", str(CPU_EXECUTOR_WORKERS * 8)))
+
+
+class CpuExecutorOverloaded(Exception):
+    """Raised when the CPU pool's queue is full; the caller should shed the request."""
+
+
+def verify_bcrypt(code: str, hashed_code: str) -> bool:
+    # Module-level so it can be pickled to the worker processes.
+    return bcrypt.checkpw(code.encode(), hashed_code.encode())
+
+
+def _noop() -> None:
+    return None
+
+
+class CpuExecutor:
+    """
+    Process pool for CPU-heavy work (bcrypt, ...) that must not run on the
+    event loop. Admission is checked before submitting: once `queue_limit`
+    jobs are pending, `run` fails fast with CpuExecutorOverloaded rather than
+    letting latency grow without bound. Lower priority classes are rejected
+    earlier, leaving the rest of the queue to the classes above them.
+    """
+
+    def __init__(self, workers: int = CPU_EXECUTOR_WORKERS, queue_limit: int = CPU_EXECUTOR_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.gate = PriorityGate("cpu_executor", queue_limit)
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs Motor's threads is unsafe.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _discard_broken_pool(self, pool: ProcessPoolExecutor):
+        # Jobs in flight on the broken pool all fail together; only the first replaces it.
+        if self._pool is pool:
+            logger.warning("CPU executor pool is broken (a worker died); starting a new one")
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _submit(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # A dead worker breaks the pool for good; retry once on a fresh one.
+            self._discard_broken_pool(pool)
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+
+    async def start(self):
+        """Spawns every worker up front so the first requests don't pay process start-up."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.workers)))
+
+    async def run(self, fn: Callable, *args):
+        cls = current_priority()
+        if not self.gate.acquire_nowait():
+            self.rejected += 1
+            raise CpuExecutorOverloaded(f"CPU executor queue full for {cls or 'untagged'} work ({self._pending} pending)")
+        self._pending += 1
+        try:
+            result = await self._submit(fn, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+            self.gate.release(cls)
+        self.completed += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class AttemptThrottle:
+    """
+    Sliding-window limit on verification attempts per key (user email), plus
+    at most one verification in flight per key, so a client hammering wrong
+    codes can't occupy the shared pool.
+    """
+
+    def __init__(self, max_attempts: int, window_seconds: float):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self._attempts: Dict[str, deque] = {}
+        self._in_flight = set()
+        self._last_purge = 0.0
+
+    def _purge(self, now: float):
+        stale = [key for key, attempts in self._attempts.items()
+                 if attempts[-1] <= now - self.window_seconds and key not in self._in_flight]
+        for key in stale:
+            del self._attempts[key]
+        self._last_purge = now
+
+    def acquire(self, key: str, now: Optional[float] = None) -> bool:
+        now = now or time.monotonic()
+        if now - self._last_purge > self.window_seconds:
+            self._purge(now)
+        if key in self._in_flight:
+            return False
+        attempts = self._attempts.setdefault(key, deque())
+        while attempts and attempts[0] <= now - self.window_seconds:
+            attempts.popleft()
+        if len(attempts) >= self.max_attempts:
+            return False
+        attempts.append(now)
+        self._in_flight.add(key)
+        return True
+
+    def release(self, key: str):
+        self._in_flight.discard(key)
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> int:
+        attempts = self._attempts.get(key)
+        if not attempts or len(attempts) < self.max_attempts:
+            return 1
+        now = now or time.monotonic()
+        return max(1, int(attempts[0] + self.window_seconds - now) + 1)
+
+
+cpu_executor = CpuExecutor()
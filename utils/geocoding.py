@@ -0,0 +1,225 @@
+"""
+Reverse geocoding of alert locations, for a human-readable place in SOS
+messages.
+
+Lookups are keyed by geohash cell (GEOHASH_PRECISION 7 is about 150 m) and
+go through an in-memory LRU, then the `geocode_cache` collection, then the
+geopy provider. The caller waits at most GEOCODING_BUDGET_MS; a slower
+lookup keeps running in the background and fills the cache for the alert's
+follow-ups, while this message goes out with the gazetteer's nearest place
+or no address at all. GEOCODING_MODE=offline answers from the local
+gazetteer only (CSV with name,lat,lng columns).
+"""
+import asyncio
+import csv
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from database import geocode_cache_collection
+from utils.metrics import GEOCODE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+GEOCODING_ENABLED = os.getenv("GEOCODING_ENABLED", "false").lower() == "true"
+GEOCODING_MODE = os.getenv("GEOCODING_MODE", "online")  # "online" or "offline"
+GEOCODER = os.getenv("GEOCODER", "nominatim")  # any geopy service name
+GEOCODER_USER_AGENT = os.getenv("GEOCODER_USER_AGENT", "shieldx-back")
+GEOCODER_API_KEY = os.getenv("GEOCODER_API_KEY")
+# The provider call itself may outlive the budget, to fill the cache.
+GEOCODER_TIMEOUT_SECONDS = float(os.getenv("GEOCODER_TIMEOUT_SECONDS", "5"))
+GEOCODING_BUDGET_MS = float(os.getenv("GEOCODING_BUDGET_MS", "300"))
+GEOHASH_PRECISION = int(os.getenv("GEOHASH_PRECISION", "7"))
+GEOCODING_CACHE_SIZE = int(os.getenv("GEOCODING_CACHE_SIZE", "10000"))
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+GAZETTEER_MAX_DISTANCE_KM = float(os.getenv("GAZETTEER_MAX_DISTANCE_KM", "5"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_MISSING = object()
+
+
+def geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    dlat, dlng = math.radians(lat2 - lat1), math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def _short_address(address: Optional[str], parts: int = 3) -> Optional[str]:
+    """Providers return the full hierarchy down to the country; SMS needs the first few parts."""
+    if not address:
+        return None
+    return ", ".join(part.strip() for part in address.split(",")[:parts])
+
+
+class Gazetteer:
+    """Nearest named place from a local CSV (name,lat,lng), bucketed on a 0.1 degree grid."""
+
+    def __init__(self, path: str, max_distance_km: float = GAZETTEER_MAX_DISTANCE_KM):
+        self.max_distance_km = max_distance_km
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, str]]] = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                lat, lng = float(row["lat"]), float(row["lng"])
+                self._cells.setdefault(self._cell(lat, lng), []).append((lat, lng, row["name"]))
+
+    @staticmethod
+    def _cell(lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat * 10), math.floor(lng * 10)
+
+    def nearest(self, lat: float, lng: float) -> Optional[str]:
+        # Neighbouring cells cover at least 0.1 degree (about 5 km at 60 degrees latitude) around the point.
+        cell_lat, cell_lng = self._cell(lat, lng)
+        best, best_km = None, self.max_distance_km
+        for dlat in (-1, 0, 1):
+            for dlng in (-1, 0, 1):
+                for place_lat, place_lng, name in self._cells.get((cell_lat + dlat, cell_lng + dlng), ()):
+                    distance = _haversine_km(lat, lng, place_lat, place_lng)
+                    if distance <= best_km:
+                        best, best_km = name, distance
+        return best
+
+
+class ReverseGeocoder:
+    """
+    Coordinates to a short address. Concurrent lookups of one cell share a
+    single provider call. Misses the provider answered with no address are
+    cached too, so the ocean isn't looked up on every alert.
+    """
+
+    def __init__(self, collection, enabled: bool = GEOCODING_ENABLED, mode: str = GEOCODING_MODE,
+                 budget_ms: float = GEOCODING_BUDGET_MS, cache_size: int = GEOCODING_CACHE_SIZE,
+                 gazetteer_path: Optional[str] = GAZETTEER_PATH):
+        self.collection = collection
+        self.enabled = enabled
+        self.mode = mode
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.gazetteer_path = gazetteer_path
+        self._memory: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._gazetteer: Optional[Gazetteer] = None
+        self._gazetteer_loading: Optional[asyncio.Task] = None
+        self._geocoder = None
+        self.counts = {source: 0 for source in ("memory", "mongo", "provider", "gazetteer", "timeout", "error")}
+
+    def _count(self, source: str):
+        self.counts[source] += 1
+        GEOCODE_LOOKUPS.labels(source).inc()
+
+    def _remember(self, key: str, address: Optional[str]):
+        self._memory[key] = address
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.cache_size:
+            self._memory.popitem(last=False)
+
+    async def lookup(self, lat: float, lng: float) -> Optional[str]:
+        """Short address for the point, or None if disabled, unknown or over budget."""
+        if not self.enabled:
+            return None
+        if self.mode == "offline":
+            return await self._from_gazetteer(lat, lng)
+
+        key = geohash(lat, lng)
+        address = self._memory.get(key, _MISSING)
+        if address is not _MISSING:
+            self._memory.move_to_end(key)
+            self._count("memory")
+            return address
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._resolve(key, lat, lng))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            address, source = await asyncio.wait_for(asyncio.shield(task), self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            self._count("timeout")
+            return await self._from_gazetteer(lat, lng)
+        self._count(source)
+        if source == "error":
+            return await self._from_gazetteer(lat, lng)
+        return address
+
+    async def _resolve(self, key: str, lat: float, lng: float) -> Tuple[Optional[str], str]:
+        try:
+            doc = await self.collection.find_one({"_id": key}, {"address": 1})
+            if doc is not None:
+                self._remember(key, doc.get("address"))
+                return doc.get("address"), "mongo"
+
+            started = time.perf_counter()
+            address = _short_address(await asyncio.to_thread(self._reverse, lat, lng))
+            logger.info("Reverse geocoded", extra={"geohash": key, "provider": GEOCODER,
+                                                  "ms": round((time.perf_counter() - started) * 1000)})
+            self._remember(key, address)
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"address": address, "provider": GEOCODER, "cached_at": datetime.utcnow()}},
+                upsert=True
+            )
+            return address, "provider"
+        except Exception as e:
+            logger.warning("Reverse geocoding failed", extra={"geohash": key, "error": str(e)})
+            return None, "error"
+
+    def _reverse(self, lat: float, lng: float) -> Optional[str]:
+        if self._geocoder is None:
+            # geopy imports all of its geocoders with it, so it is loaded on first use.
+            from geopy.geocoders import get_geocoder_for_service
+
+            options = {"api_key": GEOCODER_API_KEY} if GEOCODER_API_KEY else {}
+            self._geocoder = get_geocoder_for_service(GEOCODER)(user_agent=GEOCODER_USER_AGENT, **options)
+        location = self._geocoder.reverse((lat, lng), exactly_one=True, timeout=GEOCODER_TIMEOUT_SECONDS)
+        return location.address if location is not None else None
+
+    async def _from_gazetteer(self, lat: float, lng: float) -> Optional[str]:
+        if not self.gazetteer_path:
+            return None
+        if self._gazetteer is None:
+            if self._gazetteer_loading is None:
+                self._gazetteer_loading = asyncio.create_task(asyncio.to_thread(Gazetteer, self.gazetteer_path))
+            try:
+                self._gazetteer = await asyncio.shield(self._gazetteer_loading)
+            except Exception as e:
+                logger.error("Loading gazetteer failed", extra={"path": self.gazetteer_path, "error": str(e)})
+                self.gazetteer_path = None
+                return None
+        name = self._gazetteer.nearest(lat, lng)
+        self._count("gazetteer")
+        return name
+
+    def stats(self) -> Dict[str, float]:
+        cached = self.counts["memory"] + self.counts["mongo"]
+        answered = cached + self.counts["provider"] + self.counts["timeout"] + self.counts["error"]
+        return {
+            **self.counts,
+            "memory_size": len(self._memory),
+            "hit_rate": round(cached / answered, 4) if answered else 0.0,
+        }
+
+
+reverse_geocoder = ReverseGeocoder(geocode_cache_collection)
@@ -0,0 +1,179 @@
+"""
+Hot query shapes and the checks that keep them on an index.
+
+Every query the request path or a sweep runs at volume is listed in
+HOT_QUERIES with representative values. `uncovered_queries()` checks them
+statically against database.INDEXES; `index_report()` runs explain() for
+each one against a live database and reports collection scans, blocking
+in-memory sorts and registered indexes the server is missing.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from controllers.periodic_check_controller import SECURITY_CHECK_ELIGIBILITY_FILTER
+from database import INDEXES, IndexSpec
+from models.user_route import UserRouteStatus
+from utils.archival import TERMINAL_JOURNEY_STATUSES
+from utils.push_receipts import PushTicketStatus
+from utils.security_check_sessions import SecurityCheckStatus
+from utils.sos_incidents import SOSIncidentStatus
+
+# Plan stages that mean the query is not served by an index
+COLLSCAN = "COLLSCAN"
+BLOCKING_SORT = "SORT"
+
+
+class HotQuery:
+    __slots__ = ("name", "collection", "filter", "sort", "limit")
+
+    def __init__(self, name: str, collection: str, filter: dict,
+                 sort: Optional[List[Tuple[str, int]]] = None, limit: int = 0):
+        self.name = name
+        self.collection = collection
+        self.filter = filter
+        self.sort = sort or []
+        self.limit = limit
+
+    async def explain(self, database) -> dict:
+        cursor = database[self.collection].find(self.filter)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        if self.limit:
+            cursor = cursor.limit(self.limit)
+        return await cursor.explain()
+
+
+_EMAIL = "someone@example.com"  # user_id is the user's email throughout
+_CUTOFF = datetime(2026, 1, 1)
+
+HOT_QUERIES: List[HotQuery] = [
+    # utils.route_tracker: the running journey a location fix belongs to
+    HotQuery("active_journey", "user_routes", {"user_id": _EMAIL, "status": UserRouteStatus.RUNNING},
+             [("last_updated_at", DESCENDING)], limit=1),
+    # utils.journey_registry: the leader's sync of every running journey before a monitor pass
+    HotQuery("running_journeys", "user_routes", {"status": UserRouteStatus.RUNNING}),
+    # utils.archival: journey history pages, both tiers
+    HotQuery("journey_history", "user_routes", {"user_id": _EMAIL, "last_updated_at": {"$lt": _CUTOFF}},
+             [("last_updated_at", DESCENDING), ("_id", DESCENDING)], limit=50),
+    HotQuery("journey_history_archive", "user_routes_archive",
+             {"user_id": _EMAIL, "last_updated_at": {"$lt": _CUTOFF}},
+             [("last_updated_at", DESCENDING), ("_id", DESCENDING)], limit=50),
+    HotQuery("journey_archival", "user_routes",
+             {"status": {"$in": TERMINAL_JOURNEY_STATUSES}, "last_updated_at": {"$lt": _CUTOFF}}, limit=1000),
+    # utils.archival: SOS history pages and the retention scan
+    HotQuery("sos_history", "sos_history", {"user_id": _EMAIL, "timestamp": {"$lt": _CUTOFF}},
+             [("timestamp", DESCENDING), ("_id", DESCENDING)], limit=50),
+    HotQuery("sos_history_archive", "sos_history_archive", {"user_id": _EMAIL, "timestamp": {"$lt": _CUTOFF}},
+             [("timestamp", DESCENDING), ("_id", DESCENDING)], limit=50),
+    HotQuery("sos_history_archival", "sos_history", {"timestamp": {"$lt": _CUTOFF}}, limit=1000),
+    # controllers.sos_controller: follow-up triggers update the incident's history row
+    HotQuery("sos_history_by_incident", "sos_history", {"incident_id": "incident"}),
+    # utils.sos_incidents: the open incident a new trigger coalesces on
+    HotQuery("open_incident", "sos_incidents", {"user_id": _EMAIL, "status": SOSIncidentStatus.OPEN,
+                                                "last_trigger_at": {"$gte": _CUTOFF}}),
+    # controllers.periodic_check_controller: the security-check scan, slotted and unslotted
+    HotQuery("security_check_scan", "users", {**SECURITY_CHECK_ELIGIBILITY_FILTER, "_id": {"$gt": ObjectId("0" * 24)}},
+             [("_id", ASCENDING)]),
+    HotQuery("security_check_slot_scan", "users",
+             {**SECURITY_CHECK_ELIGIBILITY_FILTER, "securityCheckSlot": 7, "_id": {"$gt": ObjectId("0" * 24)}},
+             [("_id", ASCENDING)]),
+    # utils.security_check_schedule: enabled users without a slot yet
+    HotQuery("unslotted_users", "users", {"isSecurityCheckEnabled": True, "securityCheckSlot": {"$exists": False}}),
+    # database: user and device-token lookups
+    HotQuery("user_by_email", "users", {"email": _EMAIL}, limit=1),
+    HotQuery("users_by_token", "users", {"deviceToken.token": {"$in": ["ExponentPushToken[x]"]},
+                                         "deviceToken.invalid": {"$ne": True}}),
+    # utils.security_check_sessions: the user's pending session and the overdue sweep
+    HotQuery("pending_security_check", "security_checks", {"user_email": _EMAIL, "status": SecurityCheckStatus.PENDING,
+                                                           "expires_at": {"$gt": _CUTOFF}}, limit=1),
+    HotQuery("overdue_security_checks", "security_checks",
+             {"status": SecurityCheckStatus.PENDING, "expires_at": {"$lt": _CUTOFF}}),
+    # utils.push_receipts and utils.sms_delivery sweeps
+    HotQuery("pending_push_tickets", "push_tickets",
+             {"status": PushTicketStatus.PENDING, "sent_at": {"$lt": _CUTOFF - timedelta(minutes=15)}}),
+    HotQuery("stale_emergency_sms", "sms_messages", {"emergency": True, "status_rank": {"$lt": 3},
+                                                     "created_at": {"$lt": _CUTOFF}, "followup": {"$exists": False}}),
+]
+
+
+def serves(spec: IndexSpec, query: HotQuery) -> bool:
+    """
+    Whether `spec` can answer `query` without a collection scan or a blocking
+    sort: its leading keys are equality fields of the filter, followed by the
+    sort keys in order (or all reversed). A partial index also needs its
+    filter expression repeated as equalities in the query.
+    """
+    if spec.collection != query.collection or not spec.keys or spec.keys[0][0] not in query.filter:
+        return False
+    for field, value in spec.options.get("partialFilterExpression", {}).items():
+        if query.filter.get(field) != value:
+            return False
+
+    equalities = {field for field, value in query.filter.items()
+                  if not isinstance(value, dict) or ("$in" in value and not query.sort)}
+    position = 0
+    while position < len(spec.keys) and spec.keys[position][0] in equalities:
+        position += 1
+    if not query.sort:
+        return True
+
+    following = spec.keys[position:position + len(query.sort)]
+    if [field for field, _ in following] != [field for field, _ in query.sort]:
+        return False
+    same = [index_direction == sort_direction for (_, index_direction), (_, sort_direction) in zip(following, query.sort)]
+    return all(same) or not any(same)
+
+
+def uncovered_queries(queries: Iterable[HotQuery] = HOT_QUERIES,
+                      indexes: Iterable[IndexSpec] = INDEXES) -> List[str]:
+    """Names of the queries no registered index serves."""
+    indexes = list(indexes)
+    return [query.name for query in queries if not any(serves(spec, query) for spec in indexes)]
+
+
+def _stages(plan) -> Iterable[dict]:
+    # Classic, SBE ("queryPlan") and sharded ("shards") plans all nest stages under varying keys.
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def plan_problems(explain: dict) -> Dict[str, List[str]]:
+    """Indexes the winning plan uses, and any collection scan or blocking sort in it."""
+    stages = list(_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+    problems = []
+    if any(stage["stage"] == COLLSCAN for stage in stages):
+        problems.append("collection scan")
+    if any(stage["stage"] == BLOCKING_SORT for stage in stages):
+        problems.append("in-memory sort")
+    indexes = sorted({stage["indexName"] for stage in stages if stage.get("indexName")})
+    return {"indexes": indexes, "problems": problems}
+
+
+async def index_report(database) -> dict:
+    """explain() for every hot query, plus registered indexes missing on the server."""
+    queries = []
+    for query in HOT_QUERIES:
+        queries.append({"name": query.name, "collection": query.collection, **plan_problems(await query.explain(database))})
+
+    missing = []
+    existing = {}
+    for spec in INDEXES:
+        if spec.collection not in existing:
+            existing[spec.collection] = await database[spec.collection].index_information()
+        if spec.name not in existing[spec.collection]:
+            missing.append(f"{spec.collection}.{spec.name}")
+
+    return {
+        "queries": queries,
+        "failing": [query["name"] for query in queries if query["problems"]],
+        "missing_indexes": missing,
+    }
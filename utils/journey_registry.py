@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from models.user_route import UserRouteStatus
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("JOURNEY_CHECKPOINT_INTERVAL_SECONDS", "5"))
+CHECKPOINT_BATCH_SIZE = int(os.getenv("JOURNEY_CHECKPOINT_BATCH_SIZE", "500"))
+# Journeys without a fix for this long are dropped from a worker's registry; the next fix re-adopts them from Mongo.
+IDLE_EVICT_SECONDS = float(os.getenv("JOURNEY_IDLE_EVICT_SECONDS", "600"))
+
+# Only the fields the registry needs are pulled from user_routes documents.
+JOURNEY_PROJECTION = {
+    "_id": 0,
+    "journey_id": 1,
+    "user_id": 1,
+    "status": 1,
+    "start_point": 1,
+    "end_point": 1,
+    "current_loc_coordinates": 1,
+    "previous_loc_coordinates": 1,
+    "last_updated_at": 1,
+    "last_notification_time": 1,
+    "emergency_contact": 1,
+}
+
+
+def to_epoch(value: Optional[datetime]) -> float:
+    """Naive-UTC datetime (as stored by this service) -> epoch seconds."""
+    if value is None:
+        return 0.0
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def from_epoch(value: float) -> datetime:
+    """Epoch seconds -> naive-UTC datetime, matching datetime.utcnow() documents."""
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+class JourneyRecord:
+    """
+    Compact state of one running journey.
+
+    Coordinates and timestamps are plain floats (timestamps as epoch seconds),
+    status is one of the shared UserRouteStatus strings and user_id is shared
+    with the registry's user index, so a record plus its index entries costs
+    roughly 600 bytes. `python -m benchmarks.journey_registry_memory` measures it.
+    """
+
+    __slots__ = (
+        "journey_id",
+        "user_id",
+        "cur_lat",
+        "cur_lng",
+        "prev_lat",
+        "prev_lng",
+        "end_lat",
+        "end_lng",
+        "last_updated_at",
+        "last_notification_at",
+        "status",
+        "contact",
+    )
+
+    def __init__(self, journey_id: str, user_id: str, cur_lat: float, cur_lng: float,
+                 prev_lat: float, prev_lng: float, end_lat: float, end_lng: float,
+                 last_updated_at: float, last_notification_at: float = 0.0,
+                 status: str = UserRouteStatus.RUNNING, contact: str = ""):
+        self.journey_id = journey_id
+        self.user_id = user_id
+        self.cur_lat = cur_lat
+        self.cur_lng = cur_lng
+        self.prev_lat = prev_lat
+        self.prev_lng = prev_lng
+        self.end_lat = end_lat
+        self.end_lng = end_lng
+        self.last_updated_at = last_updated_at
+        self.last_notification_at = last_notification_at
+        self.status = status
+        self.contact = contact
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "JourneyRecord":
+        current = doc.get("current_loc_coordinates") or doc["start_point"]
+        previous = doc.get("previous_loc_coordinates") or current
+        return cls(
+            journey_id=doc["journey_id"],
+            user_id=doc["user_id"],
+            cur_lat=float(current["latitude"]),
+            cur_lng=float(current["longitude"]),
+            prev_lat=float(previous["latitude"]),
+            prev_lng=float(previous["longitude"]),
+            end_lat=float(doc["end_point"]["latitude"]),
+            end_lng=float(doc["end_point"]["longitude"]),
+            last_updated_at=to_epoch(doc.get("last_updated_at")),
+            last_notification_at=to_epoch(doc.get("last_notification_time")),
+            status=doc.get("status", UserRouteStatus.RUNNING),
+            contact=doc.get("emergency_contact") or "",
+        )
+
+    def move_to(self, lat: float, lng: float, now: float):
+        self.prev_lat = self.cur_lat
+        self.prev_lng = self.cur_lng
+        self.cur_lat = lat
+        self.cur_lng = lng
+        self.last_updated_at = now
+
+    def checkpoint_fields(self) -> dict:
+        """The mutable part of the journey as user_routes document fields."""
+        fields = {
+            "current_loc_coordinates": {"latitude": self.cur_lat, "longitude": self.cur_lng},
+            "previous_loc_coordinates": {"latitude": self.prev_lat, "longitude": self.prev_lng},
+            "last_updated_at": from_epoch(self.last_updated_at),
+            "status": self.status,
+        }
+        if self.last_notification_at:
+            fields["last_notification_time"] = from_epoch(self.last_notification_at)
+        return fields
+
+
+class JourneyRegistry:
+    """
+    In-process view of running journeys.
+
+    Every worker adopts the journeys whose fixes it receives, mutates them in
+    place on the location ingest path and writes them back to Mongo in
+    batched checkpoints instead of one write per fix. Only the scheduler lease
+    holder runs the route monitor; it syncs the full running set from Mongo
+    before each pass, so it sees the fixes other workers checkpointed.
+    """
+
+    def __init__(self):
+        self._by_journey: Dict[str, JourneyRecord] = {}
+        self._by_user: Dict[str, str] = {}
+        self._dirty: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._by_journey)
+
+    def add(self, record: JourneyRecord):
+        self._by_journey[record.journey_id] = record
+        self._by_user[record.user_id] = record.journey_id
+
+    def get(self, journey_id: str) -> Optional[JourneyRecord]:
+        return self._by_journey.get(journey_id)
+
+    def for_user(self, user_id: str) -> Optional[JourneyRecord]:
+        journey_id = self._by_user.get(user_id)
+        return self._by_journey.get(journey_id) if journey_id else None
+
+    def remove(self, journey_id: str) -> Optional[JourneyRecord]:
+        record = self._by_journey.pop(journey_id, None)
+        self._dirty.discard(journey_id)
+        if record and self._by_user.get(record.user_id) == journey_id:
+            del self._by_user[record.user_id]
+        return record
+
+    def records(self) -> List[JourneyRecord]:
+        """Snapshot of the running journeys, safe to iterate while the registry changes."""
+        return list(self._by_journey.values())
+
+    def mark_dirty(self, record: JourneyRecord):
+        self._dirty.add(record.journey_id)
+
+    def record_fix(self, user_id: str, lat: float, lng: float, now: float,
+                   journey_id: Optional[str] = None) -> Optional[JourneyRecord]:
+        """
+        Applies a location fix to the user's running journey. Returns None when
+        this process does not hold the journey, so the caller can fall back to Mongo.
+        """
+        record = self.get(journey_id) if journey_id else self.for_user(user_id)
+        if record is None or record.user_id != user_id:
+            return None
+        record.move_to(lat, lng, now)
+        self._dirty.add(record.journey_id)
+        return record
+
+    def clear(self):
+        self._by_journey.clear()
+        self._by_user.clear()
+        self._dirty.clear()
+
+    async def sync(self, collection) -> int:
+        """
+        Merges every running journey in `collection` into the registry: new
+        journeys are added, newer checkpoints replace clean records and
+        journeys no longer running are dropped. Dirty records are kept as they are.
+        """
+        started = time.time()
+        running: Set[str] = set()
+        cursor = collection.find({"status": UserRouteStatus.RUNNING}, JOURNEY_PROJECTION).batch_size(1000)
+        async for doc in cursor:
+            try:
+                fresh = JourneyRecord.from_document(doc)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed journey {doc.get('journey_id')}: {e}")
+                continue
+            running.add(fresh.journey_id)
+            record = self._by_journey.get(fresh.journey_id)
+            if record is None:
+                self.add(fresh)
+            elif fresh.journey_id not in self._dirty and fresh.last_updated_at > record.last_updated_at:
+                fresh.last_notification_at = max(fresh.last_notification_at, record.last_notification_at)
+                self.add(fresh)
+        # Journeys adopted after the scan started may not be in it yet.
+        for record in self.records():
+            if record.journey_id not in running and record.journey_id not in self._dirty \
+                    and record.last_updated_at < started:
+                self.remove(record.journey_id)
+        logger.debug(f"Journey registry synced {len(self)} running journeys.")
+        return len(self)
+
+    def evict_idle(self, cutoff: float) -> int:
+        """Drops clean journeys last updated before `cutoff` (epoch seconds)."""
+        idle = [record.journey_id for record in self._by_journey.values()
+                if record.last_updated_at < cutoff and record.journey_id not in self._dirty]
+        for journey_id in idle:
+            self.remove(journey_id)
+        return len(idle)
+
+    async def _drop_ended(self, collection, journey_ids: List[str]):
+        """Removes journeys another worker has ended, so the user's next fix finds their new journey."""
+        running = {
+            doc["journey_id"] async for doc in collection.find(
+                {"journey_id": {"$in": journey_ids}, "status": UserRouteStatus.RUNNING}, {"_id": 0, "journey_id": 1}
+            )
+        }
+        for journey_id in journey_ids:
+            if journey_id not in running:
+                self.remove(journey_id)
+
+    async def checkpoint(self, collection) -> int:
+        """Writes dirty journeys back to `collection` in unordered bulk batches."""
+        if not self._dirty:
+            return 0
+
+        dirty, self._dirty = self._dirty, set()
+        journey_ids = [journey_id for journey_id in dirty if journey_id in self._by_journey]
+
+        written = 0
+        for i in range(0, len(journey_ids), CHECKPOINT_BATCH_SIZE):
+            batch_ids = journey_ids[i:i + CHECKPOINT_BATCH_SIZE]
+            batch = [
+                UpdateOne(
+                    {"journey_id": journey_id, "status": UserRouteStatus.RUNNING},
+                    {"$set": self._by_journey[journey_id].checkpoint_fields()}
+                )
+                for journey_id in batch_ids
+                if journey_id in self._by_journey
+            ]
+            try:
+                result = await collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+                if result is not None and result.matched_count < len(batch):
+                    await self._drop_ended(collection, batch_ids)
+            except Exception as e:
+                logger.error(f"Journey checkpoint batch failed: {e}")
+                # Keep the unwritten journeys dirty for the next checkpoint.
+                self._dirty.update(j for j in journey_ids[i:] if j in self._by_journey)
+                break
+        return written
+
+    async def run_checkpoint_loop(self, collection):
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL_SECONDS)
+            await self.checkpoint(collection)
+            self.evict_idle(time.time() - IDLE_EVICT_SECONDS)
+
+
+journey_registry = JourneyRegistry()
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE_TTL_SECONDS = float(os.getenv("LEADER_LEASE_TTL_SECONDS", "15"))
+# Leaders renew and followers retry this often; failover takes at most TTL + one interval.
+LEADER_LEASE_RENEW_SECONDS = float(os.getenv("LEADER_LEASE_RENEW_SECONDS", "5"))
+
+
+class LeaderLease:
+    """
+    Lease-based leader election on a single Mongo document.
+
+    The document `{_id: name, holder, expires_at}` is taken with one
+    conditional upsert that only matches if this process already holds it or
+    the lease has expired; otherwise the upsert collides on _id and the
+    caller stays a follower. A leader that cannot renew (e.g. Mongo is
+    unreachable) steps down on its own once its local copy of the lease runs
+    out, so two leaders never overlap by more than clock skew.
+    """
+
+    def __init__(self, collection, name: str, ttl_seconds: float = LEADER_LEASE_TTL_SECONDS,
+                 renew_seconds: float = LEADER_LEASE_RENEW_SECONDS, holder: Optional[str] = None):
+        self.collection = collection
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.renew_seconds = renew_seconds
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self._local_expiry = 0.0
+
+    async def try_acquire(self, now: Optional[datetime] = None) -> bool:
+        """Takes or renews the lease. Returns whether this process holds it afterwards."""
+        now = now or datetime.utcnow()
+        fields = {"holder": self.holder, "expires_at": now + timedelta(seconds=self.ttl_seconds), "renewed_at": now}
+        if not self.is_leader:
+            fields["acquired_at"] = now
+        requested = time.monotonic()
+        try:
+            lease = await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": fields},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            lease = None  # held by someone else and not expired
+        self.is_leader = lease is not None
+        if self.is_leader:
+            self._local_expiry = requested + self.ttl_seconds
+        return self.is_leader
+
+    async def release(self):
+        """Gives the lease up so a follower can take over without waiting for expiry."""
+        if self.is_leader:
+            self.is_leader = False
+            await self.collection.delete_many({"_id": self.name, "holder": self.holder})
+
+    async def current(self) -> Optional[dict]:
+        return await self.collection.find_one({"_id": self.name})
+
+    async def run(self, on_elected: Callable[[], Awaitable], on_demoted: Callable[[], Awaitable]):
+        """Keeps campaigning/renewing forever, calling the hooks on every leadership change."""
+        while True:
+            was_leader = self.is_leader
+            try:
+                await self.try_acquire()
+            except Exception as e:
+                logger.error(f"Lease '{self.name}' renewal failed: {e}")
+                if was_leader and time.monotonic() >= self._local_expiry:
+                    self.is_leader = False
+            try:
+                if self.is_leader and not was_leader:
+                    logger.info(f"{self.holder} became leader for '{self.name}'.")
+                    await on_elected()
+                elif was_leader and not self.is_leader:
+                    logger.warning(f"{self.holder} lost leadership for '{self.name}'.")
+                    await on_demoted()
+            except Exception as e:
+                logger.error(f"Leadership change handler for '{self.name}' failed: {e}")
+            await asyncio.sleep(self.renew_seconds)
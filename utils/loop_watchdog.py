@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from utils.metrics import LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "true").lower() in ("1", "true", "yes")
+# A stall is the loop not running its heartbeat for this long; its stack is captured once per stall.
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "100"))
+STALL_STACK_DEPTH = 30
+
+# Frames under this directory (outside a virtualenv) are "ours" and used to name the call site.
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+def _is_app_frame(filename: str) -> bool:
+    return filename.startswith(_APP_ROOT) and "site-packages" not in filename
+
+
+def _describe(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_APP_ROOT):
+        filename = filename[len(_APP_ROOT):]
+    return f"{filename}:{frame.f_lineno} in {code.co_name}"
+
+
+class _StallSite:
+    __slots__ = ("site", "leaf", "count", "total_seconds", "max_seconds", "last_at", "task", "stack")
+
+    def __init__(self, site: str):
+        self.site = site
+        self.leaf = ""
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_at: Optional[datetime] = None
+        self.task: Optional[str] = None
+        self.stack: List[str] = []
+
+    def to_dict(self) -> dict:
+        return {
+            "site": self.site, "leaf": self.leaf, "count": self.count,
+            "total_ms": round(self.total_seconds * 1000, 1), "max_ms": round(self.max_seconds * 1000, 1),
+            "last_at": self.last_at.isoformat() if self.last_at else None, "task": self.task, "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    """
+    Finds synchronous calls that block the event loop. The loop stamps a
+    heartbeat every quarter threshold; a watchdog thread that sees the
+    heartbeat overdue by the threshold grabs the loop thread's stack right
+    then, while the blocking call is still on it. When the heartbeat
+    resumes, the stall's full length is added to its call site: the
+    innermost frame of our own code, with the innermost frame overall
+    (often a library call) kept as `leaf`.
+
+    A loop saturated by many short callbacks also trips the threshold;
+    those stalls land on whatever happened to be running and show up as
+    many sites with small counts rather than one dominant site.
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_STALL_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 4
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stopped = threading.Event()
+        self._last_beat = 0.0
+        self._pending: Optional[tuple] = None  # (beat, site, leaf, stack, task) captured for the current stall
+        self.sites: Dict[str, _StallSite] = {}
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+        self.started_at: Optional[datetime] = None
+
+    def start(self):
+        """Starts watching the running loop; call from inside it."""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self.started_at = datetime.utcnow()
+        self._stopped.clear()
+        self._handle = self._loop.call_later(self.interval, self._beat)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+
+    # --- event loop side ---
+
+    def _beat(self):
+        now = time.monotonic()
+        stalled = now - self._last_beat - self.interval
+        with self._lock:
+            pending, self._pending = self._pending, None
+            previous, self._last_beat = self._last_beat, now
+        if stalled >= self.threshold:
+            self._record(stalled, pending if pending is not None and pending[0] == previous else None)
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _record(self, stalled: float, pending: Optional[tuple]):
+        if pending is None:
+            site, leaf, stack, task = "unattributed", "", [], None
+        else:
+            _, site, leaf, stack, task = pending
+        entry = self.sites.get(site)
+        if entry is None:
+            entry = self.sites[site] = _StallSite(site)
+        entry.leaf, entry.stack, entry.task = leaf, stack, task
+        entry.count += 1
+        entry.total_seconds += stalled
+        entry.max_seconds = max(entry.max_seconds, stalled)
+        entry.last_at = datetime.utcnow()
+        self.stalls += 1
+        self.stalled_seconds += stalled
+        LOOP_STALLS.labels(site).inc()
+        logger.warning("Event loop blocked", extra={"stalled_ms": round(stalled * 1000, 1), "site": site,
+                                                     "leaf": leaf, "task": task})
+
+    # --- watchdog thread ---
+
+    def _watch(self):
+        captured_for = None
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                beat = self._last_beat
+            if beat == captured_for or time.monotonic() - beat < self.threshold + self.interval:
+                continue
+            captured_for = beat
+            capture = self._capture()
+            if capture is not None:
+                with self._lock:
+                    if self._last_beat == beat:
+                        self._pending = (beat, *capture)
+
+    def _capture(self) -> Optional[tuple]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        leaf = _describe(frame)
+        site = None
+        stack = []
+        while frame is not None and len(stack) < STALL_STACK_DEPTH:
+            described = _describe(frame)
+            stack.append(described)
+            if site is None and _is_app_frame(frame.f_code.co_filename) and frame.f_code.co_filename != __file__:
+                site = described
+            frame = frame.f_back
+        return site or leaf, leaf, stack, task.get_name() if task is not None else None
+
+    def report(self) -> dict:
+        """Stall call sites, worst total blocked time first."""
+        sites = sorted(self.sites.values(), key=lambda s: s.total_seconds, reverse=True)
+        return {
+            "enabled": self._thread is not None, "threshold_ms": self.threshold * 1000,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "stalls": self.stalls, "stalled_ms": round(self.stalled_seconds * 1000, 1),
+            "sites": [s.to_dict() for s in sites],
+        }
+
+    def reset(self):
+        self.sites.clear()
+        self.stalls = 0
+        self.stalled_seconds = 0.0
+
+
+loop_watchdog = LoopWatchdog()
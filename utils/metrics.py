@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a fast Mongo lookup up to a slow SMS provider.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL_SECONDS = 0.5
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    """
+    A named metric family. `labels(...)` returns the child for one label
+    combination, creating it on first use only; hot paths should keep the
+    child they get back so recording is a bisect and two additions. Children
+    are not locked; recorders running off the event loop (the Mongo listener
+    on Motor's threads) take their own lock.
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}"
+
+
+class Gauge(_Metric):
+    """Read at scrape time from a callback, so nothing is recorded on the hot path."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Dict[Tuple[str, ...], float]],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+
+    def _samples(self):
+        try:
+            values = self.read()
+        except Exception as e:
+            logger.error(f"Reading gauge {self.name} failed: {e}")
+            return
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], Dict[Tuple[str, ...], float]],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, read, labelnames))
+
+    def render(self) -> str:
+        """The Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "shieldx_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status"))
+MONGO_OPERATION_SECONDS = metrics.histogram(
+    "shieldx_mongo_operation_duration_seconds", "MongoDB command latency by collection and command.",
+    ("collection", "operation", "outcome"))
+NOTIFICATION_SECONDS = metrics.histogram(
+    "shieldx_notification_duration_seconds", "Notification provider call latency.", ("provider", "channel", "outcome"))
+MONITOR_TICK_SECONDS = metrics.histogram(
+    "shieldx_route_monitor_tick_duration_seconds", "Duration of one route-monitor pass.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+MONITOR_JOURNEYS = metrics.counter(
+    "shieldx_route_monitor_journeys_evaluated", "Journeys evaluated by the route monitor.")
+LOOP_LAG_SECONDS = metrics.histogram(
+    "shieldx_event_loop_lag_seconds", "How late the event loop woke a sleeping probe task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+ADMISSION_REJECTIONS = metrics.counter(
+    "shieldx_admission_rejections", "Work shed by admission control, by resource and priority class.",
+    ("resource", "priority"))
+GEOCODE_LOOKUPS = metrics.counter(
+    "shieldx_geocode_lookups", "Reverse-geocode lookups by the layer that answered them.", ("source",))
+LOOP_STALLS = metrics.counter(
+    "shieldx_event_loop_stalls", "Event-loop stalls over the watchdog threshold, by blocking call site.", ("site",))
+
+
+def _route_label(scope: dict) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label so scanners can't blow up the series count.
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its route template, method and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(scope["method"], _route_label(scope), str(status)).observe(
+                time.perf_counter() - started)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Feeds MONGO_OPERATION_SECONDS. Only "started" events carry the command
+    document, so the collection is remembered by request id until the
+    command finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event):
+        # getMore carries the cursor id under its own name and the collection separately.
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(key)
+        with self._lock:
+            self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection = self._collections.pop(event.request_id, "")
+            MONGO_OPERATION_SECONDS.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+class NotificationTimer:
+    """
+    `with NotificationTimer("twilio", "sms") as timer:` times one provider
+    call and wraps it in a `notify.<provider>` trace span; it counts as an
+    error if the block raises or `timer.outcome` is set to something else.
+    """
+    __slots__ = ("provider", "channel", "outcome", "_started", "_span")
+
+    def __init__(self, provider: str, channel: str):
+        self.provider = provider
+        self.channel = channel
+        self.outcome = "ok"
+
+    def __enter__(self):
+        self._span = span(f"notify.{self.provider}", channel=self.channel)
+        self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.outcome = "error"
+        NOTIFICATION_SECONDS.labels(self.provider, self.channel, self.outcome).observe(
+            time.perf_counter() - self._started)
+        if self.outcome != "ok" and self._span.span is not None:
+            self._span.span.fail(self.outcome if exc is None else f"{self.outcome}: {exc}")
+        self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+async def run_loop_lag_probe(interval: float = LOOP_LAG_INTERVAL_SECONDS):
+    """Sleeps `interval` in a loop and records how much later than asked the loop woke it."""
+    loop = asyncio.get_running_loop()
+    child = LOOP_LAG_SECONDS.labels()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        child.observe(max(0.0, loop.time() - expected))
+
+
+def _stats_gauge(stats):
+    return lambda: {(key,): value for key, value in stats().items() if isinstance(value, (int, float))}
+
+
+def register_process_gauges(registry: MetricsRegistry = metrics):
+    """
+    Gauges over process-local state that already keeps its own counters, read
+    at scrape time. The owners import this module, so they are imported here
+    and this is called once by the app at import.
+    """
+    from database import get_pool_stats
+    from utils.admission import admission_stats
+    from utils.cpu_executor import cpu_executor
+    from utils.geocoding import reverse_geocoder
+    from utils.security_check_sessions import security_check_sessions
+    from utils.sms_delivery import delivery_reports
+
+    registry.gauge("shieldx_security_check_backlog", "Security-check deadlines held by this process.",
+                   lambda: {(): security_check_sessions.backlog})
+    registry.gauge("shieldx_mongo_pool", "MongoDB connection pool checkout counters.",
+                   _stats_gauge(get_pool_stats), ("stat",))
+    registry.gauge("shieldx_cpu_executor", "CPU process pool queue and counters.",
+                   _stats_gauge(cpu_executor.stats), ("stat",))
+    registry.gauge("shieldx_admission_queue_depth", "Work waiting for admission, by resource and priority class.",
+                   lambda: {(resource, cls): stats["queue_depth"]
+                            for resource, by_class in admission_stats().items() for cls, stats in by_class.items()},
+                   ("resource", "priority"))
+    registry.gauge("shieldx_geocoding", "Reverse-geocode lookups by source, cache size and hit rate.",
+                   _stats_gauge(reverse_geocoder.stats), ("stat",))
+    registry.gauge("shieldx_sms_delivery_reports", "SMS delivery-report buffer depth and counters.",
+                   _stats_gauge(delivery_reports.stats), ("stat",))
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
@@ -1,10 +1,13 @@
 import logging
 import httpx # Make sure you have httpx installed: pip install httpx
 
+from utils.tracing import traced
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@traced("network.is_online")
 async def is_online(test_url: str = "http://www.google.com", timeout: int = 5) -> bool:
     """
     Asynchronously checks if there is an active internet connection by attempting to reach a test URL.
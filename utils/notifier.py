@@ -2,15 +2,20 @@ import logging
 import os
 import asyncio
 import re
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
-from twilio.rest import Client
+import threading
+import uuid
+from functools import lru_cache
+from typing import Optional, Dict, Any, List
 import requests
-import firebase_admin
-from firebase_admin import credentials, messaging
+import httpx
 
-# Load env vars
-load_dotenv()
+# Env vars are loaded by database (imported first); the Twilio and Firebase
+# SDKs are imported on first use, or up front by the startup phase.
+from database import mark_device_tokens_invalid, record_outbound_sms
+from utils.admission import notifier_gate
+from utils.metrics import NotificationTimer
+from utils.push_receipts import record_expo_tickets
+from utils.tracing import traced
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,68 +27,162 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 FIREBASE_SERVICE_ACCOUNT_KEY_PATH = os.getenv("FIREBASE_ADMIN_KEY_PATH")
 FAST2SMS_API_KEY = os.getenv("FAST2SMS_API_KEY")
+# Public URL of /api/sms/status/twilio; Twilio only sends delivery reports when this is set.
+SMS_STATUS_CALLBACK_URL = os.getenv("SMS_STATUS_CALLBACK_URL")
 
 # Firebase init
-try:
-    if not firebase_admin._apps:
-        if FIREBASE_SERVICE_ACCOUNT_KEY_PATH and os.path.exists(FIREBASE_SERVICE_ACCOUNT_KEY_PATH):
-            cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_KEY_PATH)
-            firebase_admin.initialize_app(cred)
-            logger.info("✅ Firebase initialized.")
-        else:
-            logger.warning("⚠️ Firebase key not found. Push will not work.")
-except Exception as e:
-    logger.error(f"❌ Firebase init error: {e}")
+@lru_cache(maxsize=None)
+def init_firebase() -> bool:
+    """Initialises the Firebase Admin app once. Returns whether FCM push is available."""
+    if not (FIREBASE_SERVICE_ACCOUNT_KEY_PATH and os.path.exists(FIREBASE_SERVICE_ACCOUNT_KEY_PATH)):
+        logger.warning("⚠️ Firebase key not found. Push will not work.")
+        return False
+    try:
+        import firebase_admin
+        from firebase_admin import credentials
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_KEY_PATH))
+        logger.info("✅ Firebase initialized.")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Firebase init error: {e}")
+        return False
 
 # --- Push Notifs ---
 
 async def send_expo_push_notification(token: str, title: str, body: str, data: Optional[Dict[str, str]] = None) -> bool:
-    try:
-        message = {
-            "to": token,
-            "sound": "default",
-            "title": title,
-            "body": body,
-            "data": data or {}
-        }
-        response = requests.post("https://exp.host/--/api/v2/push/send", json=message)
-        logger.info(f"[Expo Push] Response: {response.json()}")
-        return response.status_code == 200
-    except Exception as e:
-        logger.error(f"Expo push error: {e}")
-        return False
+    # Same path as fan-out pushes, so the ticket is kept for receipt checks.
+    results = await send_push_batch([{"token": token, "title": title, "body": body, "data": data}])
+    return results[0]
 
 async def send_push_notification(token: str, title: str, body: str, data: Optional[Dict[str, str]] = None) -> bool:
-    if token.startswith("ExponentPushToken"):
-        return await send_expo_push_notification(token, title, body, data)
-    elif firebase_admin._apps:
-        try:
-            message = messaging.Message(
-                notification=messaging.Notification(title=title, body=body),
-                data=data or {},
-                token=token,
-            )
-            messaging.send(message)
-            return True
-        except Exception as e:
-            logger.error(f"[FCM Push] Error: {e}")
-            return False
+    if token.startswith("ExponentPushToken") or init_firebase():
+        results = await send_push_batch([{"token": token, "title": title, "body": body, "data": data}])
+        return results[0]
     else:
         logger.warning("No valid push service available.")
         return False
 
+# --- Batched push (used by fan-out jobs) ---
+
+EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_BATCH_SIZE = 100  # Expo accepts up to 100 messages per request
+FCM_BATCH_SIZE = 500   # FCM send_each limit
+
+async def _send_expo_batch(client: httpx.AsyncClient, messages: List[Dict[str, Any]]) -> List[bool]:
+    payload = [{
+        "to": m["token"],
+        "sound": "default",
+        "title": m["title"],
+        "body": m["body"],
+        "data": m.get("data") or {}
+    } for m in messages]
+    try:
+        with NotificationTimer("expo", "push") as timer:
+            response = await client.post(EXPO_PUSH_URL, json=payload)
+            if response.status_code != 200:
+                timer.outcome = f"http_{response.status_code}"
+        tickets = response.json().get("data", []) if response.status_code == 200 else []
+    except Exception as e:
+        logger.error(f"Expo batch push error: {e}")
+        return [False] * len(messages)
+    try:
+        await record_expo_tickets(messages, tickets)
+    except Exception as e:
+        logger.error(f"Recording Expo push tickets failed: {e}")
+    results = [ticket.get("status") == "ok" for ticket in tickets]
+    return results + [False] * (len(messages) - len(results))
+
+def _is_dead_fcm_token(error: Exception) -> bool:
+    from firebase_admin import exceptions as firebase_exceptions, messaging
+    if isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+        return True
+    # INVALID_ARGUMENT also covers bad payloads; only the token variant means the token is dead.
+    return isinstance(error, firebase_exceptions.InvalidArgumentError) and "registration token" in str(error)
+
+async def _send_fcm_batch(messages: List[Dict[str, Any]]) -> List[bool]:
+    if not init_firebase():
+        return [False] * len(messages)
+    from firebase_admin import messaging
+    try:
+        with NotificationTimer("fcm", "push"):
+            batch = await messaging.send_each_async([
+                messaging.Message(
+                    notification=messaging.Notification(title=m["title"], body=m["body"]),
+                    data=m.get("data") or {},
+                    token=m["token"],
+                ) for m in messages
+            ])
+    except Exception as e:
+        logger.error(f"[FCM Push] Batch error: {e}")
+        return [False] * len(messages)
+    dead = [m["token"] for m, r in zip(messages, batch.responses) if not r.success and _is_dead_fcm_token(r.exception)]
+    if dead:
+        await mark_device_tokens_invalid(dead, "fcm:unregistered")
+    return [r.success for r in batch.responses]
+
+async def send_push_batch(messages: List[Dict[str, Any]], client: Optional[httpx.AsyncClient] = None) -> List[bool]:
+    """
+    Sends many push messages ({token, title, body, data}) using the providers'
+    batch APIs: Expo in chunks of 100 per request, FCM through send_each.
+    Returns one success flag per message, in input order.
+    """
+    results = [False] * len(messages)
+    expo = [i for i, m in enumerate(messages) if m["token"].startswith("ExponentPushToken")]
+    fcm = [i for i, m in enumerate(messages) if not m["token"].startswith("ExponentPushToken")]
+
+    async def expo_chunk(indexes, http_client):
+        async with notifier_gate.slot():
+            sent = await _send_expo_batch(http_client, [messages[i] for i in indexes])
+        for i, ok in zip(indexes, sent):
+            results[i] = ok
+
+    async def fcm_chunk(indexes):
+        async with notifier_gate.slot():
+            sent = await _send_fcm_batch([messages[i] for i in indexes])
+        for i, ok in zip(indexes, sent):
+            results[i] = ok
+
+    async def run(http_client):
+        await asyncio.gather(
+            *(expo_chunk(expo[i:i + EXPO_BATCH_SIZE], http_client) for i in range(0, len(expo), EXPO_BATCH_SIZE)),
+            *(fcm_chunk(fcm[i:i + FCM_BATCH_SIZE]) for i in range(0, len(fcm), FCM_BATCH_SIZE)),
+        )
+
+    if client is not None:
+        await run(client)
+    else:
+        async with httpx.AsyncClient(timeout=10) as http_client:
+            await run(http_client)
+    return results
+
 # --- SMS Service Class ---
 
+FAST2SMS_URL = "https://www.fast2sms.com/dev/bulkV2"
+
 class SMSService:
-    def send_via_twilio(self, phone_number: str, message: str) -> Dict[str, Any]:
+    def __init__(self):
+        self._twilio_client = None
+        self._lock = threading.Lock()
+
+    def twilio_client(self):
+        """Builds the Twilio REST client once (sends run in worker threads, hence the lock)."""
         if not all([TWILIO_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
             raise ValueError("Twilio not configured.")
+        with self._lock:
+            if self._twilio_client is None:
+                from twilio.rest import Client
+                self._twilio_client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+        return self._twilio_client
+
+    def send_via_twilio(self, phone_number: str, message: str) -> Dict[str, Any]:
+        client = self.twilio_client()
 
         if not phone_number.startswith('+'):
             phone_number = '+' + phone_number
 
-        client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
-        sms = client.messages.create(body=message, from_=TWILIO_PHONE_NUMBER, to=phone_number)
+        extra = {"status_callback": SMS_STATUS_CALLBACK_URL} if SMS_STATUS_CALLBACK_URL else {}
+        sms = client.messages.create(body=message, from_=TWILIO_PHONE_NUMBER, to=phone_number, **extra)
         logger.info(f"[Twilio] Sent SMS: SID={sms.sid}, Status={sms.status}")
         return {"sid": sms.sid, "status": sms.status}
 
@@ -91,7 +190,6 @@ class SMSService:
         if not FAST2SMS_API_KEY:
             raise ValueError("Fast2SMS API Key not configured.")
 
-        url = "https://www.fast2sms.com/dev/bulkV2"
         headers = {
             'authorization': FAST2SMS_API_KEY,
             'Content-Type': 'application/json'
@@ -104,12 +202,12 @@ class SMSService:
             "numbers": phone_number
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = requests.post(FAST2SMS_URL, headers=headers, json=payload)
         data = response.json()
         logger.info(f"[Fast2SMS] Response: {data}")
 
         if data.get("return") is True:
-            return {"status": "sent_fast2sms"}
+            return {"status": "sent_fast2sms", "request_id": data.get("request_id")}
         else:
             raise Exception("Fast2SMS failed")
 
@@ -119,8 +217,16 @@ class SMSService:
 
 sms_service = SMSService()
 
+def warm_up_sms_providers() -> bool:
+    """Builds the Twilio client ahead of the first alert. False when Twilio is not configured."""
+    if not all([TWILIO_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
+        return False
+    sms_service.twilio_client()
+    return True
+
 # --- Helpers ---
 
+@traced("sos.alert_sound")
 async def play_alert_sound():
     logger.info("🔊 Simulating alert sound...")
     await asyncio.sleep(1)
@@ -136,9 +242,17 @@ async def is_online() -> bool:
 
 # --- 🔥 Final Notification Logic with Proper Fallbacks ---
 
-async def send_notification(contact: str, message: str, network_status: Optional[bool] = None) -> str:
+@traced("notify.send")
+async def send_notification(contact: str, message: str, network_status: Optional[bool] = None,
+                            attempt: int = 1, retry_of: Optional[str] = None) -> str:
+    """
+    Sends one SMS/email with provider fallback. Accepted SMS are recorded in
+    sms_messages so delivery callbacks can retry or escalate emergency ones
+    (`attempt`/`retry_of` are set by those retries).
+    """
     try:
-        if "Emergency" in message or "🚨" in message:
+        emergency = "Emergency" in message or "🚨" in message
+        if emergency and attempt == 1:
             await play_alert_sound()
 
         if network_status is None:
@@ -149,34 +263,51 @@ async def send_notification(contact: str, message: str, network_status: Optional
             return "✅ Email sent (simulated)"
 
         elif is_valid_phone(contact):
-            # Try Twilio
-            try:
-                result = await asyncio.to_thread(sms_service.send_via_twilio, contact, message)
-                logger.info(f"Twilio send result: {result}")
-                if result.get("status") in ["queued", "sent", "delivered"]:
-                    return f"✅ SMS sent via Twilio: {result['status']}"
-                else:
-                    logger.warning(f"Twilio gave bad status: {result['status']}")
-            except Exception as e:
-                logger.warning(f"Twilio failed: {e}")
-
-            # Try Fast2SMS
-            try:
-                result = await asyncio.to_thread(sms_service.send_via_fast2sms, contact, message)
-                logger.info(f"Fast2SMS send result: {result}")
-                if result.get("status") == "sent_fast2sms":
-                    return f"✅ SMS sent via Fast2SMS"
-            except Exception as e:
-                logger.warning(f"Fast2SMS failed: {e}")
-
-            # Fallback to GSM if all failed
-            try:
-                result = await asyncio.to_thread(sms_service.send_via_gsm, contact, message)
-                logger.info(f"GSM send result: {result}")
-                return f"⚠️ Fallback: GSM used (offline/simulated)"
-            except Exception as e:
-                logger.error(f"GSM send failed: {e}")
-                return f"❌ All methods failed: {e}"
+            # One slot covers the whole fallback chain; provider calls run on the shared thread pool
+            async with notifier_gate.slot():
+                # Try Twilio
+                try:
+                    with NotificationTimer("twilio", "sms") as timer:
+                        result = await asyncio.to_thread(sms_service.send_via_twilio, contact, message)
+                        if result.get("status") not in ["queued", "sent", "delivered"]:
+                            timer.outcome = "rejected"
+                    logger.info(f"Twilio send result: {result}")
+                    if result.get("status") in ["queued", "sent", "delivered"]:
+                        await record_outbound_sms(result["sid"], "twilio", contact, message, emergency, attempt, retry_of)
+                        return f"✅ SMS sent via Twilio: {result['status']}"
+                    else:
+                        logger.warning(f"Twilio gave bad status: {result['status']}")
+                except Exception as e:
+                    logger.warning(f"Twilio failed: {e}")
+
+                # Try Fast2SMS
+                try:
+                    with NotificationTimer("fast2sms", "sms"):
+                        result = await asyncio.to_thread(sms_service.send_via_fast2sms, contact, message)
+                    logger.info(f"Fast2SMS send result: {result}")
+                    if result.get("status") == "sent_fast2sms":
+                        if result.get("request_id"):
+                            await record_outbound_sms(result["request_id"], "fast2sms", contact, message, emergency, attempt, retry_of)
+                        return f"✅ SMS sent via Fast2SMS"
+                except Exception as e:
+                    logger.warning(f"Fast2SMS failed: {e}")
+
+                # Fallback to GSM if all failed. It is only simulated, so the message did not go out.
+                try:
+                    with NotificationTimer("gsm", "sms"):
+                        result = await asyncio.to_thread(sms_service.send_via_gsm, contact, message)
+                    logger.info(f"GSM send result: {result}")
+                    # Recorded like a send no provider confirmed, so the sweep sees it, and followed up
+                    # at once: an emergency is retried and then escalated as on an undelivered callback.
+                    message_id = f"gsm-{uuid.uuid4().hex}"
+                    await record_outbound_sms(message_id, "gsm_simulated", contact, message, emergency, attempt, retry_of)
+                    if emergency:
+                        from utils.sms_delivery import delivery_reports  # imports this module
+                        await delivery_reports.follow_up_failed([message_id])
+                    return "❌ Not delivered: providers failed, GSM fallback is simulated"
+                except Exception as e:
+                    logger.error(f"GSM send failed: {e}")
+                    return f"❌ All methods failed: {e}"
 
         else:
             logger.error(f"Invalid contact format: {contact}")
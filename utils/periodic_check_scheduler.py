@@ -1,8 +1,162 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from controllers.periodic_check_controller import periodic_safety_check
-
-def start_scheduler():
-    """Start periodic security checks every 10 seconds."""
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(periodic_safety_check, "interval", hours=10)  # Fixed interval
-    scheduler.start()
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.mongodb import MongoDBJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+from controllers.periodic_check_controller import periodic_check_task
+from database import DB_NAME, SCHEDULER_JOBS_COLLECTION, get_sync_mongo_client, job_runs_collection, leases_collection
+from utils.archival import ARCHIVE_INTERVAL_HOURS, run_archival
+from utils.leader_lease import LeaderLease
+from utils.push_receipts import process_expo_receipts
+from utils.route_tracker import monitor_all_routes_background_task
+from utils.sms_delivery import sweep_unconfirmed_emergency_sms
+from utils.security_check_schedule import SLOT_SECONDS, assign_missing_slots, drain_due_security_check_slots
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LEASE_NAME = "scheduler"
+
+# Every scheduled job in the deployment. Only the lease holder runs them; the
+# definitions are stored in Mongo so next_run_time survives restarts and failover.
+SCHEDULED_JOBS = [
+    {"id": "security_check_slots_job", "func": drain_due_security_check_slots,
+     "trigger": IntervalTrigger(seconds=SLOT_SECONDS)},
+    {"id": "archival_job", "func": run_archival,
+     "trigger": IntervalTrigger(hours=ARCHIVE_INTERVAL_HOURS)},
+    {"id": "push_receipts_job", "func": process_expo_receipts,
+     "trigger": IntervalTrigger(minutes=15)},
+    {"id": "sms_delivery_sweep_job", "func": sweep_unconfirmed_emergency_sms,
+     "trigger": IntervalTrigger(minutes=5)},
+]
+
+scheduler = AsyncIOScheduler(
+    jobstores={"default": MongoDBJobStore(
+        database=DB_NAME, collection=SCHEDULER_JOBS_COLLECTION, client=get_sync_mongo_client()
+    )},
+    # Runs missed while no leader was up are collapsed into one, however late.
+    job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": None},
+)
+scheduler_lease = LeaderLease(leases_collection, SCHEDULER_LEASE_NAME)
+
+_leader_tasks: List[asyncio.Task] = []
+_job_started: Dict[str, float] = {}
+
+
+def _job_run_id(job_id: str) -> str:
+    return f"scheduled:{job_id}"
+
+
+def _record_job_event(event):
+    """Tracks each job's last run in job_runs, so every worker can report it."""
+    if event.code == EVENT_JOB_SUBMITTED:
+        _job_started[event.job_id] = time.monotonic()
+        return
+    started = _job_started.pop(event.job_id, None)
+    run = {
+        "job_id": event.job_id,
+        "holder": scheduler_lease.holder,
+        "scheduled_run_time": event.scheduled_run_time,
+        "finished_at": datetime.utcnow(),
+        "status": {EVENT_JOB_EXECUTED: "completed", EVENT_JOB_ERROR: "failed"}.get(event.code, "missed"),
+        "duration_seconds": round(time.monotonic() - started, 3) if started is not None else None,
+    }
+    if getattr(event, "exception", None) is not None:
+        run["error"] = str(event.exception)
+    asyncio.get_running_loop().create_task(job_runs_collection.update_one(
+        {"_id": _job_run_id(event.job_id)}, {"$set": {"last_run": run}}, upsert=True
+    ))
+
+
+def _sync_job_definitions():
+    """Adds new or changed jobs to the store without resetting the next run of unchanged ones."""
+    wanted = {job["id"]: job for job in SCHEDULED_JOBS}
+    for stored in scheduler.get_jobs():
+        if stored.id not in wanted:
+            scheduler.remove_job(stored.id)
+    for job_id, job in wanted.items():
+        stored = scheduler.get_job(job_id)
+        if stored is not None and str(stored.trigger) == str(job["trigger"]) and stored.func is job["func"]:
+            continue
+        scheduler.add_job(job["func"], job["trigger"], id=job_id, replace_existing=True)
+
+
+async def _backfill_security_check_slots():
+    try:
+        await assign_missing_slots()
+    except Exception as e:
+        logger.error(f"Security check slot backfill failed: {e}")
+
+
+async def _on_elected():
+    # The backfill scans every enabled user and can outlast the lease TTL, so it
+    # runs beside the lease loop rather than holding up its next renewal.
+    _leader_tasks.append(asyncio.create_task(_backfill_security_check_slots()))
+    await asyncio.to_thread(_sync_job_definitions)
+    scheduler.resume()
+    # Security-check timeouts are leader-only too: the new leader rebuilds the deadline heap from Mongo.
+    _leader_tasks.append(asyncio.create_task(periodic_check_task()))
+    # So is the route monitor: one worker raising inactivity SOS for every journey, from the synced registry.
+    _leader_tasks.append(asyncio.create_task(monitor_all_routes_background_task()))
+
+
+async def _on_demoted():
+    if scheduler.running:
+        scheduler.pause()
+    for task in _leader_tasks:
+        task.cancel()
+    _leader_tasks.clear()
+
+
+async def start_scheduler() -> asyncio.Task:
+    """
+    Starts the scheduler paused in every worker and campaigns for the lease;
+    jobs, the security-check timeout loop and the route monitor only run in
+    the lease holder.
+    """
+    scheduler.add_listener(_record_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+    scheduler.start(paused=True)
+    return asyncio.create_task(scheduler_lease.run(_on_elected, _on_demoted))
+
+
+async def stop_scheduler(campaign: Optional[asyncio.Task] = None):
+    if campaign is not None:
+        campaign.cancel()
+    await _on_demoted()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    try:
+        await scheduler_lease.release()
+    except Exception as e:
+        logger.error(f"Releasing scheduler lease failed: {e}")
+
+
+async def list_jobs() -> dict:
+    """Stored jobs with their trigger, next run and last run (from any worker)."""
+    jobs = await asyncio.to_thread(scheduler.get_jobs)
+    last_runs = {
+        doc["_id"]: doc.get("last_run")
+        async for doc in job_runs_collection.find({"_id": {"$in": [_job_run_id(job.id) for job in jobs]}})
+    }
+    lease = await scheduler_lease.current()
+    return {
+        "leader": lease.get("holder") if lease else None,
+        "lease_expires_at": lease.get("expires_at") if lease else None,
+        "this_worker": scheduler_lease.holder,
+        "is_leader": scheduler_lease.is_leader,
+        "jobs": [
+            {
+                "id": job.id,
+                "func": job.func_ref,
+                "trigger": str(job.trigger),
+                "next_run_time": job.next_run_time,
+                "last_run": last_runs.get(_job_run_id(job.id)),
+            }
+            for job in jobs
+        ],
+    }
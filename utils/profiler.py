@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Profiles are only taken when PROFILE_DIR is set; output is one folded-stack file per capture
+# ("frame;frame;frame count" lines), readable by flamegraph.pl, speedscope and inferno.
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "600"))
+# Name accepted by `profile()` for the route monitor's pass.
+ROUTE_MONITOR_TARGET = "route_monitor_tick"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _folded(frame, prefix: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(prefix)
+    return ";".join(reversed(labels))
+
+
+class _Session:
+    """One armed capture: which targets, how often, until when, and the stacks collected so far."""
+
+    def __init__(self, name: str, targets: Dict[str, float], until: float, max_requests: Optional[int]):
+        self.name = name
+        self.targets = targets  # target -> fraction of requests/ticks to profile
+        self.until = until
+        self.max_requests = max_requests
+        self.requests = 0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.started_at = datetime.utcnow()
+
+
+class _ProfileScope:
+    __slots__ = ("profiler", "target", "task")
+
+    def __init__(self, profiler: "SamplingProfiler", target: str):
+        self.profiler = profiler
+        self.target = target
+        self.task = None
+
+    def __enter__(self):
+        if self.profiler.sampled(self.target):
+            self.task = asyncio.current_task()
+            self.profiler._tasks[self.task] = self.target
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.task is not None:
+            self.profiler._tasks.pop(self.task, None)
+        return False
+
+
+class _NoProfile:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_PROFILE = _NoProfile()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler armed at runtime. A sampler thread reads the event
+    loop thread's stack every PROFILE_SAMPLE_INTERVAL_MS and keeps the sample
+    only while a profiled request (or monitor tick) is the running task, so
+    concurrent requests don't pollute each other's profile. `capture()`
+    instead samples every thread for a fixed time. While nothing is armed
+    the only cost is one attribute check per request.
+    """
+
+    def __init__(self, directory: Optional[str] = PROFILE_DIR, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        self.directory = directory
+        self.interval = interval_ms / 1000
+        self.armed = False
+        self._lock = threading.Lock()
+        self._session: Optional[_Session] = None
+        self._whole_process: Optional[_Session] = None
+        self._tasks: Dict[asyncio.Task, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self.written: List[str] = []
+
+    # --- hot path ---
+
+    def profile(self, target: str):
+        """`with profiler.profile(target):` profiles the block if a session covers `target`."""
+        if not self.armed:
+            return _NO_PROFILE
+        return _ProfileScope(self, target)
+
+    def sampled(self, target: str) -> bool:
+        session = self._session
+        if session is None:
+            return False
+        rate = session.targets.get(target)
+        if rate is None:
+            rate = next((r for t, r in session.targets.items() if target.startswith(t.rstrip("/") + "/")), None)
+        if rate is None or random.random() >= rate:
+            return False
+        if session.max_requests is not None and session.requests >= session.max_requests:
+            return False
+        session.requests += 1
+        return True
+
+    # --- control (admin endpoints) ---
+
+    def _require_directory(self):
+        if not self.directory:
+            raise RuntimeError("Profiling is disabled: set PROFILE_DIR.")
+
+    def start_requests(self, targets: Dict[str, float], seconds: int, max_requests: Optional[int] = None) -> dict:
+        """Profiles the given fraction of requests to each target (path prefix or ROUTE_MONITOR_TARGET)."""
+        self._require_directory()
+        self._attach()
+        with self._lock:
+            if self._session is not None:
+                raise RuntimeError("A request profiling session is already running.")
+            self._session = _Session("requests", dict(targets), time.monotonic() + min(seconds, PROFILE_MAX_SECONDS),
+                                     max_requests)
+            self.armed = True
+        self._ensure_sampler()
+        return self.status()
+
+    def capture(self, seconds: int) -> dict:
+        """Samples every thread of the process for `seconds`."""
+        self._require_directory()
+        self._attach()
+        with self._lock:
+            if self._whole_process is not None:
+                raise RuntimeError("A whole-process capture is already running.")
+            self._whole_process = _Session("process", {}, time.monotonic() + min(seconds, PROFILE_MAX_SECONDS), None)
+        self._ensure_sampler()
+        return self.status()
+
+    def stop(self) -> dict:
+        """Ends every running capture now and writes what was collected."""
+        with self._lock:
+            sessions = self._end_sessions(force=True)
+        for session in sessions:
+            self._write(session)
+        return self.status()
+
+    def status(self) -> dict:
+        def describe(session: Optional[_Session]):
+            if session is None:
+                return None
+            return {"targets": session.targets, "requests": session.requests, "samples": session.samples,
+                    "started_at": session.started_at.isoformat(),
+                    "remaining_seconds": max(0, round(session.until - time.monotonic(), 1))}
+        return {
+            "enabled": bool(self.directory), "directory": self.directory, "interval_ms": self.interval * 1000,
+            "requests": describe(self._session), "process": describe(self._whole_process),
+            "written": self.written[-20:],
+        }
+
+    # --- sampler thread ---
+
+    def _attach(self):
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+
+    def _ensure_sampler(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _end_sessions(self, force: bool = False) -> List[_Session]:
+        now = time.monotonic()
+        ended = []
+        session = self._session
+        if session is not None and (force or now >= session.until or
+                                    (session.max_requests is not None and session.requests >= session.max_requests
+                                     and not self._tasks)):
+            ended.append(session)
+            self._session = None
+            self.armed = False
+            self._tasks.clear()
+        if self._whole_process is not None and (force or now >= self._whole_process.until):
+            ended.append(self._whole_process)
+            self._whole_process = None
+        return ended
+
+    def _sample_loop(self):
+        thread_names = {}
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                ended = self._end_sessions()
+                session, whole = self._session, self._whole_process
+            for finished in ended:
+                self._write(finished)
+            if session is None and whole is None:
+                return
+
+            frames = sys._current_frames()
+            if session is not None and self._tasks:
+                try:
+                    task = asyncio.current_task(self._loop)
+                except RuntimeError:
+                    task = None
+                target = self._tasks.get(task) if task is not None else None
+                frame = frames.get(self._loop_thread_id)
+                if target is not None and frame is not None:
+                    session.stacks[_folded(frame, target)] += 1
+                    session.samples += 1
+            if whole is not None:
+                if len(thread_names) != threading.active_count():
+                    thread_names = {t.ident: t.name for t in threading.enumerate()}
+                own = threading.get_ident()
+                for thread_id, frame in frames.items():
+                    if thread_id != own:
+                        whole.stacks[_folded(frame, thread_names.get(thread_id, str(thread_id)))] += 1
+                whole.samples += 1
+
+    def _write(self, session: _Session) -> Optional[str]:
+        if not session.stacks:
+            logger.info(f"Profiling session '{session.name}' ended without samples.")
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{session.started_at:%Y%m%dT%H%M%S}-{session.name}-{os.getpid()}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.written.append(path)
+        logger.info(f"Profile written to {path} ({session.samples} samples)")
+        return path
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware: requests to armed path prefixes are profiled at the armed fraction."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiler.armed or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with profiler.profile(scope["path"]):
+            await self.app(scope, receive, send)
@@ -0,0 +1,143 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+from pymongo import UpdateOne
+
+from database import job_runs_collection, mark_device_tokens_invalid, push_tickets_collection, user_collection
+
+logger = logging.getLogger(__name__)
+
+EXPO_RECEIPTS_URL = "https://exp.host/--/api/v2/push/getReceipts"
+EXPO_RECEIPT_BATCH_SIZE = 1000  # getReceipts accepts up to 1000 ids per request
+# Expo recommends waiting ~15 minutes before asking for receipts, and keeps them for 24 hours.
+PUSH_RECEIPT_DELAY_MINUTES = int(os.getenv("PUSH_RECEIPT_DELAY_MINUTES", "15"))
+PUSH_RECEIPT_MAX_AGE_HOURS = 24
+
+# Provider errors that mean the token will never work again.
+EXPO_DEAD_TOKEN_ERRORS = {"DeviceNotRegistered"}
+
+PUSH_HEALTH_ID = "push_token_health"
+
+
+class PushTicketStatus:
+    PENDING = "pending"      # accepted by Expo, receipt not fetched yet
+    DELIVERED = "delivered"  # receipt ok: handed to APNs/FCM
+    ERROR = "error"          # receipt reported an error
+    EXPIRED = "expired"      # no receipt within PUSH_RECEIPT_MAX_AGE_HOURS
+
+
+async def record_expo_tickets(messages: List[Dict[str, Any]], tickets: List[Dict[str, Any]],
+                              now: Optional[datetime] = None) -> int:
+    """
+    Stores the receipt id of every accepted Expo ticket, and flags tokens
+    Expo already rejected at send time. Returns the number of tokens flagged.
+    """
+    now = now or datetime.utcnow()
+    pending, dead = [], []
+    for message, ticket in zip(messages, tickets):
+        if ticket.get("status") == "ok" and ticket.get("id"):
+            pending.append({
+                "_id": ticket["id"],
+                "token": message["token"],
+                "type": (message.get("data") or {}).get("type"),
+                "status": PushTicketStatus.PENDING,
+                "sent_at": now,
+            })
+        elif (ticket.get("details") or {}).get("error") in EXPO_DEAD_TOKEN_ERRORS:
+            dead.append(message["token"])
+    if pending:
+        await push_tickets_collection.insert_many(pending, ordered=False)
+    return await mark_device_tokens_invalid(dead, "expo:DeviceNotRegistered") if dead else 0
+
+
+async def _settle_receipt_batch(client: httpx.AsyncClient, tickets: List[dict], now: datetime) -> Dict[str, int]:
+    response = await client.post(EXPO_RECEIPTS_URL, json={"ids": [ticket["_id"] for ticket in tickets]})
+    response.raise_for_status()
+    receipts = response.json().get("data") or {}
+
+    counts = {"delivered": 0, "errors": 0, "expired": 0, "tokens_invalidated": 0}
+    updates, dead = [], {}
+    expire_before = now - timedelta(hours=PUSH_RECEIPT_MAX_AGE_HOURS)
+    for ticket in tickets:
+        receipt = receipts.get(ticket["_id"])
+        if receipt is None:
+            if ticket["sent_at"] < expire_before:
+                updates.append(UpdateOne({"_id": ticket["_id"]}, {"$set": {"status": PushTicketStatus.EXPIRED}}))
+                counts["expired"] += 1
+            continue  # not ready yet; asked again on the next run
+        if receipt.get("status") == "ok":
+            updates.append(UpdateOne({"_id": ticket["_id"]}, {"$set": {"status": PushTicketStatus.DELIVERED, "settled_at": now}}))
+            counts["delivered"] += 1
+            continue
+        error = (receipt.get("details") or {}).get("error") or receipt.get("message")
+        updates.append(UpdateOne({"_id": ticket["_id"]}, {"$set": {
+            "status": PushTicketStatus.ERROR, "error": error, "settled_at": now
+        }}))
+        counts["errors"] += 1
+        if error in EXPO_DEAD_TOKEN_ERRORS:
+            dead.setdefault(error, []).append(ticket["token"])
+    if updates:
+        await push_tickets_collection.bulk_write(updates, ordered=False)
+    for error, tokens in dead.items():
+        counts["tokens_invalidated"] += await mark_device_tokens_invalid(tokens, f"expo:{error}")
+    return counts
+
+
+async def process_expo_receipts(client: Optional[httpx.AsyncClient] = None, now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Scheduled job: fetches receipts for pending tickets older than
+    PUSH_RECEIPT_DELAY_MINUTES in batches of 1000 and settles them,
+    invalidating tokens Expo reports as DeviceNotRegistered.
+    """
+    now = now or datetime.utcnow()
+    totals = {"delivered": 0, "errors": 0, "expired": 0, "tokens_invalidated": 0}
+    cursor = push_tickets_collection.find(
+        {"status": PushTicketStatus.PENDING, "sent_at": {"$lt": now - timedelta(minutes=PUSH_RECEIPT_DELAY_MINUTES)}},
+        {"token": 1, "sent_at": 1}
+    ).batch_size(EXPO_RECEIPT_BATCH_SIZE)
+
+    async def run(http_client):
+        batch = []
+        async for ticket in cursor:
+            batch.append(ticket)
+            if len(batch) >= EXPO_RECEIPT_BATCH_SIZE:
+                for key, value in (await _settle_receipt_batch(http_client, batch, now)).items():
+                    totals[key] += value
+                batch = []
+        if batch:
+            for key, value in (await _settle_receipt_batch(http_client, batch, now)).items():
+                totals[key] += value
+
+    try:
+        if client is not None:
+            await run(client)
+        else:
+            async with httpx.AsyncClient(timeout=10) as http_client:
+                await run(http_client)
+    except Exception as e:
+        logger.error(f"Expo receipt processing failed: {e}")
+    logger.info(f"Expo receipts processed: {totals}")
+    return totals
+
+
+async def record_skipped_sends(count: int):
+    """Counts pushes not sent because the user's token is known dead."""
+    if count:
+        await job_runs_collection.update_one({"_id": PUSH_HEALTH_ID}, {"$inc": {"sends_avoided": count}}, upsert=True)
+
+
+async def get_push_health() -> dict:
+    """Dead-token and receipt counters, including how many wasted sends have been avoided."""
+    counters = await job_runs_collection.find_one({"_id": PUSH_HEALTH_ID}) or {}
+    tickets = {
+        status: await push_tickets_collection.count_documents({"status": status})
+        for status in (PushTicketStatus.PENDING, PushTicketStatus.DELIVERED, PushTicketStatus.ERROR, PushTicketStatus.EXPIRED)
+    }
+    return {
+        "invalid_tokens": await user_collection.count_documents({"deviceToken.invalid": True}),
+        "sends_avoided": counters.get("sends_avoided", 0),
+        "tickets": tickets,
+    }
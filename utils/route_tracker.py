@@ -2,181 +2,217 @@ from datetime import datetime, timedelta
 from typing import Dict, Tuple, Optional
 import asyncio
 import uuid
-from geopy.distance import geodesic
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from bson import ObjectId
 import os
+import time
+import logging
 
 # Project utilities
 from utils.notifier import send_notification, is_valid_email, is_valid_phone
 from utils.network import is_online
 from controllers.sos_controller import trigger_sos
 from models.sos import SOSReason, SOSStatus
-from models.user_route import Coordinates, UserRouteStatus
+from models.user_route import Coordinates, UserRoute, UserRouteStatus
 from database import user_routes_collection
+from utils.admission import Priority, admission, mongo_write_gate
+from utils.journey_registry import JOURNEY_PROJECTION, JourneyRecord, journey_registry
+from utils.metrics import MONITOR_JOURNEYS, MONITOR_TICK_SECONDS
+from utils.profiler import ROUTE_MONITOR_TARGET, profiler
+from utils.structured_logging import LOCATION_LOG_SAMPLE_EVERY, LogSampler, journey_id_var
+
+logger = logging.getLogger(__name__)
+location_log_sampler = LogSampler(LOCATION_LOG_SAMPLE_EVERY)
 
 # Constants
 INACTIVITY_DISTANCE_THRESHOLD_METERS = 20
 INACTIVITY_TIME_THRESHOLD_MINUTES = 1
 DESTINATION_REACHED_THRESHOLD_METERS = 50
 NOTIFICATION_COOLDOWN_MINUTES = 2
+MONITOR_INTERVAL_SECONDS = 30
 
-# === Initialize tracking ===
 
+def _distance_meters(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    # geopy imports all of its geocoders (and aiohttp) with it, so it is loaded on first use.
+    from geopy.distance import geodesic
+    return geodesic(a, b).meters
 
-client = AsyncIOMotorClient(os.getenv("MONGO_URI"))
-db = client["shieldx_db"]
-journeys_collection = db["journeys"]
 
+# === Initialize tracking ===
 async def initialize_user_tracking(user_id, start_lat, start_lng, end_lat, end_lng, emergency_contacts):
-    journey = {
-        "user_id": user_id,
-        "start": {"lat": start_lat, "lng": start_lng},
-        "end": {"lat": end_lat, "lng": end_lng},
-        "emergency_contacts": emergency_contacts,
-        "status": "active",  # optional
-        "created_at": datetime.utcnow()  # optional
-    }
-
-    result = await journeys_collection.insert_one(journey)
-
-    return str(result.inserted_id)  # 👈 return the generated ObjectId as a string
+    """
+    Creates the journey document in user_routes_collection, the same collection
+    the route monitor and location updates work against, and returns its journey_id.
+    """
+    now = datetime.utcnow()
+    start_point = Coordinates(latitude=start_lat, longitude=start_lng)
+    journey = UserRoute(
+        user_id=user_id,
+        start_point=start_point,
+        end_point=Coordinates(latitude=end_lat, longitude=end_lng),
+        current_loc_coordinates=start_point,
+        last_updated_at=now,
+        emergency_contact=emergency_contacts[0] if emergency_contacts else "",
+        created_at=now
+    ).model_dump()
+    journey["previous_loc_coordinates"] = journey["current_loc_coordinates"]
+    journey["emergency_contacts"] = emergency_contacts
+
+    await user_routes_collection.insert_one(journey)
+    journey_registry.add(JourneyRecord.from_document(journey))
+
+    return journey["journey_id"]
+
+
+def _location_update_pipeline(lat: float, lng: float, now: datetime) -> list:
+    """
+    Aggregation-pipeline update that shifts the stored current coordinates into
+    previous and writes the new fix, all inside one server-side operation.
+    """
+    new_coords = {"latitude": lat, "longitude": lng}
+    return [{
+        "$set": {
+            "previous_loc_coordinates": {"$ifNull": ["$current_loc_coordinates", new_coords]},
+            "current_loc_coordinates": new_coords,
+            "last_updated_at": now
+        }
+    }]
 
 
 # === Update current location ===
 async def update_user_current_location(user_id: str, lat: float, lng: float, journey_id: Optional[str] = None):
     try:
-        now = datetime.utcnow()
-        new_coords = {"latitude": lat, "longitude": lng}
-
+        if location_log_sampler.hit():
+            logger.info("Location fix", extra={"user_id": user_id, "journey_id": journey_id,
+                                               "sampled_every": location_log_sampler.every})
+        # Journeys held by the registry are updated in memory and checkpointed in batches.
+        if journey_registry.record_fix(user_id, lat, lng, time.time(), journey_id):
+            return
+
+        # Journey started by another process (or before this one loaded): write
+        # through in one round trip and adopt it into the registry.
         filter_query = {"user_id": user_id, "status": UserRouteStatus.RUNNING}
         if journey_id:
             filter_query["journey_id"] = journey_id
-            print(f"Attempting to update location for user {user_id}, journey {journey_id} to ({lat}, {lng})")
-        else:
-            print(f"No specific journey_id provided for user {user_id}. Searching for active route to update location to ({lat}, {lng}).")
-
-        latest_route_doc = await user_routes_collection.find_one(filter_query, sort=[("last_updated_at", -1)])
-
-        if latest_route_doc:
-            existing_current_coords = latest_route_doc.get("current_loc_coordinates")
-            if existing_current_coords:
-                update_data = {
-                    "previous_loc_coordinates": existing_current_coords,
-                    "current_loc_coordinates": new_coords,
-                    "last_updated_at": now
-                }
-            else:
-                update_data = {
-                    "previous_loc_coordinates": new_coords,
-                    "current_loc_coordinates": new_coords,
-                    "last_updated_at": now
-                }
-
-            filter_query["journey_id"] = latest_route_doc["journey_id"]
-            print(f"Found active journey '{latest_route_doc['journey_id']}' for user {user_id} to update.")
 
-            result = await user_routes_collection.update_one(filter_query, {"$set": update_data})
-
-            if result.matched_count == 0:
-                print(f"Warning: No matching active route found for user {user_id}.")
-            else:
-                print(f"Location updated successfully for user {user_id} ({result.matched_count} document(s) matched).")
+        async with mongo_write_gate.slot():
+            route_doc = await user_routes_collection.find_one_and_update(
+                filter_query,
+                _location_update_pipeline(lat, lng, datetime.utcnow()),
+                sort=[("last_updated_at", -1)],
+                projection=JOURNEY_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+        if route_doc:
+            journey_registry.add(JourneyRecord.from_document(route_doc))
         else:
-            print(f"No active journey found for user {user_id} to update location. Skipping update.")
+            logger.debug("No active journey for location update", extra={"user_id": user_id})
 
     except Exception as e:
-        print(f"[Database Error] Failed to update location for user {user_id}: {e}")
+        logger.error("Location update failed", extra={"user_id": user_id, "error": str(e)})
         raise
 
+
+async def _end_journey(record: JourneyRecord, status: str) -> bool:
+    """
+    Persists a terminal status immediately and drops the journey from the registry.
+    Returns False when the journey was no longer running in Mongo (ended by the
+    user or another pass), in which case the caller must not alert for it.
+    """
+    record.status = status
+    result = await user_routes_collection.update_one(
+        {"journey_id": record.journey_id, "status": UserRouteStatus.RUNNING},
+        {"$set": record.checkpoint_fields()}
+    )
+    journey_registry.remove(record.journey_id)
+    return result.matched_count == 1
+
+
+async def _raise_inactivity(record: JourneyRecord, now: float, cause: str):
+    record.last_notification_at = now
+    if not await _end_journey(record, UserRouteStatus.INACTIVITY_ALERT):
+        logger.info("Journey already ended, inactivity SOS skipped", extra={"user_id": record.user_id, "cause": cause})
+        return
+    logger.warning("Inactivity detected, triggering SOS", extra={"user_id": record.user_id, "cause": cause})
+    asyncio.create_task(trigger_sos(
+        user_id=record.user_id,
+        lat=record.cur_lat,
+        lon=record.cur_lng,
+        contacts=[record.contact] if record.contact else [],
+        reason=SOSReason.INACTIVITY_ALERT,
+        status=SOSStatus.ACTIVE
+    ))
+
+
 # === Monitor all routes ===
+async def monitor_route(record: JourneyRecord, now: float):
+    user_id = record.user_id
+    emergency_contact = record.contact
+    time_since_last_update_s = now - record.last_updated_at
+    cooldown_passed = now - record.last_notification_at > NOTIFICATION_COOLDOWN_MINUTES * 60
+
+    # === Inactivity - No update ===
+    if time_since_last_update_s > INACTIVITY_TIME_THRESHOLD_MINUTES * 60:
+        if cooldown_passed:
+            await _raise_inactivity(record, now, "no_updates")
+        else:
+            logger.debug("Inactivity within notification cooldown", extra={"user_id": user_id, "cause": "no_updates"})
+
+    # === Inactivity - No movement ===
+    else:
+        distance_moved = _distance_meters((record.prev_lat, record.prev_lng), (record.cur_lat, record.cur_lng))
+        if time_since_last_update_s > (INACTIVITY_TIME_THRESHOLD_MINUTES * 60) / 2 and distance_moved < INACTIVITY_DISTANCE_THRESHOLD_METERS:
+            if cooldown_passed:
+                await _raise_inactivity(record, now, "no_movement")
+            else:
+                logger.debug("Inactivity within notification cooldown", extra={"user_id": user_id, "cause": "no_movement"})
+
+    # === Destination reached ===
+    if record.status == UserRouteStatus.RUNNING:
+        distance_to_destination = _distance_meters((record.cur_lat, record.cur_lng), (record.end_lat, record.end_lng))
+        if distance_to_destination < DESTINATION_REACHED_THRESHOLD_METERS:
+            if not await _end_journey(record, UserRouteStatus.COMPLETED):
+                return
+            if emergency_contact and (is_valid_email(emergency_contact) or is_valid_phone(emergency_contact)):
+                network_status = await is_online()
+                location_link = f"https://www.google.com/maps?q={record.end_lat},{record.end_lng}"
+                message = f"✅ {user_id} arrived at destination. Location: {location_link}"
+                logger.info("Sending arrival alert", extra={"user_id": user_id})
+                async with admission.admit(Priority.ARRIVAL):
+                    await send_notification(emergency_contact, message, network_status)
+            logger.info("Journey completed", extra={"user_id": user_id})
+
+
+async def run_monitor_pass(now: Optional[float] = None) -> int:
+    """Evaluates every running journey in the registry once. Returns the number evaluated."""
+    now = now if now is not None else time.time()
+    records = journey_registry.records()
+    for record in records:
+        # Log lines (and SOS tasks spawned) while evaluating a journey carry its id.
+        token = journey_id_var.set(record.journey_id)
+        try:
+            await monitor_route(record, now)
+        except Exception as e:
+            logger.error("Monitoring journey failed", extra={"error": str(e)})
+        finally:
+            journey_id_var.reset(token)
+    return len(records)
+
+
 async def monitor_all_routes_background_task():
-    print("Starting background route monitoring task...")
+    """Leader-only (see utils.periodic_check_scheduler): one monitor for the whole deployment."""
+    logger.info("Starting background route monitoring task")
 
     while True:
-        await asyncio.sleep(30)
+        await asyncio.sleep(MONITOR_INTERVAL_SECONDS)
 
         try:
-            active_routes_cursor = user_routes_collection.find({"status": UserRouteStatus.RUNNING})
-            active_routes = await active_routes_cursor.to_list(length=None)
-
-            for route_doc in active_routes:
-                user_id = route_doc["user_id"]
-                journey_id = route_doc["journey_id"]
-                current_lat = route_doc["current_loc_coordinates"]["latitude"]
-                current_lng = route_doc["current_loc_coordinates"]["longitude"]
-                previous_lat = route_doc.get("previous_loc_coordinates", {}).get("latitude", current_lat)
-                previous_lng = route_doc.get("previous_loc_coordinates", {}).get("longitude", current_lng)
-                last_updated_at = route_doc["last_updated_at"]
-                emergency_contact = route_doc["emergency_contact"]
-                end_lat = route_doc["end_point"]["latitude"]
-                end_lng = route_doc["end_point"]["longitude"]
-                last_notification_time = route_doc.get("last_notification_time", datetime.min)
-
-                time_since_last_update_s = (datetime.utcnow() - last_updated_at).total_seconds()
-
-                # === Inactivity - No update ===
-                if time_since_last_update_s > INACTIVITY_TIME_THRESHOLD_MINUTES * 60:
-                    if (datetime.utcnow() - last_notification_time).total_seconds() > NOTIFICATION_COOLDOWN_MINUTES * 60:
-                        print(f"🚨 Inactivity detected for {user_id} (Journey ID: {journey_id}) due to NO UPDATES. Triggering SOS.")
-                        asyncio.create_task(trigger_sos(
-                            user_id=user_id,
-                            lat=current_lat,
-                            lon=current_lng,
-                            contacts=[emergency_contact] if emergency_contact else [],
-                            reason=SOSReason.INACTIVITY_ALERT,
-                            status=SOSStatus.ACTIVE
-                        ))
-                        await user_routes_collection.update_one(
-                            {"_id": route_doc["_id"]},
-                            {"$set": {
-                                "status": UserRouteStatus.INACTIVITY_ALERT,
-                                "last_notification_time": datetime.utcnow()
-                            }}
-                        )
-                    else:
-                        print(f"Info: Inactivity for {user_id} but still in notification cooldown.")
-
-                # === Inactivity - No movement ===
-                else:
-                    distance_moved = geodesic((previous_lat, previous_lng), (current_lat, current_lng)).meters
-                    if time_since_last_update_s > (INACTIVITY_TIME_THRESHOLD_MINUTES * 60) / 2 and distance_moved < INACTIVITY_DISTANCE_THRESHOLD_METERS:
-                        if (datetime.utcnow() - last_notification_time).total_seconds() > NOTIFICATION_COOLDOWN_MINUTES * 60:
-                            print(f"🚨 Inactivity detected for {user_id} (Journey ID: {journey_id}) due to LACK OF MOVEMENT. Triggering SOS.")
-                            asyncio.create_task(trigger_sos(
-                                user_id=user_id,
-                                lat=current_lat,
-                                lon=current_lng,
-                                contacts=[emergency_contact] if emergency_contact else [],
-                                reason=SOSReason.INACTIVITY_ALERT,
-                                status=SOSStatus.ACTIVE
-                            ))
-                            await user_routes_collection.update_one(
-                                {"_id": route_doc["_id"]},
-                                {"$set": {
-                                    "status": UserRouteStatus.INACTIVITY_ALERT,
-                                    "last_notification_time": datetime.utcnow()
-                                }}
-                            )
-                        else:
-                            print(f"Info: Inactivity for {user_id} (no movement), but still in cooldown.")
-
-                # === Destination reached ===
-                if route_doc["status"] == UserRouteStatus.RUNNING:
-                    distance_to_destination = geodesic((current_lat, current_lng), (end_lat, end_lng)).meters
-                    if distance_to_destination < DESTINATION_REACHED_THRESHOLD_METERS:
-                        if emergency_contact and (is_valid_email(emergency_contact) or is_valid_phone(emergency_contact)):
-                            network_status = await is_online()
-                            location_link = f"https://www.google.com/maps?q={end_lat},{end_lng}"
-                            message = f"✅ {user_id} arrived at destination. Location: {location_link}"
-                            print(f"Sending alert for {user_id} (Arrived): {message}")
-                            await send_notification(emergency_contact, message, network_status)
-
-                        await user_routes_collection.update_one(
-                            {"_id": route_doc["_id"]},
-                            {"$set": {"status": UserRouteStatus.COMPLETED}}
-                        )
-                        print(f"Journey for {user_id} (Journey ID: {journey_id}) completed. Status updated to 'completed'.")
-
+            # Picks up journeys started, moved or ended through other workers since the last pass.
+            await journey_registry.sync(user_routes_collection)
+            started = time.perf_counter()
+            with profiler.profile(ROUTE_MONITOR_TARGET):
+                evaluated = await run_monitor_pass()
+            MONITOR_TICK_SECONDS.observe(time.perf_counter() - started)
+            MONITOR_JOURNEYS.inc(evaluated)
         except Exception as e:
-            print(f"❌ Error in background route monitoring task: {e}")
+            logger.error("Route monitoring pass failed", extra={"error": str(e)})
@@ -0,0 +1,102 @@
+import logging
+import os
+import time
+import zlib
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from controllers.periodic_check_controller import initiate_hourly_security_check
+from database import job_runs_collection, user_collection
+
+logger = logging.getLogger(__name__)
+
+# Each user is checked once per interval, in one of SECURITY_CHECK_SLOTS equal
+# slots, so pushes, bcrypt verifications and timeouts arrive as a steady
+# stream instead of one spike at the top of the hour.
+SECURITY_CHECK_INTERVAL_SECONDS = int(os.getenv("SECURITY_CHECK_INTERVAL_SECONDS", "3600"))
+SECURITY_CHECK_SLOTS = int(os.getenv("SECURITY_CHECK_SLOTS", "60"))
+SLOT_SECONDS = SECURITY_CHECK_INTERVAL_SECONDS / SECURITY_CHECK_SLOTS
+# Users enabled without going through /toggle-security-check (imports, admin
+# edits) get a slot on the next drain; this caps the work added to one tick.
+SLOT_BACKFILL_PER_DRAIN = int(os.getenv("SECURITY_CHECK_SLOT_BACKFILL_PER_DRAIN", "1000"))
+
+SCHEDULE_STATE_ID = "security_check_schedule"
+
+
+def hashed_slot(user_email: str) -> int:
+    """Stable slot for a user: the same email always lands in the same slot."""
+    return zlib.crc32(user_email.lower().encode()) % SECURITY_CHECK_SLOTS
+
+
+def slot_for_minute(minute: int) -> int:
+    """Slot covering a user-chosen minute past the start of the interval."""
+    seconds = (minute * 60) % SECURITY_CHECK_INTERVAL_SECONDS
+    return int(seconds // SLOT_SECONDS)
+
+
+def slot_at(epoch_seconds: float) -> int:
+    return int((epoch_seconds % SECURITY_CHECK_INTERVAL_SECONDS) // SLOT_SECONDS)
+
+
+async def assign_missing_slots(batch_size: int = 1000, limit: Optional[int] = None) -> int:
+    """Backfills a hashed slot for enabled users that don't have one yet, at most `limit` of them."""
+    assigned = 0
+    cursor = user_collection.find(
+        {"isSecurityCheckEnabled": True, "securityCheckSlot": {"$exists": False}},
+        {"email": 1}
+    ).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+    operations = []
+    async for user_doc in cursor:
+        if not user_doc.get("email"):
+            continue
+        operations.append(UpdateOne(
+            {"_id": user_doc["_id"]},
+            {"$set": {"securityCheckSlot": hashed_slot(user_doc["email"])}}
+        ))
+        if len(operations) >= batch_size:
+            await user_collection.bulk_write(operations, ordered=False)
+            assigned += len(operations)
+            operations = []
+    if operations:
+        await user_collection.bulk_write(operations, ordered=False)
+        assigned += len(operations)
+    if assigned:
+        logger.info(f"Assigned security check slots to {assigned} users.")
+    return assigned
+
+
+async def drain_due_security_check_slots(now: Optional[float] = None) -> int:
+    """
+    Runs the security check for every slot that has started since the last
+    drained one. Called every slot; after downtime it catches up on at most
+    one interval's worth of slots. The last drained slot is persisted, so a
+    restart neither repeats nor skips slots.
+    """
+    now = now or time.time()
+    current_start = now - (now % SLOT_SECONDS)
+    state = await job_runs_collection.find_one({"_id": SCHEDULE_STATE_ID}) or {}
+    last_start = state.get("last_slot_start")
+    if last_start is None:
+        last_start = current_start - SLOT_SECONDS
+    last_start = max(last_start, current_start - SECURITY_CHECK_INTERVAL_SECONDS)
+
+    try:
+        await assign_missing_slots(limit=SLOT_BACKFILL_PER_DRAIN)
+    except Exception as e:
+        logger.error(f"Security check slot backfill failed: {e}")
+
+    drained = 0
+    slot_start = last_start + SLOT_SECONDS
+    while slot_start <= current_start:
+        await initiate_hourly_security_check(slot=slot_at(slot_start))
+        await job_runs_collection.update_one(
+            {"_id": SCHEDULE_STATE_ID},
+            {"$set": {"last_slot_start": slot_start}},
+            upsert=True
+        )
+        drained += 1
+        slot_start += SLOT_SECONDS
+    return drained
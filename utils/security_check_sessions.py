@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import security_checks_collection
+from utils.journey_registry import from_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+SECURITY_CHECK_TIMEOUT_SECONDS = int(os.getenv("SECURITY_CHECK_TIMEOUT_SECONDS", "60"))
+# Safety net for sessions created by other workers, which this process has no deadline for.
+SECURITY_CHECK_SWEEP_SECONDS = float(os.getenv("SECURITY_CHECK_SWEEP_SECONDS", "30"))
+
+
+class SecurityCheckStatus:
+    PENDING = "pending"
+    PASSED = "passed"
+    FAILED = "failed"
+    TIMED_OUT = "timed_out"
+    UNDELIVERED = "undelivered"  # push never reached the device; no SOS on expiry
+
+
+class SecurityCheckSessions:
+    """
+    Per-user security-check sessions.
+
+    Mongo (`security_checks`, one document per user) is the source of truth, so
+    sessions survive restarts and are shared between workers. Every state change
+    is a conditional update on `status == pending` and the session's check_id,
+    so when several workers race on the same session exactly one of them
+    resolves it. The process running the timeout loop (the scheduler leader)
+    keeps a min-heap of expiry deadlines so the loop sleeps until the next
+    check is actually due; other processes keep no local state, and the
+    sessions they open are picked up by the leader's sweep.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._deadlines: List[Tuple[float, str, str]] = []  # (expires_at, user_email, check_id)
+        self._wakeup = asyncio.Event()
+        self._timeout_tasks = set()
+        self._tracking = False  # True while this process runs the timeout loop
+
+    def _spawn_timeout(self, on_timeout: Callable[[str], Awaitable], user_email: str):
+        # SOS delivery can take seconds; don't let one user's alert delay the next timeout.
+        task = asyncio.create_task(on_timeout(user_email))
+        self._timeout_tasks.add(task)
+        task.add_done_callback(self._timeout_tasks.discard)
+
+    def _schedule(self, expires_at: float, user_email: str, check_id: str):
+        if not self._tracking:
+            return
+        earliest = self._deadlines[0][0] if self._deadlines else None
+        heapq.heappush(self._deadlines, (expires_at, user_email, check_id))
+        if earliest is None or expires_at < earliest:
+            self._wakeup.set()
+
+    @property
+    def backlog(self) -> int:
+        """Deadlines held by this process (resolved sessions drop out when their deadline pops)."""
+        return len(self._deadlines)
+
+    async def open(self, user_email: str, now: Optional[float] = None) -> Optional[dict]:
+        """
+        Starts a pending check for `user_email`. Returns None if the user already
+        has one pending: the unique user_email index turns the upsert into a
+        duplicate-key error instead of overwriting it.
+        """
+        now = now or time.time()
+        session = {
+            "user_email": user_email,
+            "check_id": uuid.uuid4().hex,
+            "status": SecurityCheckStatus.PENDING,
+            "issued_at": from_epoch(now),
+            "expires_at": from_epoch(now + SECURITY_CHECK_TIMEOUT_SECONDS),
+            "resolved_at": None,
+            "notified": False,
+        }
+        try:
+            await self.collection.update_one(
+                {"user_email": user_email, "status": {"$ne": SecurityCheckStatus.PENDING}},
+                {"$set": session},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return None
+        self._schedule(now + SECURITY_CHECK_TIMEOUT_SECONDS, user_email, session["check_id"])
+        return session
+
+    async def get(self, user_email: str) -> Optional[dict]:
+        return await self.collection.find_one({"user_email": user_email}, {"_id": 0})
+
+    async def get_pending(self, user_email: str, now: Optional[float] = None) -> Optional[dict]:
+        """The user's pending session, if it has not expired yet."""
+        now = now or time.time()
+        return await self.collection.find_one({
+            "user_email": user_email,
+            "status": SecurityCheckStatus.PENDING,
+            "expires_at": {"$gt": from_epoch(now)},
+        }, {"_id": 0})
+
+    async def find_unnotified(self, user_emails: List[str], since: datetime) -> Dict[str, dict]:
+        """Pending sessions issued since `since` whose push never went out, by user email."""
+        cursor = self.collection.find({
+            "user_email": {"$in": user_emails},
+            "status": SecurityCheckStatus.PENDING,
+            "notified": False,
+            "issued_at": {"$gte": since},
+        }, {"_id": 0})
+        return {session["user_email"]: session async for session in cursor}
+
+    async def mark_notified(self, check_ids: List[str]):
+        """Records that the push for these sessions was accepted by the provider."""
+        if check_ids:
+            await self.collection.update_many({"check_id": {"$in": check_ids}}, {"$set": {"notified": True}})
+
+    async def _expire(self, user_email: str, check_id: str) -> bool:
+        """
+        Times out a pending session. Returns True only if the user was actually
+        notified; a session whose push never went out (e.g. the fan-out was
+        interrupted between opening it and sending) is closed as undelivered.
+        """
+        if await self.resolve(user_email, check_id, SecurityCheckStatus.TIMED_OUT, notified_only=True):
+            return True
+        await self.resolve(user_email, check_id, SecurityCheckStatus.UNDELIVERED)
+        return False
+
+    async def resolve(self, user_email: str, check_id: str, status: str, notified_only: bool = False) -> bool:
+        """Moves a pending session to `status`. False if another path already resolved it."""
+        filter_query = {"user_email": user_email, "check_id": check_id, "status": SecurityCheckStatus.PENDING}
+        if notified_only:
+            filter_query["notified"] = True
+        result = await self.collection.find_one_and_update(
+            filter_query,
+            {"$set": {"status": status, "resolved_at": datetime.utcnow()}},
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return result is not None
+
+    async def load(self) -> int:
+        """Rebuilds the deadline heap from every pending session and starts tracking new ones (election)."""
+        self._deadlines = []
+        cursor = self.collection.find(
+            {"status": SecurityCheckStatus.PENDING},
+            {"_id": 0, "user_email": 1, "check_id": 1, "expires_at": 1}
+        ).batch_size(5000)
+        async for doc in cursor:
+            self._deadlines.append((to_epoch(doc["expires_at"]), doc["user_email"], doc["check_id"]))
+        heapq.heapify(self._deadlines)
+        self._tracking = True
+        self._wakeup.set()
+        logger.info(f"Loaded {len(self._deadlines)} pending security checks.")
+        return len(self._deadlines)
+
+    async def expire_due(self, on_timeout: Callable[[str], Awaitable], now: Optional[float] = None) -> int:
+        """
+        Times out every locally scheduled session whose deadline has passed.
+        Sessions answered in the meantime fail the conditional update in _expire.
+        """
+        now = now or time.time()
+        expired = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, user_email, check_id = heapq.heappop(self._deadlines)
+            if await self._expire(user_email, check_id):
+                expired += 1
+                self._spawn_timeout(on_timeout, user_email)
+        return expired
+
+    async def sweep_overdue(self, on_timeout: Callable[[str], Awaitable], now: Optional[float] = None) -> int:
+        """Times out overdue sessions this process has no deadline for (opened by another worker)."""
+        now = now or time.time()
+        cutoff = from_epoch(now - 1)
+        expired = 0
+        cursor = self.collection.find(
+            {"status": SecurityCheckStatus.PENDING, "expires_at": {"$lt": cutoff}},
+            {"_id": 0, "user_email": 1, "check_id": 1}
+        ).batch_size(1000)
+        async for doc in cursor:
+            if await self._expire(doc["user_email"], doc["check_id"]):
+                expired += 1
+                self._spawn_timeout(on_timeout, doc["user_email"])
+        return expired
+
+    async def run_timeout_loop(self, on_timeout: Callable[[str], Awaitable]):
+        """Sleeps until the earliest deadline (or a new, earlier one) and times out due sessions."""
+        next_sweep = time.time() + SECURITY_CHECK_SWEEP_SECONDS
+        try:
+            while True:
+                now = time.time()
+                wake_at = min(self._deadlines[0][0] if self._deadlines else next_sweep, next_sweep)
+                self._wakeup.clear()
+                if wake_at > now:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wake_at - now)
+                        continue  # an earlier deadline was scheduled; recompute
+                    except asyncio.TimeoutError:
+                        pass
+                try:
+                    await self.expire_due(on_timeout)
+                    if time.time() >= next_sweep:
+                        next_sweep = time.time() + SECURITY_CHECK_SWEEP_SECONDS
+                        await self.sweep_overdue(on_timeout)
+                except Exception as e:
+                    logger.error(f"Security check timeout loop error: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            # Demoted: deadlines are the next leader's to track.
+            self._tracking = False
+            self._deadlines = []
+
+
+security_check_sessions = SecurityCheckSessions(security_checks_collection)
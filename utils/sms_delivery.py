@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from database import sms_messages_collection
+from utils.admission import Priority, priority
+from utils.notifier import send_notification, sms_service
+
+logger = logging.getLogger(__name__)
+
+# Delivery reports are applied in bulk every flush interval, or sooner once a batch fills up.
+SMS_CALLBACK_FLUSH_SECONDS = float(os.getenv("SMS_CALLBACK_FLUSH_SECONDS", "0.2"))
+SMS_CALLBACK_BATCH_SIZE = int(os.getenv("SMS_CALLBACK_BATCH_SIZE", "500"))
+# Beyond this many buffered reports the endpoint sheds load instead of growing memory.
+SMS_CALLBACK_BUFFER_LIMIT = int(os.getenv("SMS_CALLBACK_BUFFER_LIMIT", "50000"))
+# Sends per emergency message (first send included) before escalating.
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "3"))
+# Emergency SMS without a final report after this long are treated as undelivered.
+SMS_DELIVERY_TIMEOUT_MINUTES = int(os.getenv("SMS_DELIVERY_TIMEOUT_MINUTES", "10"))
+SMS_ESCALATION_CONTACT = os.getenv("SMS_ESCALATION_CONTACT")
+
+# Provider statuses in lifecycle order; reports can arrive out of order, and a
+# lower-ranked status never overwrites a higher one.
+STATUS_RANK = {
+    "accepted": 0, "scheduled": 0, "queued": 0,
+    "sending": 1,
+    "sent": 2,
+    "delivered": 3, "undelivered": 3, "failed": 3, "canceled": 3,
+    "read": 4,
+}
+FAILED_STATUSES = {"undelivered", "failed"}
+
+
+class SMSFollowUp:
+    RETRIED = "retried"
+    ESCALATED = "escalated"
+
+
+class DeliveryReportBuffer:
+    """
+    In-process buffer between the callback endpoint and Mongo. `add` only
+    appends to a deque, so a callback costs no I/O; `flush` collapses reports
+    per message and applies them with one unordered bulk write, then does one
+    batched lookup for emergency messages that failed and retries or
+    escalates them.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._reports: deque = deque()
+        self._flush_needed = asyncio.Event()
+        self._followups = set()
+        self.received = 0
+        self.applied = 0
+        self.rejected = 0
+
+    def add(self, message_id: str, status: str, error_code: Optional[str] = None,
+            at: Optional[datetime] = None) -> bool:
+        """Queues one report. False when the buffer is full and the caller should ask the provider to retry."""
+        if len(self._reports) >= SMS_CALLBACK_BUFFER_LIMIT:
+            self.rejected += 1
+            return False
+        self._reports.append((message_id, status, error_code, at or datetime.utcnow()))
+        self.received += 1
+        if len(self._reports) >= SMS_CALLBACK_BATCH_SIZE:
+            self._flush_needed.set()
+        return True
+
+    def __len__(self):
+        return len(self._reports)
+
+    async def flush(self) -> int:
+        """Applies up to one batch of buffered reports. Returns how many reports were taken."""
+        taken = min(len(self._reports), SMS_CALLBACK_BATCH_SIZE)
+        if not taken:
+            return 0
+        latest: Dict[str, Tuple[str, Optional[str], datetime]] = {}
+        for _ in range(taken):
+            message_id, status, error_code, at = self._reports.popleft()
+            current = latest.get(message_id)
+            if current is None or STATUS_RANK[status] >= STATUS_RANK[current[0]]:
+                latest[message_id] = (status, error_code, at)
+
+        operations = [
+            UpdateOne(
+                {"_id": message_id, "status_rank": {"$lt": STATUS_RANK[status]}},
+                {"$set": {"status": status, "status_rank": STATUS_RANK[status],
+                          "error_code": error_code, "updated_at": at}}
+            )
+            for message_id, (status, error_code, at) in latest.items()
+        ]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+            self.applied += len(operations)
+        except Exception as e:
+            logger.error(f"Applying {len(operations)} SMS delivery reports failed: {e}")
+            return taken
+
+        failed = [message_id for message_id, (status, _, _) in latest.items() if status in FAILED_STATUSES]
+        if failed:
+            await self.follow_up_failed(failed)
+        return taken
+
+    async def follow_up_failed(self, message_ids: List[str]) -> int:
+        """Retries undelivered emergency SMS, escalating once SMS_MAX_ATTEMPTS is reached."""
+        started = 0
+        cursor = self.collection.find(
+            {"_id": {"$in": message_ids}, "emergency": True, "followup": {"$exists": False}},
+            {"to": 1, "body": 1, "attempt": 1, "provider": 1}
+        )
+        async for message in cursor:
+            action = SMSFollowUp.RETRIED if message.get("attempt", 1) < SMS_MAX_ATTEMPTS else SMSFollowUp.ESCALATED
+            # Claim first: several workers may see the same report (or the sweep may race a callback).
+            claim = await self.collection.update_one(
+                {"_id": message["_id"], "followup": {"$exists": False}},
+                {"$set": {"followup": action, "followup_at": datetime.utcnow()}}
+            )
+            if claim.modified_count != 1:
+                continue
+            with priority(Priority.SOS):  # only emergency SMS are followed up
+                task = asyncio.create_task(self._retry(message) if action == SMSFollowUp.RETRIED else self._escalate(message))
+            self._followups.add(task)
+            task.add_done_callback(self._followups.discard)
+            started += 1
+        return started
+
+    async def _retry(self, message: dict):
+        attempt = message.get("attempt", 1) + 1
+        logger.warning(f"Emergency SMS {message['_id']} to {message['to']} undelivered; retry {attempt}/{SMS_MAX_ATTEMPTS}.")
+        await send_notification(message["to"], message["body"], attempt=attempt, retry_of=message["_id"])
+
+    async def _escalate(self, message: dict):
+        logger.critical(f"Emergency SMS to {message['to']} undelivered after {message.get('attempt', 1)} attempts; escalating.")
+        try:
+            await asyncio.to_thread(sms_service.send_via_gsm, message["to"], message["body"])
+        except Exception as e:
+            logger.error(f"GSM escalation for {message['to']} failed: {e}")
+        if SMS_ESCALATION_CONTACT:
+            await send_notification(
+                SMS_ESCALATION_CONTACT,
+                f"🚨 Emergency SMS to {message['to']} could not be delivered: {message['body']}",
+                attempt=SMS_MAX_ATTEMPTS
+            )
+
+    async def run_flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=SMS_CALLBACK_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            try:
+                while await self.flush() == SMS_CALLBACK_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.error(f"SMS delivery report flush error: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"buffered": len(self._reports), "received": self.received,
+                "applied": self.applied, "rejected": self.rejected}
+
+
+async def sweep_unconfirmed_emergency_sms(now: Optional[datetime] = None) -> int:
+    """Scheduled job: emergency SMS with no final delivery report in time are followed up as undelivered."""
+    now = now or datetime.utcnow()
+    stale = await sms_messages_collection.find(
+        {"emergency": True, "status_rank": {"$lt": STATUS_RANK["delivered"]},
+         "created_at": {"$lt": now - timedelta(minutes=SMS_DELIVERY_TIMEOUT_MINUTES)},
+         "followup": {"$exists": False}},
+        {"_id": 1}
+    ).limit(1000).to_list(length=1000)
+    if not stale:
+        return 0
+    return await delivery_reports.follow_up_failed([doc["_id"] for doc in stale])
+
+
+delivery_reports = DeliveryReportBuffer(sms_messages_collection)
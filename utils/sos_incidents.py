@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import sos_incidents_collection
+
+logger = logging.getLogger(__name__)
+
+# Triggers for the same user closer together than this join the open incident.
+SOS_INCIDENT_WINDOW_SECONDS = int(os.getenv("SOS_INCIDENT_WINDOW_SECONDS", "600"))
+# Minimum gap between location follow-ups to a contact who already got the alert.
+SOS_FOLLOWUP_INTERVAL_SECONDS = int(os.getenv("SOS_FOLLOWUP_INTERVAL_SECONDS", "120"))
+SOS_INCIDENT_MAX_LOCATIONS = int(os.getenv("SOS_INCIDENT_MAX_LOCATIONS", "200"))
+
+
+class SOSIncidentStatus:
+    OPEN = "open"
+    CLOSED = "closed"  # quiet for a whole window; the next trigger opens a new incident
+    RESOLVED = "resolved"  # the user (or a contact) marked the emergency as over
+
+
+def _contact_key(contact: str) -> str:
+    # Emails contain dots, which Mongo reads as path separators in field names.
+    return hashlib.sha1(contact.encode()).hexdigest()[:16]
+
+
+class SOSIncidents:
+    """
+    Coalesces SOS triggers into incidents (`sos_incidents`, one document per
+    incident).
+
+    A trigger either opens an incident for the user or, within
+    SOS_INCIDENT_WINDOW_SECONDS of the previous trigger, appends its location
+    and reason to the open one. A unique partial index on user_id over open
+    incidents means concurrent first triggers still produce one incident.
+    Contacts are claimed per incident with conditional updates on
+    `alerts.<key>`, so each contact gets exactly one alert per incident and
+    follow-ups at most every SOS_FOLLOWUP_INTERVAL_SECONDS, whichever worker
+    handles the trigger. A claim whose send fails is released again.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record_trigger(self, user_id: str, lat: float, lon: float, reason: str,
+                             now: Optional[datetime] = None) -> Tuple[dict, bool]:
+        """Adds a trigger to the user's open incident, opening one if needed. Returns (incident, opened)."""
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(seconds=SOS_INCIDENT_WINDOW_SECONDS)
+        update = {
+            "$set": {"last_trigger_at": now, "last_location": {"latitude": lat, "longitude": lon}},
+            "$push": {"locations": {
+                "$each": [{"latitude": lat, "longitude": lon, "reason": reason, "at": now}],
+                "$slice": -SOS_INCIDENT_MAX_LOCATIONS,
+            }},
+            "$addToSet": {"reasons": reason},
+            "$inc": {"triggers": 1},
+            "$setOnInsert": {"opened_at": now, "alerts": {}},
+        }
+        for _ in range(2):
+            try:
+                incident = await self.collection.find_one_and_update(
+                    {"user_id": user_id, "status": SOSIncidentStatus.OPEN, "last_trigger_at": {"$gte": cutoff}},
+                    update,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                return incident, incident["triggers"] == 1
+            except DuplicateKeyError:
+                # An open incident exists but has gone quiet (close it and open a new one), or
+                # another trigger opened one concurrently (the retry joins it).
+                await self.collection.update_many(
+                    {"user_id": user_id, "status": SOSIncidentStatus.OPEN, "last_trigger_at": {"$lt": cutoff}},
+                    {"$set": {"status": SOSIncidentStatus.CLOSED, "closed_at": now}}
+                )
+        raise RuntimeError(f"Could not record SOS trigger for {user_id}")
+
+    async def claim_alert(self, incident_id, contact: str, now: Optional[datetime] = None) -> bool:
+        """True for exactly one caller per (incident, contact): that caller sends the SOS alert."""
+        now = now or datetime.utcnow()
+        key = f"alerts.{_contact_key(contact)}"
+        result = await self.collection.update_one(
+            {"_id": incident_id, key: {"$exists": False}},
+            {"$set": {key: {"contact": contact, "alerted_at": now, "followup_at": now}}}
+        )
+        return result.modified_count == 1
+
+    async def release_alerts(self, incident_id, contacts: List[str]):
+        """Gives back the alert claims of contacts whose alert was not sent, so the next trigger alerts them."""
+        if contacts:
+            await self.collection.update_one(
+                {"_id": incident_id},
+                {"$unset": {f"alerts.{_contact_key(contact)}": "" for contact in contacts}}
+            )
+
+    async def claim_followup(self, incident_id, contact: str, now: Optional[datetime] = None) -> bool:
+        """True if the contact is due a location follow-up; records it as sent."""
+        now = now or datetime.utcnow()
+        key = f"alerts.{_contact_key(contact)}.followup_at"
+        result = await self.collection.update_one(
+            {"_id": incident_id, key: {"$lt": now - timedelta(seconds=SOS_FOLLOWUP_INTERVAL_SECONDS)}},
+            {"$set": {key: now}}
+        )
+        return result.modified_count == 1
+
+    async def plan_notifications(self, incident: dict, contacts: List[str],
+                                 now: Optional[datetime] = None) -> Tuple[List[str], List[str]]:
+        """Splits `contacts` into (alert, follow_up); contacts due neither are dropped."""
+        alert, follow_up = [], []
+        for contact in dict.fromkeys(contacts):
+            if await self.claim_alert(incident["_id"], contact, now):
+                alert.append(contact)
+            elif await self.claim_followup(incident["_id"], contact, now):
+                follow_up.append(contact)
+        return alert, follow_up
+
+    async def resolve(self, incident_id, now: Optional[datetime] = None) -> Optional[dict]:
+        """Marks an incident resolved. Returns it, or None if it is unknown or already resolved."""
+        now = now or datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"_id": incident_id, "status": {"$in": [SOSIncidentStatus.OPEN, SOSIncidentStatus.CLOSED]}},
+            {"$set": {"status": SOSIncidentStatus.RESOLVED, "resolved_at": now}},
+            projection={"user_id": 1, "opened_at": 1, "resolved_at": 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def get_open(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"user_id": user_id, "status": SOSIncidentStatus.OPEN})
+
+
+sos_incidents = SOSIncidents(sos_incidents_collection)
@@ -0,0 +1,77 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+from database import sos_history_archive_collection, sos_history_collection, sos_user_stats_collection
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_REASON = "Unknown"
+
+
+async def record_sos_alert(user_id: str, reason: Optional[str], at: Optional[datetime] = None):
+    """Counts one SOS alert (one sos_history row) in the user's aggregates."""
+    at = at or datetime.utcnow()
+    reason = (reason or UNKNOWN_REASON).replace(".", "_")
+    await sos_user_stats_collection.update_one(
+        {"_id": user_id},
+        {
+            "$inc": {"total_alerts": 1, f"alerts_by_reason.{reason}": 1},
+            "$max": {"last_alert_at": at},
+            "$min": {"first_alert_at": at},
+        },
+        upsert=True
+    )
+
+
+async def record_sos_response(user_id: str, response_seconds: float):
+    """Adds one resolved incident's trigger-to-resolution time to the user's mean."""
+    await sos_user_stats_collection.update_one(
+        {"_id": user_id},
+        {"$inc": {"responses": 1, "response_seconds_total": response_seconds}},
+        upsert=True
+    )
+
+
+async def get_sos_stats(user_id: str) -> dict:
+    doc = await sos_user_stats_collection.find_one({"_id": user_id}) or {}
+    responses = doc.get("responses", 0)
+    return {
+        "user_id": user_id,
+        "total_alerts": doc.get("total_alerts", 0),
+        "alerts_by_reason": doc.get("alerts_by_reason", {}),
+        "first_alert_at": doc.get("first_alert_at"),
+        "last_alert_at": doc.get("last_alert_at"),
+        "resolved_incidents": responses,
+        "mean_response_seconds": round(doc["response_seconds_total"] / responses, 1) if responses else None,
+    }
+
+
+async def rebuild_sos_stats() -> int:
+    """
+    One-off backfill of the alert counters from both SOS history tiers (e.g.
+    after deploying this, or if the aggregates drift). Response times are not
+    recoverable from history and are left untouched.
+    """
+    pipeline = [
+        {"$group": {
+            "_id": {"user_id": "$user_id", "reason": {"$ifNull": ["$reason", UNKNOWN_REASON]}},
+            "count": {"$sum": 1},
+            "first": {"$min": "$timestamp"},
+            "last": {"$max": "$timestamp"},
+        }},
+    ]
+    per_user = {}
+    for collection in (sos_history_collection, sos_history_archive_collection):
+        async for row in collection.aggregate(pipeline, allowDiskUse=True):
+            user_id, reason = row["_id"]["user_id"], row["_id"]["reason"].replace(".", "_")
+            stats = per_user.setdefault(user_id, {"total_alerts": 0, "alerts_by_reason": {},
+                                                  "first_alert_at": row["first"], "last_alert_at": row["last"]})
+            stats["total_alerts"] += row["count"]
+            stats["alerts_by_reason"][reason] = stats["alerts_by_reason"].get(reason, 0) + row["count"]
+            stats["first_alert_at"] = min(stats["first_alert_at"], row["first"])
+            stats["last_alert_at"] = max(stats["last_alert_at"], row["last"])
+    for user_id, stats in per_user.items():
+        await sos_user_stats_collection.update_one({"_id": user_id}, {"$set": stats}, upsert=True)
+    logger.info(f"Rebuilt SOS stats for {len(per_user)} users.")
+    return len(per_user)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StepStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    OK = "ok"
+    FAILED = "failed"
+
+
+class WarmUp:
+    """
+    Startup phase: independent warm-up steps (index creation, Mongo pool,
+    provider clients, ...) run concurrently, each timed on its own. The app
+    is ready once every step has finished and every `required` step
+    succeeded; optional steps that fail only degrade the report.
+    """
+
+    def __init__(self):
+        self._steps: Dict[str, Callable[[], Awaitable]] = {}
+        self._required = set()
+        self.results: Dict[str, dict] = {}
+        self.started_at: Optional[datetime] = None
+        self.duration_ms: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def step(self, name: str, run: Callable[[], Awaitable], required: bool = False):
+        self._steps[name] = run
+        if required:
+            self._required.add(name)
+        self.results[name] = {"status": StepStatus.PENDING, "required": required}
+
+    async def _run_step(self, name: str):
+        result = self.results[name]
+        result["status"] = StepStatus.RUNNING
+        started = time.perf_counter()
+        try:
+            await self._steps[name]()
+            result["status"] = StepStatus.OK
+        except Exception as e:
+            result["status"] = StepStatus.FAILED
+            result["error"] = str(e)
+            logger.error(f"Startup step {name} failed: {e}")
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    async def run(self) -> bool:
+        self.started_at = datetime.utcnow()
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_step(name) for name in self._steps))
+        self.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.done.set()
+        logger.info(f"Warm-up finished in {self.duration_ms} ms: "
+                    + ", ".join(f"{name}={r['status']}" for name, r in self.results.items()))
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return self.done.is_set() and all(self.results[name]["status"] == StepStatus.OK for name in self._required)
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "finished": self.done.is_set(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "duration_ms": self.duration_ms,
+            "steps": self.results,
+        }
+
+
+warm_up = WarmUp()
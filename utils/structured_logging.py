@@ -0,0 +1,174 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from utils.tracing import current_span
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+# Records waiting for the writer thread; beyond this they are dropped rather than blocking the loop.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# One in N per-fix location updates is logged.
+LOCATION_LOG_SAMPLE_EVERY = int(os.getenv("LOCATION_LOG_SAMPLE_EVERY", "100"))
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+journey_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("journey_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class LogSampler:
+    """
+    `if sampler.hit(): logger.info(...)` logs one call in `every`, so
+    high-frequency events cost a counter increment when they are skipped
+    (not even a LogRecord is built).
+    """
+    __slots__ = ("every", "_count")
+
+    def __init__(self, every: int):
+        self.every = max(1, every)
+        self._count = 0
+
+    def hit(self) -> bool:
+        hit = self._count == 0
+        self._count = (self._count + 1) % self.every
+        return hit
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Captures the correlation ids (context variables are not visible on the
+    writer thread) and enqueues the record unformatted: message formatting
+    happens in the QueueListener's thread, not on the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get()
+        record.journey_id = getattr(record, "journey_id", None) or journey_id_var.get()
+        active = current_span()
+        record.trace_id = active.trace_id if active is not None else None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, correlation ids and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRIBUTES and v is not None}
+        return f"{line} {fields}" if fields else line
+
+
+_queue_handler: Optional[_ContextQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Routes the root logger through a bounded queue to a writer thread. Safe to
+    call more than once; later calls only change the level.
+    """
+    global _queue_handler, _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else
+                        _TextFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler = _ContextQueueHandler(log_queue)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_log_levels() -> Dict[str, object]:
+    loggers = {name: logging.getLevelName(logger.level) for name, logger in logging.root.manager.loggerDict.items()
+               if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET}
+    return {
+        "root": logging.getLevelName(logging.getLogger().level),
+        "loggers": loggers,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+    }
+
+
+def set_log_level(level: str, logger_name: Optional[str] = None):
+    """Changes a logger's level (the root logger by default) in this worker, without a restart."""
+    level = level.upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f"Unknown log level {level}")
+    logging.getLogger(logger_name).setLevel(level)
+
+
+class CorrelationIdMiddleware:
+    """Pure ASGI middleware: one request id per request, taken from X-Request-ID or generated, echoed back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,330 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Tail sampling: traces that failed or took at least TRACE_SLOW_SECONDS are always kept;
+# the rest are kept with probability TRACE_SAMPLE_RATE.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "2.0"))
+# Kept traces are appended as JSON lines to TRACE_FILE and/or POSTed as OTLP/JSON to TRACE_OTLP_ENDPOINT.
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")  # e.g. http://localhost:4318/v1/traces
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "shieldx-api")
+# Traces still open at once; beyond this new traces are not recorded.
+TRACE_MAX_OPEN = int(os.getenv("TRACE_MAX_OPEN", "10000"))
+TRACE_EXPORT_QUEUE_SIZE = 1000
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any],
+                 start_ns: Optional[int] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def fail(self, error: str):
+        self.error = error
+
+    @property
+    def duration_seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+            "start_ns": self.start_ns, "duration_ms": round(self.duration_seconds * 1000, 3),
+            "attributes": self.attributes, "error": self.error,
+        }
+
+
+class _SpanScope:
+    """Context manager returned by `span()`; a no-op when there is no trace to join."""
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Optional[Span]):
+        self.span = span
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        if self.span is not None:
+            self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        if exc_type is not None and self.span.error is None:
+            self.span.fail(f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self._token)
+        tracer.finish(self.span)
+        return False
+
+
+class Tracer:
+    """
+    Collects the spans of each trace in memory until its root span ends,
+    then makes the tail-sampling decision with the whole trace in hand and
+    hands kept traces to a background exporter thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[str, List[Span]] = {}
+        self._roots: Dict[str, Span] = {}
+        self._export_queue: queue.Queue = queue.Queue(TRACE_EXPORT_QUEUE_SIZE)
+        self._exporter: Optional[threading.Thread] = None
+        self.recent = deque(maxlen=50)
+        self.started = 0
+        self.kept = 0
+        self.discarded = 0
+        self.export_dropped = 0
+
+    def start_span(self, name: str, root: bool = False, start_ns: Optional[int] = None,
+                   parent: Optional[Span] = None, **attributes) -> Optional[Span]:
+        """
+        A child of `parent` (default: the current span). Without a parent a new
+        trace is started only when `root` is set; otherwise None is returned
+        and nothing is recorded.
+        """
+        if not TRACING_ENABLED:
+            return None
+        parent = parent or _current_span.get()
+        if parent is None and not root:
+            return None
+        with self._lock:
+            if parent is None:
+                if len(self._open) >= TRACE_MAX_OPEN:
+                    return None
+                span = Span(name, secrets.token_hex(16), None, attributes, start_ns)
+                self._open[span.trace_id] = []
+                self._roots[span.trace_id] = span
+                self.started += 1
+            else:
+                if parent.trace_id not in self._open:
+                    return None  # the trace already finished
+                span = Span(name, parent.trace_id, parent.span_id, attributes, start_ns)
+        return span
+
+    def finish(self, span: Span, end_ns: Optional[int] = None):
+        span.end_ns = end_ns or time.time_ns()
+        with self._lock:
+            spans = self._open.get(span.trace_id)
+            if spans is None:
+                return
+            spans.append(span)
+            if self._roots.get(span.trace_id) is not span:
+                return
+            del self._open[span.trace_id]
+            del self._roots[span.trace_id]
+        self._decide(span, spans)
+
+    def _decide(self, root: Span, spans: List[Span]):
+        failed = any(s.error for s in spans)
+        keep = failed or root.duration_seconds >= TRACE_SLOW_SECONDS or random.random() < TRACE_SAMPLE_RATE
+        if not keep:
+            self.discarded += 1
+            return
+        self.kept += 1
+        self.recent.append({
+            "trace_id": root.trace_id, "name": root.name, "duration_ms": round(root.duration_seconds * 1000, 3),
+            "spans": len(spans), "error": failed,
+        })
+        if TRACE_FILE or TRACE_OTLP_ENDPOINT:
+            self._ensure_exporter()
+            try:
+                self._export_queue.put_nowait(spans)
+            except queue.Full:
+                self.export_dropped += 1
+
+    # --- export (background thread) ---
+
+    def _ensure_exporter(self):
+        if self._exporter is None or not self._exporter.is_alive():
+            self._exporter = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._exporter.start()
+
+    def _export_loop(self):
+        while True:
+            batch = [self._export_queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                export_traces(batch)
+            except Exception as e:
+                logger.error(f"Trace export failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            open_traces = len(self._open)
+        return {
+            "enabled": TRACING_ENABLED, "open": open_traces, "started": self.started, "kept": self.kept,
+            "discarded": self.discarded, "export_dropped": self.export_dropped,
+            "sample_rate": TRACE_SAMPLE_RATE, "slow_seconds": TRACE_SLOW_SECONDS,
+        }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(traces: List[List[Span]]) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for a batch of traces."""
+    spans = []
+    for trace in traces:
+        for span in trace:
+            spans.append({
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                "name": span.name,
+                "kind": 2 if span.parent_id is None else 1,  # SERVER for roots, INTERNAL otherwise
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "shieldx.tracing"}, "spans": spans}],
+    }]}
+
+
+def export_traces(traces: List[List[Span]]):
+    if TRACE_FILE:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            for trace in traces:
+                f.write(json.dumps({"trace_id": trace[0].trace_id, "spans": [s.to_dict() for s in trace]},
+                                   default=str, ensure_ascii=False) + "\n")
+    if TRACE_OTLP_ENDPOINT:
+        import httpx
+        httpx.post(TRACE_OTLP_ENDPOINT, json=to_otlp(traces), timeout=5).raise_for_status()
+
+
+tracer = Tracer()
+
+
+def span(name: str, root: bool = False, **attributes) -> _SpanScope:
+    """`with span("notify.twilio", provider="twilio") as s:` — joins the current trace (or starts one if `root`)."""
+    return _SpanScope(tracer.start_span(name, root=root, **attributes))
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def traced(name: str, root: bool = False):
+    """Decorator: runs the coroutine function inside a span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name, root=root):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: every HTTP request is the root span of a trace, named by its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            return await self.app(scope, receive, send)
+        request_span = span(f"HTTP {scope['method']}", root=True, path=scope["path"])
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with request_span as root:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                if root is not None:
+                    route = getattr(scope.get("route"), "path", None)
+                    if route:
+                        root.name = f"HTTP {scope['method']} {route}"
+                    root.set("http.status_code", status)
+                    if status >= 500:
+                        root.fail(f"HTTP {status}")
+
+
+class MongoTracingListener(monitoring.CommandListener):
+    """
+    One span per Mongo command, parented to the span that issued it. Motor
+    runs pymongo on its executor with the caller's context copied, so the
+    current span is visible here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: Dict[int, Span] = {}
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        child = tracer.start_span(f"mongo.{event.command_name}", parent=parent,
+                                  collection=collection if isinstance(collection, str) else "")
+        if child is not None:
+            with self._lock:
+                self._spans[event.request_id] = child
+
+    def _finish(self, event, error: Optional[str] = None):
+        with self._lock:
+            child = self._spans.pop(event.request_id, None)
+        if child is None:
+            return
+        if error:
+            child.fail(error)
+        tracer.finish(child, child.start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure))
+
+
+mongo_tracing_listener = MongoTracingListener()